@@ -0,0 +1,233 @@
+""" An asyncio interface to cubes. The queries are built and run by the
+``Cube`` as usual, on a pool of threads, so that they do not block the event
+loop. A query which is cancelled or times out is interrupted in the
+database, where the driver supports it (``cancel()`` in psycopg2,
+``interrupt()`` in sqlite3). """
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from babbage.util import pool_size
+from babbage.exc import QueryException
+
+# The job run by the current worker thread.
+_local = threading.local()
+
+# The number of exported rows handed to the event loop at a time.
+EXPORT_BATCH_SIZE = 500
+
+
+class Job(object):
+    """ A call running on a worker thread, which keeps track of the database
+    connection it is using so that its query can be interrupted. """
+
+    def __init__(self):
+        self.cancelled = False
+        self.connection = None
+        self._lock = threading.Lock()
+
+    def attach(self, connection):
+        with self._lock:
+            if self.cancelled:
+                raise QueryException('Query cancelled')
+            self.connection = connection
+
+    def detach(self, connection):
+        with self._lock:
+            if self.connection is connection:
+                self.connection = None
+
+    def cancel(self):
+        # Holding the lock keeps the connection from being returned to the
+        # pool, and used by another query, while it is interrupted.
+        with self._lock:
+            self.cancelled = True
+            if self.connection is None:
+                return
+            for name in ('cancel', 'interrupt'):
+                interrupt = getattr(self.connection, name, None)
+                if interrupt is not None:
+                    try:
+                        interrupt()
+                    except Exception:
+                        pass
+                    return
+
+    def run(self, function, *args, **kwargs):
+        _local.job = self
+        try:
+            if self.cancelled:
+                raise QueryException('Query cancelled')
+            return function(*args, **kwargs)
+        finally:
+            _local.job = None
+            self.connection = None
+
+
+def _attach(conn, cursor, statement, parameters, context, executemany):
+    job = getattr(_local, 'job', None)
+    if job is not None:
+        job.attach(conn.connection.connection)
+
+
+def _detach(dbapi_connection, connection_record):
+    job = getattr(_local, 'job', None)
+    if job is not None:
+        job.detach(dbapi_connection)
+
+
+def track_jobs(engine):
+    """ Keep track of the connections used by jobs on the given engine. """
+    if not event.contains(engine, 'before_cursor_execute', _attach):
+        event.listen(engine, 'before_cursor_execute', _attach)
+        event.listen(engine, 'checkin', _detach)
+
+
+class AsyncCube(object):
+    """ Wrap a ``Cube`` so that its queries can be awaited. Calls run on the
+    given ``executor``, or on a thread pool sized to the connection pool of
+    the engine, which is shut down by ``close()``. A ``timeout`` in seconds
+    applies to each call unless another is given. Queries the cube runs on
+    its own ``executor`` are not interrupted. """
+
+    def __init__(self, cube, executor=None, timeout=None):
+        self.cube = cube
+        self.timeout = timeout
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(pool_size(cube.engine))
+        self.executor = executor
+        track_jobs(cube.engine)
+
+    @property
+    def name(self):
+        return self.cube.name
+
+    @property
+    def model(self):
+        return self.cube.model
+
+    async def _call(self, timeout, function, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        job = Job()
+        future = loop.run_in_executor(self.executor,
+                                      lambda: job.run(function, *args,
+                                                      **kwargs))
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            job.cancel()
+            raise
+
+    async def aggregate(self, aggregates=None, drilldowns=None, cuts=None,
+                        order=None, page=None, page_size=None,
+                        page_max=None, cursor=None, count_strategy=None,
+                        format=None, timeout=None):
+        """ See ``Cube.aggregate``. """
+        return await self._call(timeout, self.cube.aggregate,
+                                aggregates=aggregates, drilldowns=drilldowns,
+                                cuts=cuts, order=order, page=page,
+                                page_size=page_size, page_max=page_max,
+                                cursor=cursor, count_strategy=count_strategy,
+                                format=format)
+
+    async def members(self, ref, cuts=None, order=None, page=None,
+                      page_size=None, cursor=None, count_strategy=None,
+                      timeout=None):
+        """ See ``Cube.members``. """
+        return await self._call(timeout, self.cube.members, ref, cuts=cuts,
+                                order=order, page=page, page_size=page_size,
+                                cursor=cursor, count_strategy=count_strategy)
+
+    async def facts(self, fields=None, cuts=None, order=None, page=None,
+                    page_size=None, page_max=None, cursor=None,
+                    count_strategy=None, format=None, timeout=None):
+        """ See ``Cube.facts``. """
+        return await self._call(timeout, self.cube.facts, fields=fields,
+                                cuts=cuts, order=order, page=page,
+                                page_size=page_size, page_max=page_max,
+                                cursor=cursor, count_strategy=count_strategy,
+                                format=format)
+
+    async def export(self, fields=None, cuts=None, order=None,
+                     timeout=None):
+        """ Iterate over all facts, like ``Cube.export``. The rows are read on
+        a worker thread, a few batches ahead of the consumer. The
+        ``timeout`` applies to the whole export. Reading stops when the
+        iterator is closed, or its event loop is. """
+        loop = asyncio.get_event_loop()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else loop.time() + timeout
+        queue = asyncio.Queue()
+        slots = threading.Semaphore(2)
+        job = Job()
+        end = object()
+
+        def put(item):
+            # Stop once the consumer has gone away.
+            while not slots.acquire(timeout=0.1):
+                if job.cancelled or loop.is_closed():
+                    return False
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                return False
+            return True
+
+        def produce():
+            rows = None
+            try:
+                rows = self.cube.export(fields=fields, cuts=cuts,
+                                        order=order)
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= EXPORT_BATCH_SIZE:
+                        if not put(batch):
+                            return
+                        batch = []
+                if len(batch) and not put(batch):
+                    return
+                put(end)
+            except Exception as exc:
+                if not job.cancelled:
+                    put(exc)
+            finally:
+                if rows is not None:
+                    rows.close()
+
+        producer = loop.run_in_executor(self.executor,
+                                        lambda: job.run(produce))
+        try:
+            while True:
+                remaining = None
+                if deadline is not None:
+                    remaining = max(0, deadline - loop.time())
+                item = await asyncio.wait_for(queue.get(), remaining)
+                slots.release()
+                if item is end:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                for row in item:
+                    yield row
+        finally:
+            job.cancel()
+            producer.cancel()
+
+    def close(self):
+        """ Shut down the thread pool, if it was created by this cube. """
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return '<AsyncCube(%r)>' % self.cube.name
@@ -1,17 +1,53 @@
 # Flask web api
 # TODO: consider making this it's own Python package?
+import io
+import csv
+import hashlib
+import calendar
 from datetime import date
 from decimal import Decimal
 
+import six
 from werkzeug.exceptions import NotFound
 from flask import Blueprint, Response, request, current_app, json, url_for
 
-from babbage.exc import BabbageException
+from babbage import timing
+from babbage.columnar import FORMATS
+from babbage.exc import BabbageException, QueryException
 
 map_is_class = type(map) == type
 
 blueprint = Blueprint('babbage_api', __name__)
 
+# The arguments of the aggregate endpoint, and those of ``Cube.aggregate``
+# they stand for.
+AGGREGATE_ARGS = {
+    'aggregates': 'aggregates',
+    'drilldown': 'drilldowns',
+    'cut': 'cuts',
+    'order': 'order',
+    'page': 'page',
+    'pagesize': 'page_size',
+    'cursor': 'cursor',
+    'count': 'count_strategy',
+    'format': 'format'
+}
+
+# The arguments of a batch query which must be given as integers; all the
+# others are query strings, like in the query string of the aggregate
+# endpoint.
+BATCH_INT_ARGS = ('page', 'pagesize')
+
+# The largest number of queries accepted by the batch endpoint.
+BATCH_MAX_QUERIES = 100
+
+# The number of rows encoded into each chunk of a streamed response.
+STREAM_BATCH_SIZE = 500
+
+# Let clients and proxies store the model and query responses, as long as
+# they revalidate them using their ETag or Last-Modified date.
+CACHE_CONTROL = 'public, no-cache'
+
 
 def configure_api(app, manager):
     """ Configure the current Flask app with an instance of ``CubeManager`` that
@@ -54,46 +90,236 @@ class JSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
-def jsonify(obj, status=200, headers=None):
-    """ Custom JSONificaton to support obj.to_dict protocol. """
-    data = JSONEncoder().encode(obj)
+def _isoformat(value):
+    return value.isoformat()
+
+
+def column_converter(value):
+    """ Pick the function converting the values of a column for JSON from
+    the type of one of them, or ``None`` if they are encoded as they are. """
+    if isinstance(value, date):
+        return _isoformat
+    if isinstance(value, Decimal):
+        return float
+    return None
+
+
+class RowEncoder(object):
+    """ Encode a sequence of rows with the same columns as JSON. The values
+    of each column are converted by a function picked once, from the type
+    of its first value which is not NULL, rather than by dispatching on the
+    type of every value. Values of other types are left to the ``encoder``.
+    """
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.converters = {}
+        self.pending = None
+
+    def _pick_converters(self, row):
+        if self.pending is None:
+            self.pending = set(row.keys())
+        for key in list(self.pending):
+            value = row.get(key)
+            if value is None:
+                continue
+            self.pending.discard(key)
+            converter = column_converter(value)
+            if converter is not None:
+                self.converters[key] = converter
+
+    def encode(self, row):
+        if self.pending is None or len(self.pending):
+            self._pick_converters(row)
+        if len(self.converters):
+            row = dict(row)
+            for key, convert in self.converters.items():
+                value = row.get(key)
+                if value is not None:
+                    row[key] = convert(value)
+        return self.encoder.encode(row)
+
+
+def _jsonp(data):
     if 'callback' in request.args:
         cb = request.args.get('callback')
-        data = '%s && %s(%s)' % (cb, cb, data)
+        return '%s && %s(' % (cb, cb), data, ')'
+    return '', data, ''
+
+
+def jsonify(obj, status=200, headers=None):
+    """ Custom JSONificaton to support obj.to_dict protocol. """
+    with timing.phase('encode'):
+        data = ''.join(_jsonp(JSONEncoder().encode(obj)))
     return Response(data, headers=headers, status=status,
                     mimetype='application/json')
 
 
-def create_csv_response(rows):
+def stream_jsonify(obj, key, status=200, headers=None):
+    """ Like ``jsonify``, but encode the list of rows under ``key`` while the
+    response is sent, a batch at a time, after the rest of the object. This
+    avoids holding the JSON of all rows in memory at once. """
+    encoder = JSONEncoder()
+    envelope = dict((k, v) for (k, v) in obj.items() if k != key)
+    # Encode the envelope now, so that errors are reported as usual.
+    with timing.phase('encode'):
+        head = encoder.encode(envelope)[:-1]
+        if len(envelope):
+            head += encoder.item_separator
+        head += encoder.encode(key) + encoder.key_separator + '['
+    prefix, head, suffix = _jsonp(head)
+    rows = obj[key]
+
     def _generator():
-        convert_to_str = lambda value: str(value) if value is not None else '' # noqa
-        columns = []
+        yield prefix + head
+        row_encoder = RowEncoder(encoder)
+        separator, batch = '', []
+        for row in rows:
+            batch.append(row_encoder.encode(row))
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield separator + encoder.item_separator.join(batch)
+                separator, batch = encoder.item_separator, []
+        if len(batch):
+            yield separator + encoder.item_separator.join(batch)
+        yield ']}' + suffix
+
+    return Response(_generator(), headers=headers, status=status,
+                    mimetype='application/json')
 
-        for index, row in enumerate(rows):
-            if index == 0:
-                columns = sorted(row.keys())
-                yield ','.join(columns) + '\n'
 
-            data = [
-                convert_to_str(row.get(column))
-                for column in columns
-            ]
-            yield ','.join(data) + '\n'
+def row_refs(rows, refs):
+    """ Get the refs of the columns of a page of rows, as the rows are keyed:
+    attributes and fields requested by an alias are labelled with it. """
+    if len(rows):
+        return list(rows[0].keys())
+    return refs
+
+
+def create_csv_response(rows, refs=None, filename='data.csv'):
+    """ Stream the given rows as CSV, with a column for each of the given
+    refs (or for each key of the first row), in their order. The rows are
+    written in batches as they are generated. """
+    def _generator():
+        columns = refs
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush():
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return data
+
+        if columns is not None:
+            writer.writerow(columns)
+        for index, row in enumerate(rows):
+            if columns is None:
+                columns = list(row.keys())
+                writer.writerow(columns)
+            writer.writerow([row.get(column) for column in columns])
+            if (index + 1) % STREAM_BATCH_SIZE == 0:
+                yield flush()
+        yield flush()
 
     return Response(
         _generator(),
         mimetype='text/csv',
         headers={
-            'Content-disposition': 'attachment; filename="data.csv"'
+            'Content-disposition': 'attachment; filename="%s"' % filename
         }
     )
 
 
+def csv_export_mode():
+    """ Check if CSV is requested without a page or cursor, in which case
+    all rows are streamed from the database instead of a page of them. """
+    if request.args.get('format', '').lower() != 'csv':
+        return False
+    for arg in ('page', 'pagesize', 'cursor'):
+        if arg in request.args:
+            return False
+    return True
+
+
+def result_format():
+    """ Get the format requested for the rows of a result, if it is one of
+    those ``Cube`` methods return (see ``babbage.columnar``). """
+    format = request.args.get('format', '').lower()
+    return format if format in FORMATS else None
+
+
+def query_validators(cube):
+    """ Get the ETag and modification time of the response to the current
+    query of the cube. They change with the model of the cube and with the
+    version of its data reported by the manager, see
+    ``CubeManager.data_version``. If the manager does not know it, there are
+    none, unless ``BABBAGE_QUERY_VALIDATORS`` is set for data which does not
+    change while the app runs; the ETag then only depends on the model. """
+    modified = get_manager().data_version(cube.name)
+    if modified is None and \
+            not current_app.config.get('BABBAGE_QUERY_VALIDATORS'):
+        return None, None
+    args = sorted(request.args.items(multi=True))
+    key = json.dumps([cube.model.version, modified, request.path, args])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest(), modified
+
+
+def cacheable(response, etag, modified=None):
+    """ Add the validators and ``CACHE_CONTROL`` to a response, if there are
+    any. """
+    if etag is None:
+        return response
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = int(modified)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def not_modified(etag, modified=None):
+    """ Return an empty 304 response if the client has the current version
+    of the response, as per the given validators, or ``None``. """
+    if etag is None:
+        return None
+    if request.if_none_match:
+        if not request.if_none_match.contains(etag):
+            return None
+    elif modified is None or request.if_modified_since is None:
+        return None
+    else:
+        since = calendar.timegm(request.if_modified_since.utctimetuple())
+        if int(modified) > since:
+            return None
+    return cacheable(Response(status=304), etag, modified)
+
+
 def url(*a, **kw):
     kw['_external'] = True
     return url_for(*a, **kw)
 
 
+@blueprint.before_request
+def start_timing():
+    if current_app.config.get('BABBAGE_SERVER_TIMING'):
+        timing.start()
+
+
+@blueprint.after_request
+def add_server_timing(response):
+    """ Report the time spent in each phase of the request as a
+    ``Server-Timing`` header. The rows of a streamed response are encoded
+    after it is sent, so only the encoding of the rest of it is included. """
+    timings = timing.stop()
+    if timings is not None:
+        response.headers['Server-Timing'] = timings.server_timing()
+    return response
+
+
+@blueprint.teardown_request
+def stop_timing(exc):
+    timing.stop()
+
+
 @blueprint.errorhandler(BabbageException)
 def handle_error(exc):
     return jsonify({
@@ -130,33 +356,112 @@ def cubes():
     })
 
 
+@blueprint.route('/slow-queries/')
+def slow_queries():
+    """ List the latest slow queries, optionally of one ``cube``. As their
+    statements and parameters can reveal data, this is only available if
+    ``BABBAGE_ADMIN_ENDPOINTS`` is set and the manager has a slow query
+    log. """
+    slow_log = getattr(get_manager(), 'slow_log', None)
+    if slow_log is None or \
+            not current_app.config.get('BABBAGE_ADMIN_ENDPOINTS'):
+        raise NotFound('No slow query log')
+    entries = slow_log.entries(request.args.get('cube'))
+    return jsonify({
+        'status': 'ok',
+        'total': len(entries),
+        'data': entries
+    }, headers={'Cache-Control': 'no-store'})
+
+
 @blueprint.route('/cubes/<name>/model/')
 def model(name):
     """ Get the model for the specified cube. """
     cube = get_cube(name)
-    return jsonify({
-        'status': 'ok',
-        'name': name,
-        'model': cube.model
-    })
+    etag = cube.model.etag
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    with timing.phase('encode'):
+        data = '{"status": "ok", "name": %s, "model": %s}' % \
+            (json.dumps(name), cube.model.to_json())
+    response = Response(''.join(_jsonp(data)), mimetype='application/json')
+    return cacheable(response, etag)
 
 
 @blueprint.route('/cubes/<name>/aggregate/')
 def aggregate(name):
     """ Perform an aggregation request. """
     cube = get_cube(name)
+    validators = query_validators(cube)
+    response = not_modified(*validators)
+    if response is not None:
+        return response
+    if csv_export_mode():
+        cells = cube.export_cells(aggregates=request.args.get('aggregates'),
+                                  drilldowns=request.args.get('drilldown'),
+                                  cuts=request.args.get('cut'),
+                                  order=request.args.get('order'))
+        response = create_csv_response(cells, cells.refs)
+        return cacheable(response, *validators)
     result = cube.aggregate(aggregates=request.args.get('aggregates'),
                             drilldowns=request.args.get('drilldown'),
                             cuts=request.args.get('cut'),
                             order=request.args.get('order'),
                             page=request.args.get('page'),
-                            page_size=request.args.get('pagesize'))
+                            page_size=request.args.get('pagesize'),
+                            cursor=request.args.get('cursor'),
+                            count_strategy=request.args.get('count'),
+                            format=result_format())
     result['status'] = 'ok'
 
     if request.args.get('format', '').lower() == 'csv':
-        return create_csv_response(result['cells'])
+        refs = result['attributes'] + result['aggregates']
+        response = create_csv_response(result['cells'],
+                                       row_refs(result['cells'], refs))
+    elif result_format() == 'columnar':
+        response = jsonify(result)
     else:
-        return jsonify(result)
+        response = stream_jsonify(result, 'cells')
+    return cacheable(response, *validators)
+
+
+@blueprint.route('/cubes/<name>/aggregate/batch/', methods=['POST'])
+def aggregate_batch(name):
+    """ Perform several aggregation requests at once. The body is a JSON
+    object with a list of ``queries``, each an object of the arguments of
+    the aggregate endpoint. The results are returned in the same order. """
+    cube = get_cube(name)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or \
+            not isinstance(data.get('queries'), list):
+        raise QueryException('Expected a JSON object with a list of queries')
+    if len(data['queries']) > BATCH_MAX_QUERIES:
+        raise QueryException('Too many queries, the maximum is %d' %
+                             BATCH_MAX_QUERIES)
+    queries = []
+    for query in data['queries']:
+        if not isinstance(query, dict):
+            raise QueryException('Invalid query: %r' % query)
+        for arg, value in query.items():
+            if arg not in AGGREGATE_ARGS:
+                raise QueryException('Invalid query argument: %r' % arg)
+            if value is None:
+                continue
+            if arg in BATCH_INT_ARGS:
+                valid = isinstance(value, six.integer_types) and \
+                    not isinstance(value, bool)
+            else:
+                valid = isinstance(value, six.string_types)
+            if not valid:
+                raise QueryException('Invalid value of %r: %r' %
+                                     (arg, value))
+        queries.append(dict((AGGREGATE_ARGS[k], v) for k, v in query.items()))
+    results = cube.aggregate_many(queries)
+    return jsonify({
+        'status': 'ok',
+        'results': results
+    })
 
 
 @blueprint.route('/cubes/<name>/facts/')
@@ -164,13 +469,54 @@ def facts(name):
     """ List the fact table entries in the current cube. This is the full
     materialized dataset. """
     cube = get_cube(name)
+    validators = query_validators(cube)
+    response = not_modified(*validators)
+    if response is not None:
+        return response
+    if csv_export_mode():
+        rows = cube.export(fields=request.args.get('fields'),
+                           cuts=request.args.get('cut'),
+                           order=request.args.get('order'))
+        response = create_csv_response(rows, rows.refs)
+        return cacheable(response, *validators)
     result = cube.facts(fields=request.args.get('fields'),
                         cuts=request.args.get('cut'),
                         order=request.args.get('order'),
                         page=request.args.get('page'),
-                        page_size=request.args.get('pagesize'))
+                        page_size=request.args.get('pagesize'),
+                        cursor=request.args.get('cursor'),
+                        count_strategy=request.args.get('count'),
+                        format=result_format())
     result['status'] = 'ok'
-    return jsonify(result)
+    if request.args.get('format', '').lower() == 'csv':
+        response = create_csv_response(result['data'],
+                                       row_refs(result['data'],
+                                                result['fields']))
+    elif result_format() == 'columnar':
+        response = jsonify(result)
+    else:
+        response = stream_jsonify(result, 'data')
+    return cacheable(response, *validators)
+
+
+@blueprint.route('/cubes/<name>/export/')
+def export(name):
+    """ Stream all the fact table entries in the current cube, either as
+    newline-delimited JSON or as CSV. """
+    cube = get_cube(name)
+    rows = cube.export(fields=request.args.get('fields'),
+                       cuts=request.args.get('cut'),
+                       order=request.args.get('order'))
+
+    if request.args.get('format', '').lower() == 'csv':
+        return create_csv_response(rows, rows.refs)
+
+    def _generator():
+        encoder = RowEncoder(JSONEncoder())
+        for row in rows:
+            yield encoder.encode(row) + '\n'
+
+    return Response(_generator(), mimetype='application/x-ndjson')
 
 
 @blueprint.route('/cubes/<name>/members/<ref>/')
@@ -178,9 +524,26 @@ def members(name, ref):
     """ List the members of a specific dimension or the distinct values of a
     given attribute. """
     cube = get_cube(name)
+    validators = query_validators(cube)
+    response = not_modified(*validators)
+    if response is not None:
+        return response
+    if csv_export_mode():
+        rows = cube.export_members(ref, cuts=request.args.get('cut'),
+                                   order=request.args.get('order'))
+        response = create_csv_response(rows, rows.refs)
+        return cacheable(response, *validators)
     result = cube.members(ref, cuts=request.args.get('cut'),
                           order=request.args.get('order'),
                           page=request.args.get('page'),
-                          page_size=request.args.get('pagesize'))
+                          page_size=request.args.get('pagesize'),
+                          cursor=request.args.get('cursor'),
+                          count_strategy=request.args.get('count'))
     result['status'] = 'ok'
-    return jsonify(result)
+    if request.args.get('format', '').lower() == 'csv':
+        response = create_csv_response(result['data'],
+                                       row_refs(result['data'],
+                                                result['fields']))
+    else:
+        response = stream_jsonify(result, 'data')
+    return cacheable(response, *validators)
@@ -0,0 +1,196 @@
+""" Caching of query results. A ``Cube`` given a ``ResultCache`` will store
+the results of ``aggregate``, ``facts`` and ``members`` keyed by a normalised
+fingerprint of the query, and return them for equivalent queries. """
+import time
+import inspect
+import threading
+from abc import ABCMeta, abstractmethod
+from functools import wraps
+from collections import OrderedDict
+
+import six
+from six.moves import cPickle as pickle
+
+from babbage.query import Cuts, Drilldowns, Fields, Ordering, Aggregates
+from babbage.util import parse_int
+from babbage.columnar import check_format
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _cuts(cube, cuts):
+    normalised = []
+    for (ref, operator, value) in Cuts(cube).parse(cuts):
+        if isinstance(value, (list, tuple)):
+            value = tuple(sorted(_freeze(value), key=repr))
+        normalised.append((ref, operator, value))
+    return tuple(sorted(normalised, key=repr))
+
+
+# How each query argument is normalised for the fingerprint; the order of
+# cuts and of their values does not change a result, so they are sorted.
+NORMALISERS = {
+    'cuts': _cuts,
+    'drilldowns': lambda c, v: _freeze(Drilldowns(c).parse(v)),
+    'aggregates': lambda c, v: _freeze(Aggregates(c).parse(v)),
+    'fields': lambda c, v: _freeze(Fields(c).parse(v)),
+    'order': lambda c, v: _freeze(Ordering(c).parse(v)),
+    'page': lambda c, v: max(1, parse_int(v, 0)),
+    'page_size': lambda c, v: parse_int(v),
+    'page_max': lambda c, v: parse_int(v),
+    'format': lambda c, v: check_format(v)
+}
+
+
+def fingerprint(cube, name, args):
+    """ Make a cache key for calling the query method ``name`` of the cube
+    with the given arguments. """
+    key = [cube.name, cube.model.version, name]
+    for arg, value in sorted(args.items()):
+        normalise = NORMALISERS.get(arg)
+        if normalise is not None:
+            value = normalise(cube, value)
+        key.append((arg, _freeze(value)))
+    return tuple(key)
+
+
+def cached(raw_cell=False):
+    """ Decorate a query method of ``Cube`` to use the cube's result cache,
+    if it has one. As cuts are normalised, the ``cell`` of a cached result
+    is re-created from the cuts of each call, without binding them to the
+    tables of the cube; ``raw_cell`` means the method returns its cuts
+    argument as is. """
+    def decorator(method):
+        def call_fingerprint(cube, *args, **kwargs):
+            callargs = inspect.getcallargs(method, cube, *args, **kwargs)
+            callargs.pop('self')
+            return fingerprint(cube, method.__name__, callargs), callargs
+
+        @wraps(method)
+        def wrapper(cube, *args, **kwargs):
+            if cube.cache is None:
+                return method(cube, *args, **kwargs)
+            key, callargs = call_fingerprint(cube, *args, **kwargs)
+            result = cube.cache.get(key)
+            if result is None:
+                result = method(cube, *args, **kwargs)
+                cube.cache.set(key, result)
+                return result
+            cuts = callargs.get('cuts')
+            if raw_cell:
+                result['cell'] = cuts
+            else:
+                result['cell'] = Cuts(cube).values(cuts)[0]
+            return result
+
+        # Identify equivalent calls, e.g. to deduplicate them.
+        wrapper.fingerprint = lambda *a, **kw: call_fingerprint(*a, **kw)[0]
+        return wrapper
+    return decorator
+
+
+@six.add_metaclass(ABCMeta)
+class ResultCache(object):
+    """ The interface of a result cache backend. Keys are tuples starting
+    with the cube name; values must be returned as copies. """
+
+    @abstractmethod
+    def get(self, key):  # pragma: no cover
+        """ Return the value stored for ``key``, or ``None``. """
+        pass
+
+    @abstractmethod
+    def set(self, key, value):  # pragma: no cover
+        """ Store a copy of ``value`` for ``key``. """
+        pass
+
+    @abstractmethod
+    def invalidate(self, cube_name):  # pragma: no cover
+        """ Discard all results of the given cube. """
+        pass
+
+    @abstractmethod
+    def clear(self):  # pragma: no cover
+        """ Discard all results. """
+        pass
+
+    def stats(self):  # pragma: no cover
+        """ Return a dict of cache statistics. """
+        return {}
+
+
+class MemoryResultCache(ResultCache):
+    """ An in-process cache which stores pickled results for ``ttl`` seconds
+    (forever if ``None``), discarding the least recently used ones to stay
+    within ``max_bytes``. Results larger than that are not stored. """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        expires, data = self._data.pop(key)
+        self.bytes -= len(data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and \
+                    entry[0] < time.time():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data[key] = self._data.pop(key)
+            data = entry[1]
+        return pickle.loads(data)
+
+    def set(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if len(data) > self.max_bytes:
+                return
+            self._data[key] = (expires, data)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, cube_name):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == cube_name]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._data),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes
+            }
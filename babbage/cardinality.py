@@ -0,0 +1,99 @@
+""" Counting the distinct members of all dimensions of a cube. Dimensions are
+grouped into batches by the table holding their key, and each batch is
+counted in a single statement on that table instead of a query per
+dimension. """
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from sqlalchemy import func, distinct, case, text
+from sqlalchemy.sql.expression import select
+
+
+def cardinality_batches(cube):
+    """ Group the dimensions of a cube by the table of their key attribute.
+    Return a list of lists of ``(dimension, key column)`` tuples. """
+    batches = OrderedDict()
+    for dimension in cube.model.dimensions:
+        table, column = dimension.key_attribute.bind(cube)
+        batch = batches.setdefault(table.name, [])
+        batch.append((dimension, column.element))
+    return list(batches.values())
+
+
+def count_distinct(cube, batch):
+    """ Count the distinct keys of each dimension in the batch on the table
+    which holds them, like a list of members does: a row of a dimension
+    table counts even if no fact refers to it, and NULL counts as a
+    value. """
+    columns = []
+    for dimension, column in batch:
+        count = func.count(distinct(column)) + \
+            case([(func.count() > func.count(column), 1)], else_=0)
+        columns.append(count)
+    q = select(columns=columns).select_from(batch[0][1].table)
+    row = cube.engine.execute(q).fetchone()
+    return dict((d.name, int(c)) for ((d, _), c) in zip(batch, row))
+
+
+PG_STATS = text("""
+    SELECT s.attname, s.n_distinct, s.null_frac, c.reltuples
+    FROM pg_stats s
+    JOIN pg_namespace n ON n.nspname = s.schemaname
+    JOIN pg_class c ON c.relname = s.tablename AND c.relnamespace = n.oid
+    WHERE s.schemaname = COALESCE(:schema, current_schema())
+    AND s.tablename = :table
+""")
+
+
+def estimate_distinct(cube, batch):
+    """ Estimate the distinct keys of each dimension in the batch from the
+    statistics kept by PostgreSQL. These describe the whole table holding
+    the keys, and are only as recent as its last ``ANALYZE``. Returns
+    ``None`` if there are no statistics for some of the columns. """
+    table = batch[0][1].table
+    rows = cube.engine.execute(PG_STATS, schema=table.schema,
+                               table=table.name)
+    stats = dict((r.attname, r) for r in rows)
+    counts = {}
+    for dimension, column in batch:
+        row = stats.get(column.name)
+        if row is None:
+            return None
+        count = row.n_distinct
+        if count < 0:
+            # A negative value is a fraction of the number of rows.
+            count = -count * max(0, row.reltuples)
+        if row.null_frac > 0:
+            count += 1
+        counts[dimension.name] = int(round(count))
+    return counts
+
+
+def compute_cardinalities(cube, approximate=False, threads=None):
+    """ Get the number of distinct members of each dimension of the cube by
+    name. With ``approximate``, database statistics are used where they are
+    available. Batches are counted on ``threads`` threads at the same
+    time, if given and supported by the database. """
+    approximate = approximate and cube.is_postgresql
+
+    def count(batch):
+        if approximate:
+            counts = estimate_distinct(cube, batch)
+            if counts is not None:
+                return counts
+        return count_distinct(cube, batch)
+
+    batches = cardinality_batches(cube)
+    if threads is not None and threads > 1 and len(batches) > 1 and \
+            cube.supports_threads:
+        pool = ThreadPool(min(threads, len(batches)))
+        try:
+            results = pool.map(count, batches)
+        finally:
+            pool.close()
+    else:
+        results = [count(b) for b in batches]
+    cardinalities = {}
+    for result in results:
+        cardinalities.update(result)
+    return cardinalities
@@ -0,0 +1,79 @@
+""" A column-oriented form of the rows of a result: one list of values per
+ref instead of a dict per row. Columns of strings which repeat a few values,
+such as the labels of a dimension, are dictionary-encoded: each distinct
+value is listed once, and the rows refer to it by its index. """
+import six
+
+from babbage.exc import QueryException
+
+# The formats in which query methods return their rows.
+FORMATS = ('rows', 'columnar')
+
+# Dictionary-encode a column of strings if it has at most this many distinct
+# values per row.
+DICTIONARY_RATIO = 0.5
+
+
+def check_format(format):
+    """ Get one of the ``FORMATS``, ``rows`` by default. """
+    if format is None or not len(format):
+        return 'rows'
+    if format not in FORMATS:
+        raise QueryException('Invalid format: %r' % format)
+    return format
+
+
+def encode_column(values):
+    """ Dictionary-encode a list of values if they are strings (or NULL)
+    with few distinct values, as a dict of ``codes`` and ``dictionary``.
+    Otherwise return the values as they are. """
+    index = {}
+    for value in values:
+        if value is not None and not isinstance(value, six.string_types):
+            return values
+        if value not in index:
+            index[value] = len(index)
+            if len(index) > len(values) * DICTIONARY_RATIO:
+                return values
+    if not len(index):
+        return values
+    dictionary = [None] * len(index)
+    for value, code in index.items():
+        dictionary[code] = value
+    return {
+        'codes': [index[value] for value in values],
+        'dictionary': dictionary
+    }
+
+
+def decode_column(column):
+    """ Get the values of a column made by ``encode_column``. """
+    if isinstance(column, dict):
+        dictionary = column['dictionary']
+        return [dictionary[code] for code in column['codes']]
+    return column
+
+
+def to_columns(rows, refs):
+    """ Turn a list of dicts into ``{'length': ..., 'columns': ...}``, with
+    the column of each of the given refs, in their order, and then of any
+    other key of the rows. """
+    refs = list(refs)
+    for row in rows[:1]:
+        refs.extend(k for k in row.keys() if k not in refs)
+    columns = {}
+    for ref in refs:
+        columns[ref] = encode_column([row.get(ref) for row in rows])
+    return {
+        'length': len(rows),
+        'refs': refs,
+        'columns': columns
+    }
+
+
+def to_rows(data):
+    """ Turn the output of ``to_columns`` back into a list of dicts. """
+    columns = [(ref, decode_column(data['columns'][ref]))
+               for ref in data['refs']]
+    return [dict((ref, values[i]) for (ref, values) in columns)
+            for i in range(data['length'])]
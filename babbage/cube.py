@@ -1,14 +1,29 @@
-from sqlalchemy import MetaData
+import copy
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import MetaData, func, cast
 from sqlalchemy.schema import Table
+from sqlalchemy.pool import SingletonThreadPool
 from sqlalchemy.sql.expression import select
+from sqlalchemy.types import Integer, BigInteger
 from six import string_types
 
 from babbage.model import Model
 from babbage.model.dimension import Dimension
-from babbage.query import count_results, generate_results, first_result
+from babbage.model.aggregate import Aggregate
+from babbage.query import generate_results, first_result, ResultStream
+from babbage.query import prepare, prepare_count, run_count
+from babbage.query import COUNT_STRATEGIES
 from babbage.query import Cuts, Drilldowns, Fields, Ordering, Aggregates
-from babbage.query import Pagination
-from babbage.exc import BindingException
+from babbage.query import Pagination, Keyset, Totals, GroupingSets
+from babbage.cache import cached, NORMALISERS
+from babbage.rollup import COUNT_COLUMN, build_rollup
+from babbage.cardinality import compute_cardinalities
+from babbage.columnar import check_format, to_columns
+from babbage.timing import timed
+from babbage.util import LRUCache
+from babbage.exc import BindingException, QueryException
 
 
 class Cube(object):
@@ -16,8 +31,38 @@ class Cube(object):
     This functions as the central hub of functionality for accessing any
     data and queries. """
 
-    def __init__(self, engine, name, model, fact_table=None):
+    # Fetch the cells, cell count and summary of an aggregation in a single
+    # statement, if the database supports window functions.
+    combine_aggregate_queries = True
+
+    # The number of rows to fetch from the database at a time.
+    fetch_batch_size = 1000
+
+    # Answer aggregations from the rollups declared in the model, if possible.
+    use_rollups = True
+
+    # Whether each row of the fact table stands for a group of facts.
+    pre_aggregated = False
+
+    # How to count the cells, facts or members matched by a query, unless
+    # another strategy is given. See ``COUNT_STRATEGIES``.
+    count_strategy = 'exact'
+
+    # The number of compiled statement templates kept, by query shape.
+    template_cache_size = 256
+
+    # The arguments of ``aggregate`` which ``aggregate_many`` accepts.
+    AGGREGATE_ARGS = ('aggregates', 'drilldowns', 'cuts', 'order', 'page',
+                      'page_size', 'page_max', 'cursor', 'count_strategy',
+                      'format')
+
+    def __init__(self, engine, name, model, fact_table=None, cache=None,
+                 reflection=None, executor=None, slow_log=None):
         self.name = name
+        self.cache = cache
+        self.slow_log = slow_log
+        self.reflection = reflection
+        self.executor = executor
         if not isinstance(model, Model):
             model = Model(model)
         self._tables = {}
@@ -26,18 +71,29 @@ class Cube(object):
         self.model = model
         self.engine = engine
         self.meta = MetaData(bind=engine)
+        self._rollup_cubes = {}
+        self._templates = LRUCache(maxsize=self.template_cache_size)
+        self._lock = threading.RLock()
 
     def _load_table(self, name):
         """ Reflect a given table from the database. """
         table = self._tables.get(name, None)
         if table is not None:
             return table
-        if not self.engine.has_table(name):
-            raise BindingException('Table does not exist: %r' % name,
-                                   table=name)
-        table = Table(name, self.meta, autoload=True)
-        self._tables[name] = table
-        return table
+        if self.reflection is not None:
+            table = self.reflection.get_table(self.engine, name)
+            self._tables[name] = table
+            return table
+        # A table is added to the metadata before its columns are reflected.
+        with self._lock:
+            if name in self._tables:
+                return self._tables[name]
+            if not self.engine.has_table(name):
+                raise BindingException('Table does not exist: %r' % name,
+                                       table=name)
+            table = Table(name, self.meta, autoload=True)
+            self._tables[name] = table
+            return table
 
     @property
     def fact_pk(self):
@@ -57,24 +113,180 @@ class Cube(object):
         """ Enable postgresql-specific extensions. """
         return 'postgresql' == self.engine.dialect.name
 
+    @property
+    def supports_window_functions(self):
+        """ Check if the database supports ``OVER ()`` clauses. """
+        dialect = self.engine.dialect
+        if dialect.name == 'postgresql':
+            return True
+        if dialect.name == 'sqlite':
+            return dialect.dbapi.sqlite_version_info >= (3, 25, 0)
+        return False
+
+    @property
+    def supports_threads(self):
+        """ Check if queries can run on several threads at the same time. An
+        in-memory SQLite database is only visible to the thread which
+        created it. """
+        return not isinstance(self.engine.pool, SingletonThreadPool)
+
+    def _run(self, *calls):
+        """ Call the given functions and return their results. If the cube
+        has an ``executor``, they run at the same time: the first one on the
+        current thread, the others on the thread pool. """
+        if self.executor is None or len(calls) < 2 or \
+                not self.supports_threads:
+            return [call() for call in calls]
+        pending = [self.executor.apply_async(call) for call in calls[1:]]
+        try:
+            results = [calls[0]()]
+        finally:
+            for result in pending:
+                result.wait()
+        return results + [result.get() for result in pending]
+
+    def _count_strategy(self, strategy):
+        if strategy is None or not len(strategy):
+            return self.count_strategy
+        if strategy not in COUNT_STRATEGIES:
+            raise QueryException('Invalid count strategy: %r' % strategy)
+        return strategy
+
+    @timed
+    @cached()
     def aggregate(self, aggregates=None, drilldowns=None, cuts=None,
-                  order=None, page=None, page_size=None, page_max=None):
+                  order=None, page=None, page_size=None, page_max=None,
+                  cursor=None, count_strategy=None, format=None):
         """Main aggregation function. This is used to compute a given set of
         aggregates, grouped by a given set of drilldown dimensions (i.e.
-        dividers). The query can also be filtered and sorted. """
+        dividers). The query can also be filtered and sorted.
+        If a ``cursor`` is given (an empty one for the first page), the cells
+        are paginated by their sort key rather than by page number, and the
+        cursor of the next page is returned.
+        The ``count_strategy`` determines how the cells are counted.
+        With ``format='columnar'``, the cells are returned as columns, see
+        ``babbage.columnar``.
+        The aggregation is computed from a rollup table where possible. """
+        count_strategy = self._count_strategy(count_strategy)
+        format = check_format(format)
+        rollup = self.navigate(aggregates, drilldowns, cuts, order)
+        if rollup is not None:
+            return rollup.aggregate(aggregates=aggregates,
+                                    drilldowns=drilldowns, cuts=cuts,
+                                    order=order, page=page,
+                                    page_size=page_size, page_max=page_max,
+                                    cursor=cursor,
+                                    count_strategy=count_strategy,
+                                    format=format)
+
+        cuts_info, params, shape = Cuts(self).values(cuts)
+        key = None
+        if cursor is None:
+            window, offset, limit = Pagination(self).window(page, page_size,
+                                                            page_max)
+            key = ('aggregate', shape,
+                   NORMALISERS['aggregates'](self, aggregates),
+                   NORMALISERS['drilldowns'](self, drilldowns),
+                   NORMALISERS['order'](self, order), count_strategy,
+                   self.combine_aggregate_queries)
+        plan = self._plan(key, lambda: self._plan_aggregate(
+            aggregates, drilldowns, cuts, order, page, page_size, page_max,
+            cursor, count_strategy))
+        attributes = plan['attributes']
+        aggregates_info = plan['aggregates']
+        if cursor is None:
+            params[Pagination.LIMIT] = limit
+            params[Pagination.OFFSET] = offset
+            page = window
+        else:
+            page = plan['page']
+
+        def fetch():
+            return list(generate_results(self, plan['cells'], params=params))
+
+        def count_cells():
+            if not len(attributes):
+                # Without drilldowns, there is a single cell.
+                return None if count_strategy == 'none' else 1
+            return run_count(self, plan['count'], params)
+
+        def summarize():
+            return first_result(self, plan['summary'], params)
+
+        if plan['combined']:
+            cells = fetch()
+            if len(cells):
+                count, summary = Totals(self).extract(cells, aggregates_info)
+            else:
+                count, summary = self._run(count_cells, summarize)
+        else:
+            cells, count, summary = self._run(fetch, count_cells,
+                                              summarize)
 
-        def prep(cuts, drilldowns=False, aggregates=False, columns=None):
-            q = select(columns)
+        if cursor is not None:
+            page['next_cursor'] = plan['keyset'].extract(cells,
+                                                         page['page_size'])
+
+        result = {
+            'total_cell_count': count,
+            'cells': cells,
+            'summary': summary,
+            'cell': cuts_info,
+            'aggregates': list(aggregates_info),
+            'attributes': list(attributes),
+            'order': list(plan['order'])
+        }
+        result.update(page)
+        return self._format(result, 'cells', format, plan['labels'])
+
+    def _adds_joins(self, bindings, summary_bindings):
+        """ Check if a query joins tables which its summary does not. Facts
+        without a row in those tables are left out of the cells, but not of
+        the summary, so it cannot be derived from the cells. """
+        tables = set(b.table for b in summary_bindings)
+        tables.add(self.fact_table)
+        return any(b.table not in tables for b in bindings)
+
+    def _format(self, result, key, format, labels):
+        """ Convert the rows of a result under ``key`` to the given format,
+        one of ``babbage.columnar.FORMATS``. The columns are named by the
+        ``labels`` of the query, which key the rows. """
+        if format == 'columnar':
+            result[key] = to_columns(result[key], labels)
+        return result
+
+    def _plan(self, key, build):
+        """ Get the compiled statements of a query with the given shape from
+        the template cache, or build them. Each call supplies the values of
+        its cuts and page window as bound parameters. Without a ``key``,
+        the statements are built for this call only. """
+        if key is None:
+            return build()
+        plan = self._templates.get(key)
+        if plan is None:
+            plan = build()
+            self._templates.set(key, plan)
+        return plan
+
+    def _plan_aggregate(self, aggregates, drilldowns, cuts, order, page,
+                        page_size, page_max, cursor, count_strategy):
+        """ Build the statements of an aggregation, see ``_plan``. """
+        labels = []
+
+        def prep(drilldowns=False, aggregates=False, columns=None):
+            q = select(columns).select_from(self.fact_table)
             bindings = []
-            cuts, q, bindings = Cuts(self).apply(q, bindings, cuts)
+            _, q, bindings = Cuts(self).apply(q, bindings, cuts, params={})
 
             attributes = None
             if drilldowns is not False:
-                attributes, q, bindings = Drilldowns(self).apply(
+                drilldowns_parser = Drilldowns(self)
+                attributes, q, bindings = drilldowns_parser.apply(
                     q,
                     bindings,
                     drilldowns
                 )
+                labels[:] = drilldowns_parser.labels
 
             if aggregates is not False:
                 aggregates, q, bindings = Aggregates(self).apply(
@@ -84,108 +296,462 @@ class Cube(object):
                 )
 
             q = self.restrict_joins(q, bindings)
-            return q, bindings, attributes, aggregates, cuts
-
-        # Count
-        count = count_results(self, prep(cuts,
-                                         drilldowns=drilldowns,
-                                         columns=[1])[0])
-
-        # Summary
-        summary = first_result(self, prep(cuts,
-                                          aggregates=aggregates)[0].limit(1))
+            return q, bindings, attributes, aggregates
 
         # Results
-        q, bindings, attributes, aggregates, cuts = \
-            prep(cuts, drilldowns=drilldowns, aggregates=aggregates)
-        page, q = Pagination(self).apply(q, page, page_size, page_max)
-        ordering, q, bindings = Ordering(self).apply(q, bindings, order)
+        q, bindings, attributes, aggregates_info = \
+            prep(drilldowns=drilldowns, aggregates=aggregates)
+        orderer = Ordering(self)
+        ordering, q, bindings = orderer.apply(q, bindings, order)
+        keyset = None
+        if cursor is None:
+            page, q = Pagination(self).apply(q, page, page_size, page_max,
+                                             params={})
+        else:
+            keyset = Keyset(self)
+            unique = [(self.model[r].bind(self)[1].element, 'asc')
+                      for r in attributes]
+            page, q = keyset.apply(q, orderer.keys, unique, cursor,
+                                   page_size, page_max, having=True)
         q = self.restrict_joins(q, bindings)
 
-        cells = list(generate_results(self, q))
+        summary, summary_bindings = prep(aggregates=aggregates)[:2]
+
+        # The window functions would only see the cells after the cursor,
+        # and not the facts left out by the joins of the drilldowns.
+        totals = Totals(self)
+        combined = self.combine_aggregate_queries and \
+            self.supports_window_functions and \
+            totals.supports(aggregates_info) and cursor is None and \
+            not self._adds_joins(bindings, summary_bindings)
+        if combined:
+            q = totals.apply(q, aggregates_info,
+                             count=count_strategy != 'none')
 
+        count = None
+        if len(attributes):
+            count = prepare_count(self,
+                                  prep(drilldowns=drilldowns, columns=[1])[0],
+                                  count_strategy)
+        summary = summary.limit(1)
         return {
-            'total_cell_count': count,
-            'cells': cells,
-            'summary': summary,
-            'cell': cuts,
-            'aggregates': aggregates,
+            'cells': prepare(self, q),
+            'count': count,
+            'summary': prepare(self, summary),
+            'combined': combined,
+            'keyset': keyset,
+            'page': page,
             'attributes': attributes,
-            'order': ordering,
-            'page': page['page'],
-            'page_size': page['page_size']
+            'aggregates': aggregates_info,
+            'labels': labels + list(aggregates_info),
+            'order': ordering
         }
 
-    def members(self, ref, cuts=None, order=None, page=None, page_size=None):
+    def aggregate_many(self, queries):
+        """ Run several aggregations, each given as a dict of arguments to
+        ``aggregate``, and return their results in the same order. Identical
+        queries are run once and share their result. All queries run on one
+        connection. Where the database supports it, those which only differ
+        in their drilldowns are computed by a single ``GROUPING SETS``
+        statement. """
+        keys, unique = [], OrderedDict()
+        for query in queries:
+            for arg in query:
+                if arg not in self.AGGREGATE_ARGS:
+                    raise QueryException('Invalid query argument: %r' % arg)
+            key = Cube.aggregate.fingerprint(self, **query)
+            keys.append(key)
+            unique.setdefault(key, query)
+        with self.engine.connect() as connection:
+            results = self._bind(connection)._aggregate_unique(unique)
+        return [results[key] for key in keys]
+
+    def _bind(self, connection):
+        """ Get a copy of the cube which runs all queries on the given
+        connection, and shares the reflected tables of this one. """
+        cube = copy.copy(self)
+        cube.engine = ConnectionEngine(connection)
+        cube.executor = None
+        cube._rollup_cubes = {}
+        return cube
+
+    def _aggregate_unique(self, queries):
+        """ Run the given aggregations by their fingerprint, combining those
+        which can be computed from the same grouping sets. """
+        results = {}
+        groups = OrderedDict()
+        for key, query in queries.items():
+            attributes = [a.ref for d in Drilldowns(self).parse(
+                query.get('drilldowns')) for a in self.model.match(d)]
+            group = None
+            if self.is_postgresql and (self.cache is None or
+                                       self.cache.get(key) is None):
+                group = self._grouping_key(query, attributes)
+            if group is None:
+                results[key] = self.aggregate(**query)
+                continue
+            groups.setdefault(group, []).append((key, query, attributes))
+
+        for group in groups.values():
+            # Each set of attributes can be grouped by only once.
+            sets, batch = set(), []
+            for key, query, attributes in group:
+                if frozenset(attributes) in sets:
+                    results[key] = self.aggregate(**query)
+                    continue
+                sets.add(frozenset(attributes))
+                batch.append((key, query, attributes))
+            grouping = GroupingSets(self)
+            if len(batch) < 2 or \
+                    not grouping.supports([a for _, _, a in batch]):
+                for key, query, _ in batch:
+                    results[key] = self.aggregate(**query)
+                continue
+            results.update(self._aggregate_grouped(grouping, batch))
+        return results
+
+    def _grouping_key(self, query, attributes):
+        """ Get what aggregations must have in common to be computed from
+        the same grouping sets, or ``None`` if this one cannot be. Only those
+        with drilldowns, the default order and without a cursor qualify.
+        As the tables of all sets are joined, they must be the same. """
+        if query.get('cursor') is not None or query.get('order'):
+            return None
+        if not len(attributes):
+            return None
+        if self.navigate(query.get('aggregates'), query.get('drilldowns'),
+                         query.get('cuts')) is not None:
+            return None
+        cuts = NORMALISERS['cuts'](self, query.get('cuts'))
+        refs = list(attributes) + [cut[0] for cut in cuts]
+        tables = frozenset(self.model[r].bind(self)[0].name for r in refs)
+        return (cuts, tables,
+                NORMALISERS['aggregates'](self, query.get('aggregates')),
+                self._count_strategy(query.get('count_strategy')))
+
+    def _aggregate_grouped(self, grouping, batch):
+        """ Compute aggregations which only differ in their drilldowns with
+        one statement, see ``GroupingSets``. """
+        first = batch[0][1]
+        count_strategy = self._count_strategy(first.get('count_strategy'))
+        q = select().select_from(self.fact_table)
+        bindings = []
+        cuts_info, q, bindings = Cuts(self).apply(q, bindings,
+                                                  first.get('cuts'))
+        aggregates_info, q, bindings = Aggregates(self).apply(
+            q, bindings, first.get('aggregates'))
+        summary_bindings = list(bindings)
+        summary_q = self.restrict_joins(q, summary_bindings)
+        q, bindings = grouping.apply(q, bindings, [a for _, _, a in batch])
+        q = self.restrict_joins(q, bindings)
+
+        pages, windows = [], []
+        for _, query, _ in batch:
+            page, offset, limit = Pagination(self).window(
+                query.get('page'), query.get('page_size'),
+                query.get('page_max'))
+            pages.append(page)
+            windows.append((offset, limit))
+        q = grouping.paginate(q, aggregates_info, windows)
+        cells, counts, summary = grouping.extract(generate_results(self, q),
+                                                  aggregates_info)
+        # Grouping by nothing leaves out the facts without a row in the
+        # tables joined for the drilldowns, see ``_plan_aggregate``.
+        if self._adds_joins(bindings, summary_bindings):
+            summary = first_result(self, summary_q.limit(1))
+
+        results = {}
+        for index, (key, query, attributes) in enumerate(batch):
+            count = counts[index]
+            if count_strategy == 'none':
+                count = None
+            result = {
+                'total_cell_count': count,
+                'cells': cells[index],
+                'summary': dict(summary),
+                'cell': list(cuts_info),
+                'aggregates': list(aggregates_info),
+                'attributes': list(attributes),
+                'order': []
+            }
+            result.update(pages[index])
+            result = self._format(result, 'cells',
+                                  check_format(query.get('format')),
+                                  list(attributes) + list(aggregates_info))
+            if self.cache is not None:
+                self.cache.set(key, result)
+            results[key] = result
+        return results
+
+    @timed
+    @cached()
+    def members(self, ref, cuts=None, order=None, page=None, page_size=None,
+                cursor=None, count_strategy=None):
         """ List all the distinct members of the given reference, filtered and
         paginated. If the reference describes a dimension, all attributes are
-        returned. """
-        def prep(cuts, ref, order, columns=None):
+        returned. See ``aggregate`` for the use of ``cursor`` and
+        ``count_strategy``. """
+        count_strategy = self._count_strategy(count_strategy)
+
+        cuts_info, params, shape = Cuts(self).values(cuts)
+        key = None
+        if cursor is None:
+            window, offset, limit = Pagination(self).window(page, page_size)
+            key = ('members', shape, NORMALISERS['fields'](self, ref),
+                   NORMALISERS['order'](self, order), count_strategy)
+        plan = self._plan(key, lambda: self._plan_members(
+            ref, cuts, order, page, page_size, cursor, count_strategy))
+        if cursor is None:
+            params[Pagination.LIMIT] = limit
+            params[Pagination.OFFSET] = offset
+            page = window
+        else:
+            page = plan['page']
+        count, data = self._run(lambda: run_count(self, plan['count'],
+                                                  params),
+                                lambda: list(generate_results(
+                                    self, plan['data'], params=params)))
+        if cursor is not None:
+            page['next_cursor'] = plan['keyset'].extract(data,
+                                                         page['page_size'])
+        result = {
+            'total_member_count': count,
+            'data': data,
+            'cell': cuts_info,
+            'fields': list(plan['fields']),
+            'order': list(plan['order'])
+        }
+        result.update(page)
+        return result
+
+    def _plan_members(self, ref, cuts, order, page, page_size, cursor,
+                      count_strategy):
+        """ Build the statements of a list of members, see ``_plan``. """
+        def prep(ref, order, columns=None):
             q = select(columns=columns)
             bindings = []
-            cuts, q, bindings = Cuts(self).apply(q, bindings, cuts)
+            _, q, bindings = Cuts(self).apply(q, bindings, cuts, params={})
             fields, q, bindings = \
                 Fields(self).apply(q, bindings, ref, distinct=True)
+            orderer = Ordering(self)
             ordering, q, bindings = \
-                Ordering(self).apply(q, bindings, order, distinct=fields[0])
+                orderer.apply(q, bindings, order, distinct=fields[0])
             q = self.restrict_joins(q, bindings)
-            return q, bindings, cuts, fields, ordering
-
-        # Count
-        count = count_results(self, prep(cuts, ref, order, [1])[0])
+            return q, bindings, fields, ordering, orderer.keys
 
-        # Member list
-        q, bindings, cuts, fields, ordering = prep(cuts, ref, order)
-        page, q = Pagination(self).apply(q, page, page_size)
+        count_q = prep(ref, order, [1])[0]
+        q, bindings, fields, ordering, keys = prep(ref, order)
+        keyset = None
+        if cursor is None:
+            page, q = Pagination(self).apply(q, page, page_size, params={})
+        else:
+            keyset = Keyset(self)
+            key = self.model[fields[0]].bind(self)[1].element
+            page, q = keyset.apply(q, keys, [(key, 'asc')], cursor,
+                                   page_size, having=True)
         q = self.restrict_joins(q, bindings)
         return {
-            'total_member_count': count,
-            'data': list(generate_results(self, q)),
-            'cell': cuts,
+            'data': prepare(self, q),
+            'count': prepare_count(self, count_q, count_strategy),
+            'keyset': keyset,
+            'page': page,
             'fields': fields,
-            'order': ordering,
-            'page': page['page'],
-            'page_size': page['page_size']
+            'order': ordering
         }
 
+    @timed
+    @cached(raw_cell=True)
     def facts(self, fields=None, cuts=None, order=None, page=None,
-              page_size=None, page_max=None):
+              page_size=None, page_max=None, cursor=None,
+              count_strategy=None, format=None):
         """ List all facts in the cube, returning only the specified references
-        if these are specified. """
+        if these are specified. See ``aggregate`` for the use of ``cursor``,
+        ``count_strategy`` and ``format``; with a cursor, facts are sorted by
+        the primary key of the fact table last. """
+        count_strategy = self._count_strategy(count_strategy)
+        format = check_format(format)
 
-        def prep(cuts, columns=None):
+        _, params, shape = Cuts(self).values(cuts)
+        key = None
+        if cursor is None:
+            window, offset, limit = Pagination(self).window(page, page_size,
+                                                            page_max)
+            key = ('facts', shape, NORMALISERS['fields'](self, fields),
+                   NORMALISERS['order'](self, order), count_strategy)
+        plan = self._plan(key, lambda: self._plan_facts(
+            fields, cuts, order, page, page_size, page_max, cursor,
+            count_strategy))
+        if cursor is None:
+            params[Pagination.LIMIT] = limit
+            params[Pagination.OFFSET] = offset
+            page = window
+        else:
+            page = plan['page']
+        count, data = self._run(lambda: run_count(self, plan['count'],
+                                                  params),
+                                lambda: list(generate_results(
+                                    self, plan['data'], params=params)))
+        if cursor is not None:
+            page['next_cursor'] = plan['keyset'].extract(data,
+                                                         page['page_size'])
+        result = {
+            'total_fact_count': count,
+            'data': data,
+            'cell': cuts,
+            'fields': list(plan['fields']),
+            'order': list(plan['order'])
+        }
+        result.update(page)
+        return self._format(result, 'data', format, plan['labels'])
+
+    def _plan_facts(self, fields, cuts, order, page, page_size, page_max,
+                    cursor, count_strategy):
+        """ Build the statements of a list of facts, see ``_plan``. """
+        def prep(columns=None):
             q = select(columns=columns).select_from(self.fact_table)
             bindings = []
-            _, q, bindings = Cuts(self).apply(q, bindings, cuts)
+            _, q, bindings = Cuts(self).apply(q, bindings, cuts, params={})
             q = self.restrict_joins(q, bindings)
             return q, bindings
 
-        # Count
-        count = count_results(self, prep(cuts, [1])[0])
-
-        # Facts
-        q, bindings = prep(cuts)
-        fields, q, bindings = Fields(self).apply(q, bindings, fields)
-        ordering, q, bindings = Ordering(self).apply(q, bindings, order)
-        page, q = Pagination(self).apply(q, page, page_size, page_max)
+        count_q = prep([1])[0]
+        q, bindings = prep()
+        fields_parser = Fields(self)
+        fields, q, bindings = fields_parser.apply(q, bindings, fields)
+        orderer = Ordering(self)
+        ordering, q, bindings = orderer.apply(q, bindings, order)
+        keyset = None
+        if cursor is None:
+            page, q = Pagination(self).apply(q, page, page_size, page_max,
+                                             params={})
+        else:
+            keyset = Keyset(self)
+            page, q = keyset.apply(q, orderer.keys, [(self.fact_pk, 'asc')],
+                                   cursor, page_size, page_max)
         q = self.restrict_joins(q, bindings)
         return {
-            'total_fact_count': count,
-            'data': list(generate_results(self, q)),
-            'cell': cuts,
+            'data': prepare(self, q),
+            'count': prepare_count(self, count_q, count_strategy),
+            'keyset': keyset,
+            'page': page,
             'fields': fields,
-            'order': ordering,
-            'page': page['page'],
-            'page_size': page['page_size']
+            'labels': fields_parser.labels,
+            'order': ordering
         }
 
-    def compute_cardinalities(self):
+    def export(self, fields=None, cuts=None, order=None):
+        """ Generate all facts in the cube, like ``facts`` but without paging
+        or counting them. Rows are read through a server-side cursor where
+        the database supports it, so the memory used stays constant. Unless
+        an ``order`` is given, the facts are not sorted. Returns a
+        ``ResultStream``, whose ``refs`` are the fields in their order, as
+        the rows are keyed: by the alias of a field given by one. """
+        q = select().select_from(self.fact_table)
+        bindings = []
+        _, q, bindings = Cuts(self).apply(q, bindings, cuts)
+        fields_parser = Fields(self)
+        _, q, bindings = fields_parser.apply(q, bindings, fields)
+        if order:
+            _, q, bindings = Ordering(self).apply(q, bindings, order)
+        q = self.restrict_joins(q, bindings)
+        return self._stream(q, fields_parser.labels)
+
+    def export_cells(self, aggregates=None, drilldowns=None, cuts=None,
+                     order=None):
+        """ Generate all cells of an aggregation, like ``aggregate`` but
+        without paging, counting or summarizing them, see ``export``. The
+        ``refs`` of the stream are the attributes, then the aggregates. """
+        rollup = self.navigate(aggregates, drilldowns, cuts, order)
+        if rollup is not None:
+            return rollup.export_cells(aggregates=aggregates,
+                                       drilldowns=drilldowns, cuts=cuts,
+                                       order=order)
+        q = select()
+        bindings = []
+        _, q, bindings = Cuts(self).apply(q, bindings, cuts)
+        drilldowns_parser = Drilldowns(self)
+        _, q, bindings = drilldowns_parser.apply(q, bindings, drilldowns)
+        aggregates, q, bindings = Aggregates(self).apply(q, bindings,
+                                                         aggregates)
+        _, q, bindings = Ordering(self).apply(q, bindings, order)
+        q = self.restrict_joins(q, bindings)
+        return self._stream(q, drilldowns_parser.labels + aggregates)
+
+    def export_members(self, ref, cuts=None, order=None):
+        """ Generate all the distinct members of the given reference, like
+        ``members`` but without paging or counting them, see ``export``. """
+        q = select()
+        bindings = []
+        _, q, bindings = Cuts(self).apply(q, bindings, cuts)
+        fields_parser = Fields(self)
+        fields, q, bindings = fields_parser.apply(q, bindings, ref,
+                                                  distinct=True)
+        _, q, bindings = Ordering(self).apply(q, bindings, order,
+                                              distinct=fields[0])
+        q = self.restrict_joins(q, bindings)
+        return self._stream(q, fields_parser.labels)
+
+    def _stream(self, q, refs):
+        q = q.execution_options(stream_results=True)
+        return ResultStream(list(refs), generate_results(self, q))
+
+    def navigate(self, aggregates=None, drilldowns=None, cuts=None,
+                 order=None):
+        """ Find a cube over the smallest rollup table from which the given
+        aggregation can be computed, or return ``None``. Rollups are sized
+        by their number of dimensions. """
+        if not self.use_rollups or not len(self.model.rollups):
+            return None
+        refs = list(Drilldowns(self).parse(drilldowns))
+        refs.extend(cut[0] for cut in Cuts(self).parse(cuts))
+        aggregates = list(Aggregates(self).parse(aggregates))
+        if not len(aggregates):
+            aggregates = [a.ref for a in self.model.aggregates]
+        for ref, _ in Ordering(self).parse(order):
+            if isinstance(self.model[ref], Aggregate):
+                aggregates.append(ref)
+            else:
+                refs.append(ref)
+        rollups = [r for r in self.model.rollups if r.covers(refs, aggregates)]
+        for rollup in sorted(rollups, key=lambda r: len(r.dimensions)):
+            if rollup.name not in self._rollup_cubes:
+                try:
+                    cube = RollupCube(self, rollup)
+                except BindingException:
+                    cube = None
+                self._rollup_cubes[rollup.name] = cube
+            if self._rollup_cubes[rollup.name] is not None:
+                return self._rollup_cubes[rollup.name]
+
+    def build_rollups(self, names=None):
+        """ Create the tables of the rollups declared in the model (or of
+        those given by name) from the current contents of the fact table. """
+        for rollup in self.model.rollups:
+            if names is not None and rollup.name not in names:
+                continue
+            build_rollup(self, rollup)
+            table = self._tables.pop(rollup.table_name, None)
+            if self.reflection is not None:
+                self.reflection.invalidate(self.engine, rollup.table_name)
+            elif table is not None:
+                self.meta.remove(table)
+            self._rollup_cubes.pop(rollup.name, None)
+        self._templates.clear()
+
+    def compute_cardinalities(self, approximate=False, threads=None):
         """ This will count the number of distinct values for each dimension in
         the dataset and add that count to the model so that it can be used as a
-        hint by UI components. """
+        hint by UI components. The dimensions keyed on the same table are
+        counted in one query; with ``threads``, several of those run at the
+        same time. With ``approximate``, the counts are estimated from the
+        statistics of the database where possible. Returns the counts by
+        dimension name. """
+        cardinalities = compute_cardinalities(self, approximate=approximate,
+                                              threads=threads)
         for dimension in self.model.dimensions:
-            result = self.members(dimension.ref, page_size=0)
-            dimension.spec['cardinality'] = result.get('total_member_count')
+            dimension.spec['cardinality'] = cardinalities.get(dimension.name)
+        self.model.changed()
+        return cardinalities
 
     def restrict_joins(self, q, bindings):
         """
@@ -238,3 +804,47 @@ class Cube(object):
 
     def __repr__(self):
         return '<Cube(%r)' % self.name
+
+
+class ConnectionEngine(object):
+    """ Stand in for the engine of a cube, running all statements on one
+    connection of it. """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, *args, **kwargs):
+        return self.connection.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.connection.engine, name)
+
+
+class RollupCube(Cube):
+    """ A cube over the table of a rollup of another cube, which takes the
+    place of its fact table. Aggregates are computed by adding up the sums
+    and fact counts stored in the rollup. """
+
+    use_rollups = False
+    pre_aggregated = True
+
+    def __init__(self, cube, rollup):
+        table = cube._load_table(rollup.table_name)
+        super(RollupCube, self).__init__(cube.engine, cube.name, cube.model,
+                                         fact_table=table,
+                                         reflection=cube.reflection,
+                                         executor=cube.executor,
+                                         slow_log=cube.slow_log)
+        self.rollup = rollup
+
+    @property
+    def fact_pk(self):
+        """ The number of facts in each row. """
+        return self.fact_table.columns[COUNT_COLUMN]
+
+    def reaggregate(self, column):
+        """ Add up a column of sums or counts, keeping an integer type. """
+        column = func.sum(column)
+        if isinstance(column.type, Integer):
+            column = cast(column, BigInteger)
+        return column
@@ -1,10 +1,21 @@
 import os
+import sys
 import json
+import time
+import threading
 from abc import ABCMeta, abstractmethod
 
 from babbage.cube import Cube
+from babbage.model import Model
+from babbage.reflection import ReflectionCache, model_tables
+from babbage.util import LRUCache
 from babbage.exc import BabbageException
 
+# Rough memory use of a loaded model per character of its JSON spec, and of
+# each reflected column.
+MODEL_BYTES_PER_CHAR = 10
+COLUMN_BYTES = 2250
+
 
 class CubeManager(object):
     """ A cube manager is responsible for locating and loading cube metadata,
@@ -13,8 +24,15 @@ class CubeManager(object):
     application-specific). """
     __metaclass__ = ABCMeta
 
-    def __init__(self, engine):
+    def __init__(self, engine, cache=None, reflection=None, executor=None,
+                 slow_log=None):
         self.engine = engine
+        self.cache = cache
+        self.executor = executor
+        self.slow_log = slow_log
+        if reflection is None:
+            reflection = ReflectionCache()
+        self.reflection = reflection
 
     @abstractmethod
     def list_cubes(self):  # pragma: no cover
@@ -41,15 +59,95 @@ class CubeManager(object):
     def get_cube(self, name):
         """ Given a cube name, construct that cube and return it. Do not
         overwrite this method unless you need to. """
-        return Cube(self.get_engine(), name, self.get_cube_model(name))
+        engine = self.get_engine()
+        model = self.get_cube_model(name)
+        if not isinstance(model, Model):
+            model = Model(model)
+        self.reflection.reflect(engine, model_tables(model))
+        return Cube(engine, name, model, cache=self.cache,
+                    reflection=self.reflection, executor=self.executor,
+                    slow_log=self.slow_log)
+
+    def compute_cardinalities(self, name, approximate=False, threads=None):
+        """ Count the members of each dimension of the named cube, and store
+        the counts with its model. See ``Cube.compute_cardinalities``. """
+        cube = self.get_cube(name)
+        cardinalities = cube.compute_cardinalities(approximate=approximate,
+                                                   threads=threads)
+        self.save_cardinalities(name, cardinalities)
+        return cardinalities
+
+    def save_cardinalities(self, name, cardinalities):  # pragma: no cover
+        """ Store the cardinality of each dimension, given by name, in the
+        model of the named cube. Managers which can modify the models they
+        load implement this. """
+        pass
+
+    def invalidate(self, name):
+        """ Discard the cached query results of the named cube, e.g. after
+        its data has changed. """
+        if self.cache is not None:
+            self.cache.invalidate(name)
+
+    def data_version(self, name):
+        """ Get the time, as a timestamp, at which the data of the named cube
+        last changed, or ``None`` if it is not known. The HTTP API derives
+        the validators of query responses from it. Managers which know when
+        the data was loaded, e.g. from a table in the database, return that,
+        so that all processes agree on it. """
+        return None
+
+    def invalidate_schema(self):
+        """ Forget the reflected tables, e.g. after the database schema has
+        been changed. """
+        self.reflection.invalidate(self.get_engine())
+
+    def _cube_cache(self, maxsize=None, max_bytes=None, ttl=None):
+        """ Make a store for the cubes of a caching manager, holding at most
+        ``maxsize`` cubes of an approximate total of ``max_bytes``, each for
+        at most ``ttl`` seconds. """
+        if maxsize is None:
+            maxsize = sys.maxsize
+        return LRUCache(maxsize=maxsize, max_bytes=max_bytes, ttl=ttl,
+                        sizeof=self.cube_size, on_evict=self._release_cube)
+
+    def cube_size(self, cube):
+        """ Estimate the memory held by a cube: its model, and the reflected
+        tables it refers to. """
+        size = len(json.dumps(cube.model.spec, default=str))
+        size = size * MODEL_BYTES_PER_CHAR
+        tables = self.reflection.cached_tables(cube.engine,
+                                               model_tables(cube.model))
+        for table in tables.values():
+            size += len(table.columns) * COLUMN_BYTES
+        return size
+
+    def _release_cube(self, name, cube):
+        """ Forget the reflected tables of an evicted cube which no other
+        cached cube refers to. """
+        tables = model_tables(cube.model)
+        for other in self._cubes.values():
+            tables.difference_update(model_tables(other.model))
+        for table in tables:
+            self.reflection.invalidate(cube.engine, table)
+
+    def cube_stats(self):
+        """ Statistics of the cubes kept by a caching manager. """
+        stats = self._cubes.stats()
+        stats['resident'] = stats['size']
+        return stats
 
 
 class JSONCubeManager(CubeManager):
     """ A sample implmentation of a cube manager based on a directory filled
     with JSON model descriptions. """
 
-    def __init__(self, engine, directory):
-        super(JSONCubeManager, self).__init__(engine)
+    def __init__(self, engine, directory, cache=None, reflection=None,
+                 executor=None, slow_log=None):
+        super(JSONCubeManager, self).__init__(engine, cache=cache,
+                                              reflection=reflection,
+                                              executor=executor,
+                                              slow_log=slow_log)
         self.directory = directory
 
     def list_cubes(self):
@@ -71,14 +169,32 @@ class JSONCubeManager(CubeManager):
         with open(file_name, 'r') as fh:
             return json.load(fh)
 
+    def save_cardinalities(self, name, cardinalities):
+        """ Write the cardinalities into the JSON file of the model. """
+        model = JSONCubeManager.get_cube_model(self, name)
+        for dim_name, dimension in model.get('dimensions', {}).items():
+            if dim_name in cardinalities:
+                dimension['cardinality'] = cardinalities[dim_name]
+        file_name = os.path.join(self.directory, name + '.json')
+        tmp_name = '%s.%s.tmp' % (file_name, os.getpid())
+        with open(tmp_name, 'w') as fh:
+            json.dump(model, fh, indent=2, sort_keys=True)
+        os.rename(tmp_name, file_name)
+
 
 class CachingJSONCubeManager(JSONCubeManager):
     """A simple extension of a JSONCubeManager keeping initialising each
     cube only once and returning initilised cubes on subsequent calls"""
 
-    def __init__(self, engine, directory):
-        super(CachingJSONCubeManager, self).__init__(engine, directory)
-        self._cubes = {}
+    def __init__(self, engine, directory, cache=None, reflection=None,
+                 executor=None, maxsize=None, max_bytes=None, ttl=None,
+                 slow_log=None):
+        super(CachingJSONCubeManager, self).__init__(engine, directory,
+                                                     cache=cache,
+                                                     reflection=reflection,
+                                                     executor=executor,
+                                                     slow_log=slow_log)
+        self._cubes = self._cube_cache(maxsize, max_bytes, ttl)
         self._cube_names = set(
             super(CachingJSONCubeManager, self).list_cubes()
         )
@@ -90,7 +206,99 @@ class CachingJSONCubeManager(JSONCubeManager):
         return name in self._cube_names
 
     def get_cube(self, name):
-        if name not in self._cubes:
-            self._cubes[name] = super(CachingJSONCubeManager, self) \
-                                    .get_cube(name)
-        return self._cubes[name]
+        cube = self._cubes.get(name)
+        if cube is None:
+            cube = super(CachingJSONCubeManager, self).get_cube(name)
+            self._cubes.set(name, cube)
+        return cube
+
+    def invalidate_schema(self):
+        super(CachingJSONCubeManager, self).invalidate_schema()
+        self._cubes.clear()
+
+
+class ReloadingJSONCubeManager(JSONCubeManager):
+    """ A JSON cube manager which keeps the models and cubes it has loaded,
+    and notices when model files are added, changed or removed. The
+    directory is scanned at most once every ``interval`` seconds, comparing
+    the modification time and size of each file; only the cubes of changed
+    files are reloaded. The cubes kept can be limited like those of the
+    ``CachingJSONCubeManager``. """
+
+    def __init__(self, engine, directory, cache=None, reflection=None,
+                 executor=None, interval=2.0, maxsize=None, max_bytes=None,
+                 ttl=None, slow_log=None):
+        super(ReloadingJSONCubeManager, self).__init__(engine, directory,
+                                                       cache=cache,
+                                                       reflection=reflection,
+                                                       executor=executor,
+                                                       slow_log=slow_log)
+        self.interval = interval
+        self._clock = getattr(time, 'monotonic', time.time)
+        self._lock = threading.RLock()
+        self._last_scan = None
+        self._index = {}
+        self._models = {}
+        self._cubes = self._cube_cache(maxsize, max_bytes, ttl)
+
+    def _scan(self):
+        index = {}
+        for name in super(ReloadingJSONCubeManager, self).list_cubes():
+            path = os.path.join(self.directory, name + '.json')
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            index[name] = (stat.st_mtime, stat.st_size)
+        return index
+
+    def refresh(self, force=False):
+        """ Check the directory for changes, unless it has been checked within
+        the last ``interval`` seconds. """
+        now = self._clock()
+        if not force and self._last_scan is not None and \
+                now - self._last_scan < self.interval:
+            return
+        with self._lock:
+            index = self._scan()
+            for name in set(self._index).union(index):
+                if self._index.get(name) != index.get(name):
+                    self._drop(name)
+            self._index = index
+            self._last_scan = now
+
+    def _drop(self, name):
+        self._models.pop(name, None)
+        if self._cubes.pop(name, None) is not None:
+            self.invalidate(name)
+
+    def list_cubes(self):
+        self.refresh()
+        return sorted(self._index.keys())
+
+    def has_cube(self, name):
+        self.refresh()
+        return name in self._index
+
+    def get_cube_model(self, name):
+        if not self.has_cube(name):
+            raise BabbageException('No such cube: %r' % name)
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = super(ReloadingJSONCubeManager, self) \
+                    .get_cube_model(name)
+            return self._models[name]
+
+    def get_cube(self, name):
+        self.refresh()
+        with self._lock:
+            cube = self._cubes.get(name)
+            if cube is None:
+                cube = super(ReloadingJSONCubeManager, self).get_cube(name)
+                self._cubes.set(name, cube)
+            return cube
+
+    def invalidate_schema(self):
+        super(ReloadingJSONCubeManager, self).invalidate_schema()
+        with self._lock:
+            self._cubes.clear()
@@ -26,7 +26,10 @@ class Aggregate(Concept):
         else:
             table, column = cube.fact_table, cube.fact_pk
         # apply the SQL aggregation function:
-        column = getattr(func, self.function)(column)
+        if cube.pre_aggregated:
+            column = cube.reaggregate(column)
+        else:
+            column = getattr(func, self.function)(column)
         column = column.label(self.ref)
         column.quote = True
         return table, column
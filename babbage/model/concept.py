@@ -1,4 +1,5 @@
 from babbage.exc import BindingException
+from babbage.timing import phase
 
 
 class Concept(object):
@@ -62,9 +63,10 @@ class Concept(object):
 
     def bind(self, cube):
         """ Map a model reference to an physical column in the database. """
-        table, column = self._physical_column(cube, self.column_name)
-        column = column.label(self.matched_ref)
-        column.quote = True
+        with phase('bind'):
+            table, column = self._physical_column(cube, self.column_name)
+            column = column.label(self.matched_ref)
+            column.quote = True
         return table, column
 
     def __eq__(self, other):
@@ -13,31 +13,40 @@ class Dimension(Concept):
         self.hierarchy = hierarchy if hierarchy is not None else self.name
         self.join_column_name = spec.get('join_column')
 
+        key_attr_ref = spec.get('key_attribute')
+        label_attr_ref = spec.get('label_attribute')
+        attributes = []
+        self._key_attribute = None
+        self._label_attribute = None
+        for name, attr in spec.get('attributes', {}).items():
+            attribute = Attribute(self, name, attr)
+            if name == key_attr_ref:
+                self._key_attribute = attribute
+                attributes.insert(0, attribute)
+            else:
+                attributes.append(attribute)
+            if name == label_attr_ref:
+                self._label_attribute = attribute
+        self._attributes = tuple(attributes)
+
     @property
     def attributes(self):
-        key_attr_ref = self.spec.get('key_attribute')
-        for name, attr in self.spec.get('attributes', {}).items():
-            if name == key_attr_ref:
-                yield Attribute(self, name, attr)
-                break
-        for name, attr in self.spec.get('attributes', {}).items():
-            if name != key_attr_ref:
-                yield Attribute(self, name, attr)
+        return self._attributes
 
     @property
     def label_attribute(self):
-        for attr in self.attributes:
-            if attr.name == self.spec.get('label_attribute'):
-                return attr
+        if self._label_attribute is not None:
+            return self._label_attribute
         return self.key_attribute
 
     @property
     def key_attribute(self):
-        for attr in self.attributes:
-            if attr.name == self.spec.get('key_attribute'):
-                return attr
-        raise BindingException("key_attribute '%s' not found in dimension '%s'"
-                               % (self.spec.get('key_attribute'), self.name))
+        if self._key_attribute is None:
+            raise BindingException("key_attribute '%s' not found in "
+                                   "dimension '%s'"
+                                   % (self.spec.get('key_attribute'),
+                                      self.name))
+        return self._key_attribute
 
     @property
     def cardinality(self):
@@ -1,7 +1,22 @@
+import copy
+import json
+import hashlib
+
 from babbage.model.dimension import Dimension
 from babbage.model.hierarchy import Hierarchy
 from babbage.model.measure import Measure
 from babbage.model.aggregate import Aggregate
+from babbage.model.rollup import Rollup
+
+
+def allrefs(*args):
+    """ Collect the refs and aliases of all concepts in the given lists. """
+    return [
+        ref
+        for concept_list in args
+        for concept in concept_list
+        for ref in concept.refs
+    ]
 
 
 class Model(object):
@@ -16,6 +31,85 @@ class Model(object):
         the dataset from the SQLAlchemy store.
         """
         self.spec = spec
+        self.compile()
+
+    def compile(self):
+        """ Build the concept graph from the model spec once, and index all
+        concepts by their refs and aliases. This needs to be re-run if the
+        structure of ``spec`` is modified after the model was created. """
+        self._hierarchies = tuple(
+            Hierarchy(name, data)
+            for name, data in self.spec.get('hierarchies', {}).items()
+        )
+        hierarchy_map = {}
+        for h in self._hierarchies:
+            for lvl in h.levels:
+                hierarchy_map[lvl] = h.name
+
+        self._measures = tuple(
+            Measure(self, name, data)
+            for name, data in self.spec.get('measures', {}).items()
+        )
+        self._dimensions = tuple(
+            Dimension(self, name, data, hierarchy_map.get(name))
+            for name, data in self.spec.get('dimensions', {}).items()
+        )
+        self._attributes = tuple(
+            attribute
+            for dimension in self._dimensions
+            for attribute in dimension.attributes
+        )
+
+        # TODO: nicer way than hard-coding this?
+        aggregates = [Aggregate(self, 'Facts', 'count')]
+        for measure in self._measures:
+            for function in measure.aggregates:
+                aggregates.append(Aggregate(self, measure.label, function,
+                                            measure=measure))
+        self._aggregates = tuple(aggregates)
+
+        concepts = list(self._measures) + list(self._aggregates)
+        for dimension in self._dimensions:
+            concepts.append(dimension)
+            concepts.extend(dimension.attributes)
+        self._concepts = tuple(concepts)
+
+        # The first concept to claim a ref wins, as it did for the linear
+        # scan. Lookups by alias return a copy of the concept which is
+        # labelled with that alias.
+        self._index = {}
+        for concept in self._concepts:
+            for ref in concept.refs:
+                if ref is None or ref in self._index:
+                    continue
+                matched = concept
+                if ref != concept.ref:
+                    matched = copy.copy(concept)
+                    matched._matched_ref = ref
+                self._index[ref] = matched
+
+        self.drilldown_refs = frozenset(allrefs(self._dimensions,
+                                                self._attributes))
+        self.field_refs = frozenset(allrefs(self._measures,
+                                            self._dimensions,
+                                            self._attributes))
+        self.aggregate_refs = frozenset(a.ref for a in self._aggregates)
+
+        self._rollups = tuple(
+            Rollup(self, name, data)
+            for name, data in sorted(self.spec.get('rollups', {}).items())
+        )
+        self.changed()
+
+    def changed(self):
+        """ Forget the serialisations of the model, after the spec of one of
+        its concepts was modified in place, and compute its new version. """
+        # A digest of the spec, identifying this version of the model.
+        spec = json.dumps(self.spec, sort_keys=True, default=str)
+        self.version = hashlib.sha1(spec.encode('utf-8')).hexdigest()
+        self._dict = None
+        self._json = None
+        self._etag = None
 
     @property
     def fact_table_name(self):
@@ -23,51 +117,38 @@ class Model(object):
 
     @property
     def dimensions(self):
-        hierarchy_map = {}
-        for h in self.hierarchies:
-            for lvl in h.levels:
-                hierarchy_map[lvl] = h.name
-        for name, data in self.spec.get('dimensions', {}).items():
-            yield Dimension(self, name, data, hierarchy_map.get(name))
+        return self._dimensions
 
     @property
     def measures(self):
-        for name, data in self.spec.get('measures', {}).items():
-            yield Measure(self, name, data)
+        return self._measures
 
     @property
     def hierarchies(self):
-        for name, data in self.spec.get('hierarchies', {}).items():
-            yield Hierarchy(name, data)
+        return self._hierarchies
 
     @property
     def attributes(self):
-        for dimension in self.dimensions:
-            for attribute in dimension.attributes:
-                yield attribute
+        return self._attributes
 
     @property
     def aggregates(self):
-        # TODO: nicer way than hard-coding this?
-        yield Aggregate(self, 'Facts', 'count')
+        return self._aggregates
 
-        for measure in self.measures:
-            for function in measure.aggregates:
-                yield Aggregate(self, measure.label, function,
-                                measure=measure)
+    @property
+    def rollups(self):
+        return self._rollups
 
     @property
     def concepts(self):
         """ Return all existing concepts, i.e. dimensions, measures and
         attributes within the model. """
-        for measure in self.measures:
-            yield measure
-        for aggregate in self.aggregates:
-            yield aggregate
-        for dimension in self.dimensions:
-            yield dimension
-            for attribute in dimension.attributes:
-                yield attribute
+        return self._concepts
+
+    @property
+    def refs(self):
+        """ All refs and aliases which can be used to address a concept. """
+        return frozenset(self._index.keys())
 
     def match(self, ref):
         """ Get all concepts matching this ref. For a dimension, that is all
@@ -84,30 +165,53 @@ class Model(object):
     def exists(self):
         """ Check if the model satisfies the basic conditions for being
         queried, i.e. at least one measure. """
-        return len(list(self.measures)) > 0
+        return len(self._measures) > 0
 
     def __getitem__(self, ref):
         """ Access a ref (dimension, attribute or measure) by ref. """
-        for concept in self.concepts:
-            if concept.match_ref(ref):
-                return concept
-        raise KeyError()
+        try:
+            return self._index[ref]
+        except (KeyError, TypeError):
+            raise KeyError(ref)
 
     def __contains__(self, name):
         """ Check if the given ref exists within the model. """
         try:
-            self[name]
-            return True
-        except KeyError:
+            return name in self._index
+        except TypeError:
             return False
 
     def __repr__(self):
         return "<Model(%r)>" % self.fact_table_name
 
     def to_dict(self):
-        data = self.spec.copy()
-        data['measures'] = {m.name: m.to_dict() for m in self.measures}
-        data['dimensions'] = {d.name: d.to_dict() for d in self.dimensions}
-        data['aggregates'] = {a.ref: a.to_dict() for a in self.aggregates}
-        data['hierarchies'] = {h.name: h.to_dict() for h in self.hierarchies}
-        return data
+        """ Describe the model and all its concepts. The result is built once
+        (until the model ``changed()``), and a deep copy of it returned. """
+        if self._dict is None:
+            data = self.spec.copy()
+            data['measures'] = {m.name: m.to_dict() for m in self.measures}
+            data['dimensions'] = {d.name: d.to_dict()
+                                  for d in self.dimensions}
+            data['aggregates'] = {a.ref: a.to_dict()
+                                  for a in self.aggregates}
+            data['hierarchies'] = {h.name: h.to_dict()
+                                   for h in self.hierarchies}
+            if len(self.rollups):
+                data['rollups'] = {r.name: r.to_dict() for r in self.rollups}
+            self._dict = data
+        return copy.deepcopy(self._dict)
+
+    def to_json(self):
+        """ The JSON of ``to_dict()``, encoded once. """
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(), sort_keys=True,
+                                    default=str)
+        return self._json
+
+    @property
+    def etag(self):
+        """ A digest of ``to_json()``, which changes along with it. """
+        if self._etag is None:
+            data = self.to_json().encode('utf-8')
+            self._etag = hashlib.sha1(data).hexdigest()
+        return self._etag
@@ -0,0 +1,57 @@
+from babbage.model.dimension import Dimension
+from babbage.model.measure import Measure
+from babbage.exc import BabbageException
+
+
+class Rollup(object):
+    """ A rollup is a table holding a pre-aggregated copy of the fact table,
+    grouped by a set of dimensions and summing up a set of measures. It can
+    stand in for the fact table in aggregations which only involve these. """
+
+    def __init__(self, model, name, spec):
+        self.model = model
+        self.name = name
+        self.table_name = spec.get('table')
+        self.dimensions = tuple(self._resolve(Dimension, spec, 'dimensions'))
+        self.measures = tuple(self._resolve(Measure, spec, 'measures'))
+
+    def _resolve(self, cls, spec, key):
+        for ref in spec.get(key, []):
+            concept = self.model[ref] if ref in self.model else None
+            if not isinstance(concept, cls):
+                raise BabbageException('Invalid rollup %s %r in %r' %
+                                       (key, ref, self.name))
+            yield concept
+
+    def covers(self, refs, aggregates):
+        """ Check if an aggregation involving the dimensions and attributes
+        named in ``refs`` can be computed from this rollup. Only sums and the
+        count of facts can be added up. """
+        dimensions = set(d.name for d in self.dimensions)
+        for ref in refs:
+            concept = self.model[ref]
+            if not isinstance(concept, Dimension):
+                concept = getattr(concept, 'dimension', None)
+            if concept is None or concept.name not in dimensions:
+                return False
+        measures = set(m.name for m in self.measures)
+        for ref in aggregates:
+            aggregate = self.model[ref]
+            if aggregate.measure is None:
+                if aggregate.function != 'count':
+                    return False
+            elif aggregate.function != 'sum' or \
+                    aggregate.measure.name not in measures:
+                return False
+        return True
+
+    def __repr__(self):
+        return "<Rollup(%s)>" % self.name
+
+    def to_dict(self):
+        return {
+            'ref': self.name,
+            'table': self.table_name,
+            'dimensions': [d.name for d in self.dimensions],
+            'measures': [m.name for m in self.measures]
+        }
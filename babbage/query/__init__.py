@@ -1,5 +1,10 @@
-from sqlalchemy import func
+from timeit import default_timer
+
+from sqlalchemy import func, distinct, case
 from sqlalchemy.sql.expression import select
+from sqlalchemy.sql.compiler import Compiled
+
+from babbage.timing import phase
 
 from babbage.query.cuts import Cuts  # noqa
 from babbage.query.fields import Fields  # noqa
@@ -7,27 +12,166 @@ from babbage.query.drilldowns import Drilldowns  # noqa
 from babbage.query.aggregates import Aggregates  # noqa
 from babbage.query.ordering import Ordering  # noqa
 from babbage.query.pagination import Pagination  # noqa
+from babbage.query.keyset import Keyset  # noqa
+from babbage.query.totals import Totals  # noqa
+from babbage.query.grouping import GroupingSets  # noqa
+
+
+# How to determine the number of results of a query:
+#   exact: count the rows of the query.
+#   planned: count them with the cheapest equivalent query.
+#   estimated: use the estimate of the query planner, where available.
+#   none: do not count them.
+COUNT_STRATEGIES = ('exact', 'planned', 'estimated', 'none')
+
+
+def plan_count(q):
+    """ Rewrite a query into one which counts its rows, avoiding a subquery
+    where possible. """
+    group_by = list(q._group_by_clause)
+    q = q.order_by(None).limit(None).offset(None)
+    if not len(group_by):
+        return q.with_only_columns([func.count()])
+    if len(group_by) == 1:
+        # GROUP BY makes a group of NULLs, which COUNT(DISTINCT) ignores.
+        column = getattr(group_by[0], 'element', group_by[0])
+        count = func.count(distinct(column)) + \
+            case([(func.count() > func.count(column), 1)], else_=0)
+        return q.with_only_columns([count]).group_by(None)
+    return select(columns=[func.count(True)], from_obj=q.alias())
 
 
-def count_results(cube, q):
-    """ Get the count of records matching the query. """
+def estimate_count(cube, q, params=None):
+    """ Get the number of rows the query planner expects the query to
+    return. """
+    compiled = prepare(cube, q)
+    sql = 'EXPLAIN (FORMAT JSON) %s' % compiled
+    values = compiled.params
+    values.update(params or {})
+    with phase('execute'):
+        plan = cube.engine.execute(sql, values).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def prepare(cube, q):
+    """ Compile a statement for the database of the cube, so that it can be
+    run any number of times with different bound parameters. """
+    if isinstance(q, Compiled):
+        return q
+    with phase('compile'):
+        return q.compile(dialect=cube.engine.dialect)
+
+
+def prepare_count(cube, q, strategy='exact'):
+    """ Compile the statement counting the records matching the query with
+    one of the ``COUNT_STRATEGIES``, to be run by ``run_count``. """
+    if strategy == 'none':
+        return strategy, None
+    if strategy == 'estimated' and cube.is_postgresql:
+        return strategy, prepare(cube, q)
+    if strategy in ('planned', 'estimated'):
+        return 'planned', prepare(cube, plan_count(q))
     q = select(columns=[func.count(True)], from_obj=q.alias())
-    return cube.engine.execute(q).scalar()
+    return strategy, prepare(cube, q)
+
+
+def run_count(cube, prepared, params=None):
+    """ Run a count made by ``prepare_count``. """
+    strategy, statement = prepared
+    if statement is None:
+        return None
+    started = default_timer()
+    if strategy == 'estimated':
+        count = estimate_count(cube, statement, params)
+    else:
+        with phase('execute'):
+            count = cube.engine.execute(statement, params or {}).scalar()
+    if cube.slow_log is not None:
+        cube.slow_log.record(cube, statement, params,
+                             default_timer() - started, 1)
+    return count
 
 
-def generate_results(cube, q):
+def count_results(cube, q, strategy='exact', params=None):
+    """ Get the count of records matching the query, using one of the
+    ``COUNT_STRATEGIES``. """
+    return run_count(cube, prepare_count(cube, q, strategy), params)
+
+
+def _limit(q, params):
+    statement = q.statement if isinstance(q, Compiled) else q
+    if statement._limit_clause is None:
+        return None
+    if statement._simple_int_limit:
+        return statement._limit
+    return (params or {}).get(Pagination.LIMIT)
+
+
+def generate_results(cube, q, batch_size=None, tuples=False, params=None):
     """ Generate the resulting records for this query, applying pagination.
-    Values will be returned by their reference. """
-    if q._limit is not None and q._limit < 1:
+    Values will be returned by their reference. Rows are fetched in batches
+    of ``batch_size`` (by default, ``cube.fetch_batch_size``). If ``tuples``
+    is set, plain tuples in the order of the query columns are generated
+    instead of dicts. The query may be compiled by ``prepare``, and is run
+    with the given bound ``params``. """
+    limit = _limit(q, params)
+    if limit is not None and limit < 1:
         return
-    rp = cube.engine.execute(q)
-    while True:
-        row = rp.fetchone()
-        if row is None:
-            return
-        yield dict(row.items())
+    if batch_size is None:
+        batch_size = cube.fetch_batch_size
+    started = default_timer()
+    with phase('execute'):
+        rp = cube.engine.execute(q, params or {})
+    # The time spent by the caller between batches is not counted.
+    duration = default_timer() - started
+    count = 0
+    try:
+        keys = tuple(rp.keys())
+        while True:
+            started = default_timer()
+            with phase('fetch'):
+                rows = rp.fetchmany(batch_size)
+                if tuples:
+                    rows = [tuple(row) for row in rows]
+                else:
+                    rows = [dict(zip(keys, row)) for row in rows]
+            duration += default_timer() - started
+            if not rows:
+                return
+            count += len(rows)
+            for row in rows:
+                yield row
+    finally:
+        # Release the cursor and its connection if the consumer stops early.
+        rp.close()
+        if cube.slow_log is not None:
+            cube.slow_log.record(cube, q, params, duration, count)
+
+
+class ResultStream(object):
+    """ The records generated for a query by ``generate_results``, along with
+    the refs of its columns, which are known before the first record. """
+
+    def __init__(self, refs, rows):
+        self.refs = refs
+        self.rows = rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.rows)
+
+    next = __next__
+
+    def close(self):
+        self.rows.close()
 
 
-def first_result(cube, q):
-    for row in generate_results(cube, q):
-        return row
+def first_result(cube, q, params=None):
+    rows = generate_results(cube, q, params=params)
+    try:
+        for row in rows:
+            return row
+    finally:
+        rows.close()
@@ -8,8 +8,7 @@ class Aggregates(Parser):
     start = "aggregates"
 
     def aggregate(self, ast):
-        refs = [a.ref for a in self.cube.model.aggregates]
-        if ast not in refs:
+        if ast not in self.cube.model.aggregate_refs:
             raise QueryException('Invalid aggregate: %r' % ast)
         self.results.append(ast)
 
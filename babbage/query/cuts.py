@@ -1,6 +1,7 @@
 import datetime
 
 import six
+from sqlalchemy import bindparam
 
 from babbage.api import map_is_class
 from babbage.query.parser import Parser
@@ -12,6 +13,9 @@ class Cuts(Parser):
     """ Handle parser output for cuts. """
     start = "cuts"
 
+    # The name of the bound parameter for a value of a cut.
+    PARAM = 'cut_%d_%d'
+
     def cut(self, ast):
         value = ast[2]
         if isinstance(value, six.string_types) and len(value.strip()) == 0:
@@ -52,17 +56,44 @@ class Cuts(Parser):
         elif type(value) is datetime.datetime:
             return 'date'
 
-    def apply(self, q, bindings, cuts):
-        """ Apply a set of filters, which can be given as a set of tuples in
-        the form (ref, operator, value), or as a string in query form. If it
-        is ``None``, no filter will be applied. """
-        info = []
+    def _values(self, cuts):
         for (ref, operator, value) in self.parse(cuts):
             if map_is_class and isinstance(value, map):
                 value = list(value)
             self._check_type(ref, value)
+            yield ref, operator, value
+
+    def values(self, cuts):
+        """ Check a set of filters like ``apply``, and return their info, the
+        bound parameters holding their values when it is given ``params``,
+        and their shape: what the statement depends on besides the values,
+        which is the ref, operator and number of values of each cut. """
+        info, params, shape = [], {}, []
+        for index, (ref, operator, value) in enumerate(self._values(cuts)):
+            info.append({'ref': ref, 'operator': operator, 'value': value})
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            for i, item in enumerate(value):
+                params[self.PARAM % (index, i)] = item
+            shape.append((ref, operator, len(value)))
+        return info, params, tuple(shape)
+
+    def apply(self, q, bindings, cuts, params=None):
+        """ Apply a set of filters, which can be given as a set of tuples in
+        the form (ref, operator, value), or as a string in query form. If it
+        is ``None``, no filter will be applied. If a dict of ``params`` is
+        given, the values are left to bound parameters, which are added to
+        it (see ``values``). """
+        info = []
+        for index, (ref, operator, value) in enumerate(self._values(cuts)):
             info.append({'ref': ref, 'operator': operator, 'value': value})
             table, column = self.cube.model[ref].bind(self.cube)
             bindings.append(Binding(table, ref))
+            if params is not None:
+                if not isinstance(value, (list, tuple)):
+                    value = [value]
+                names = [self.PARAM % (index, i) for i in range(len(value))]
+                params.update(zip(names, value))
+                value = [bindparam(name) for name in names]
             q = q.where(column.in_(value))
         return info, q, bindings
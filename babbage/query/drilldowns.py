@@ -8,19 +8,20 @@ class Drilldowns(Parser):
     start = "drilldowns"
 
     def dimension(self, ast):
-        refs = Parser.allrefs(self.cube.model.dimensions,
-                              self.cube.model.attributes)
-        if ast not in refs:
+        if ast not in self.cube.model.drilldown_refs:
             raise QueryException('Invalid drilldown: %r' % ast)
         if ast not in self.results:
             self.results.append(ast)
 
     def apply(self, q, bindings, drilldowns):
-        """ Apply a set of grouping criteria and project them. """
+        """ Apply a set of grouping criteria and project them. The
+        ``labels`` of the parser are those of the columns, see ``Fields``. """
         info = []
+        self.labels = []
         for drilldown in self.parse(drilldowns):
             for attribute in self.cube.model.match(drilldown):
                 info.append(attribute.ref)
+                self.labels.append(attribute.matched_ref)
                 table, column = attribute.bind(self.cube)
                 bindings.append(Binding(table, attribute.ref))
                 q = q.column(column)
@@ -10,23 +10,23 @@ class Fields(Parser):
     start = "fields"
 
     def field(self, ast):
-        refs = Parser.allrefs(self.cube.model.measures,
-                              self.cube.model.dimensions,
-                              self.cube.model.attributes)
-
-        if ast not in refs:
+        if ast not in self.cube.model.field_refs:
             raise QueryException('Invalid field: %r' % ast)
         self.results.append(ast)
 
     def apply(self, q, bindings, fields, distinct=False):
-        """ Define a set of fields to return for a non-aggregated query. """
+        """ Define a set of fields to return for a non-aggregated query. The
+        ``labels`` of the parser are those of the columns, which differ from
+        the refs of fields given by an alias. """
         info = []
+        self.labels = []
 
         group_by = None
 
         for field in self.parse(fields):
             for concept in self.cube.model.match(field):
                 info.append(concept.ref)
+                self.labels.append(concept.matched_ref)
                 table, column = concept.bind(self.cube)
                 bindings.append(Binding(table, concept.ref))
                 if distinct:
@@ -44,6 +44,7 @@ class Fields(Parser):
             for concept in list(self.cube.model.attributes) + \
                     list(self.cube.model.measures):
                 info.append(concept.ref)
+                self.labels.append(concept.ref)
                 table, column = concept.bind(self.cube)
                 bindings.append(Binding(table, concept.ref))
                 q = q.column(column)
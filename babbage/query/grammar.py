@@ -0,0 +1,182 @@
+""" A hand-written recursive descent parser for the query language described
+in ``babbage/schema/parser.ebnf``.
+
+This mirrors the behaviour of the grako-generated parser which was used
+before, including its quirks: whitespace and ``(* *)``/``#`` comments are
+skipped before tokens, the separator of a value set (``;``) commits the
+parser to the set, and any unparseable text after the last valid item of a
+list is ignored. """
+import re
+import json
+import datetime
+
+from babbage.exc import QueryException
+
+SKIP_RE = re.compile(r'(?:\s+|#[^\n]*|\(\*[\s\S]*?\*\))*')
+REF_RE = re.compile(r'[A-Za-z0-9\._]*[A-Za-z0-9]')
+DATE_RE = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2})')
+INT_RE = re.compile(r'[0-9]+')
+ESCAPED_RE = re.compile(r'[^"\\]*')
+STRING_RE = re.compile(r'[^|]*')
+
+EXPECT_REF = 'Expecting <ref>'
+EXPECT_DATE = "expecting '[0-9]{4}-[0-9]{2}-[0-9]{2}'"
+EXPECT_INT = "expecting '[0-9]+'"
+FAILED_LOOKAHEAD = 'failed lookahead'
+
+
+def _skip(text, pos):
+    return SKIP_RE.match(text, pos).end()
+
+
+def _token(text, pos, token):
+    """ Match a literal token after skipping whitespace, returning the new
+    position or ``None``. Alphanumeric tokens must not be followed by another
+    alphanumeric character. """
+    pos = _skip(text, pos)
+    if not text.startswith(token, pos):
+        return None
+    end = pos + len(token)
+    if token.isalnum() and end < len(text) and text[end].isalnum():
+        return None
+    return end
+
+
+def _ref(text, pos):
+    match = REF_RE.match(text, _skip(text, pos))
+    if match is None:
+        return None, pos
+    return match.group(), match.end()
+
+
+def _date_value(text, pos):
+    match = DATE_RE.match(text, pos)
+    if match is None:
+        return None, pos, EXPECT_DATE
+    return match.group(), match.end(), None
+
+
+def _int_value(text, pos):
+    match = INT_RE.match(text, pos)
+    if match is None:
+        return None, pos, EXPECT_INT
+    end = match.end()
+    if end < len(text) and text[end] not in '|;':
+        return None, pos, FAILED_LOOKAHEAD
+    return match.group(), end, None
+
+
+def _string_value(text, pos):
+    quoted = _skip(text, pos)
+    if text.startswith('"', quoted):
+        match = ESCAPED_RE.match(text, quoted + 1)
+        if text.startswith('"', match.end()):
+            return match.group(), match.end() + 1, None
+    match = STRING_RE.match(text, pos)
+    return match.group(), match.end(), None
+
+
+def _to_date(value):
+    try:
+        return datetime.date(*[int(p) for p in DATE_RE.match(value).groups()])
+    except ValueError as ve:
+        raise QueryException('Invalid date %r: %s' % (value, ve))
+
+
+def _to_string(value):
+    if not len(value):
+        raise QueryException('Empty value in cut')
+    if value.startswith('"') and value.endswith('"'):
+        try:
+            return json.loads(value)
+        except ValueError as ve:
+            raise QueryException('Invalid string %r: %s' % (value, ve))
+    return value
+
+
+def _value_set(text, pos, element, convert):
+    """ Parse a ``;``-separated set of values. Once a separator has been
+    read, a failure to parse the following value is an error. """
+    value, pos, error = element(text, pos)
+    if error is not None:
+        return None, pos
+    values = [value]
+    while True:
+        next_pos = _token(text, pos, ';')
+        if next_pos is None:
+            return tuple([convert(v) for v in values]), pos
+        value, pos, error = element(text, next_pos)
+        if error is not None:
+            raise QueryException(error)
+        values.append(value)
+
+
+def _value(text, pos):
+    pos = _skip(text, pos)
+    values, end = _value_set(text, pos, _date_value, _to_date)
+    if values is None:
+        values, end = _value_set(text, pos, _int_value, int)
+    if values is None:
+        values, end = _value_set(text, pos, _string_value, _to_string)
+    return values, end
+
+
+def _cut(text, pos):
+    ref, pos = _ref(text, pos)
+    if ref is None:
+        return None, pos, EXPECT_REF
+    end = _token(text, pos, ':')
+    if end is None:
+        return None, pos, "expecting ':'"
+    values, end = _value(text, end)
+    return (ref, ':', values), end, None
+
+
+def _order(text, pos):
+    ref, pos = _ref(text, pos)
+    if ref is None:
+        return None, pos, EXPECT_REF
+    end = _token(text, pos, ':')
+    if end is not None:
+        for direction in ('asc', 'desc'):
+            direction_end = _token(text, end, direction)
+            if direction_end is not None:
+                return (ref, ':', direction), direction_end, None
+    return ref, pos, None
+
+
+def _ref_item(text, pos):
+    ref, pos = _ref(text, pos)
+    if ref is None:
+        return None, pos, EXPECT_REF
+    return ref, pos, None
+
+
+# start rule: (record name, item parser, list separator)
+RULES = {
+    'cuts': ('cut', _cut, '|'),
+    'drilldowns': ('dimension', _ref_item, '|'),
+    'fields': ('field', _ref_item, ','),
+    'aggregates': ('aggregate', _ref_item, '|'),
+    'ordering': ('order', _order, ',')
+}
+
+
+def parse(start, text):
+    """ Parse ``text`` as a list of items of the given start rule, and return
+    a tuple of ``(rule, ast)`` records, one for each item. """
+    name, item, separator = RULES[start]
+    ast, pos, error = item(text, 0)
+    if error is not None:
+        raise QueryException(error)
+    records = [(name, ast)]
+    while True:
+        next_pos = _token(text, pos, separator)
+        if next_pos is None:
+            break
+        ast, next_pos, error = item(text, next_pos)
+        if error is not None:
+            break
+        records.append((name, ast))
+        pos = next_pos
+    return tuple(records)
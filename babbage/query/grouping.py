@@ -0,0 +1,117 @@
+from sqlalchemy import func, case, and_, or_, tuple_
+from sqlalchemy.sql.expression import select
+
+from babbage.query.parser import Parser
+from babbage.model.binding import Binding
+
+
+class GroupingSets(Parser):
+    """ Compute the cells of several aggregations which only differ in their
+    drilldowns with a single ``GROUPING SETS`` statement, along with the
+    cell count of each and their common summary. Each set is paginated and
+    sorted by its attributes and then its aggregates, like an aggregation
+    without an explicit ordering. Not actually using a parser. """
+
+    SET = '__grouping_set'
+    ROW = '__grouping_row'
+    COUNT = '__grouping_count'
+
+    # The number of arguments ``GROUPING()`` takes on PostgreSQL.
+    MAX_COLUMNS = 31
+
+    def __init__(self, cube):
+        super(GroupingSets, self).__init__(cube)
+        self.refs = []
+        self.sets = []
+        self.pages = []
+
+    def supports(self, sets):
+        """ Check if the given sets of attribute refs can be computed in one
+        statement. """
+        refs = set()
+        for attributes in sets:
+            refs.update(attributes)
+        return self.cube.is_postgresql and len(refs) <= self.MAX_COLUMNS
+
+    def _grouping_id(self, attributes):
+        """ The value of ``GROUPING()`` over all attribute columns for the
+        rows of a set: a bit is set for each column it is not grouped by. """
+        gid = 0
+        for ref in self.refs:
+            gid = gid << 1
+            if ref not in attributes:
+                gid = gid | 1
+        return gid
+
+    def apply(self, q, bindings, sets):
+        """ Project the attributes of all sets, and group by each set of
+        attributes as well as by nothing, for the summary. """
+        columns = {}
+        for attributes in sets:
+            for ref in attributes:
+                if ref in columns:
+                    continue
+                table, column = self.cube.model[ref].bind(self.cube)
+                bindings.append(Binding(table, ref))
+                q = q.column(column)
+                columns[ref] = column.element
+                self.refs.append(ref)
+        self.sets = [tuple(attributes) for attributes in sets]
+        grouping = func.grouping(*[columns[r] for r in self.refs])
+        q = q.column(grouping.label(self.SET))
+        groups = [tuple_(*[columns[r] for r in a]) for a in self.sets]
+        groups.append(tuple_())
+        return q.group_by(func.grouping_sets(*groups)), bindings
+
+    def paginate(self, q, aggregates, pages):
+        """ Number the rows of each set and keep those on the given page of
+        each, given as ``(offset, limit)``, and the summary. """
+        inner = q.alias('grouping_sets')
+        numbers = []
+        for attributes in self.sets:
+            order_by = []
+            for ref in list(attributes) + list(aggregates):
+                column = inner.c[ref].asc()
+                if self.cube.is_postgresql:
+                    column = column.nullslast()
+                order_by.append(column)
+            number = func.row_number().over(partition_by=inner.c[self.SET],
+                                            order_by=order_by)
+            numbers.append((inner.c[self.SET] == self._grouping_id(attributes),
+                            number))
+        row = case(numbers, else_=0).label(self.ROW)
+        count = func.count().over(partition_by=inner.c[self.SET])
+        ranked = select([inner, row, count.label(self.COUNT)]).alias('ranked')
+
+        # The first row of each set is kept for its count, even if it is
+        # not on the page.
+        self.pages = pages
+        pages_filter = [ranked.c[self.SET] == self._grouping_id(()),
+                        ranked.c[self.ROW] == 1]
+        for attributes, (offset, limit) in zip(self.sets, pages):
+            pages_filter.append(and_(
+                ranked.c[self.SET] == self._grouping_id(attributes),
+                ranked.c[self.ROW] > offset,
+                ranked.c[self.ROW] <= offset + limit
+            ))
+        q = select([ranked]).where(or_(*pages_filter))
+        return q.order_by(ranked.c[self.SET], ranked.c[self.ROW])
+
+    def extract(self, rows, aggregates):
+        """ Split the rows into the cells and cell count of each set, and
+        return these along with the summary. """
+        ids = dict((self._grouping_id(a), i) for i, a in enumerate(self.sets))
+        cells = [[] for _ in self.sets]
+        counts = [0 for _ in self.sets]
+        summary = dict((ref, None) for ref in aggregates)
+        for row in rows:
+            index = ids.get(row[self.SET])
+            if index is None:
+                summary = dict((ref, row[ref]) for ref in aggregates)
+                continue
+            counts[index] = row[self.COUNT]
+            offset, limit = self.pages[index]
+            if offset < row[self.ROW] <= offset + limit:
+                refs = list(self.sets[index]) + list(aggregates)
+                cells[index].append(dict((ref, row[ref]) for ref in refs))
+        return cells, counts, summary
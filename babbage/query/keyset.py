@@ -0,0 +1,121 @@
+import json
+import base64
+import datetime
+from decimal import Decimal
+
+import six
+from sqlalchemy import and_, or_, false
+
+from babbage.query.pagination import Pagination
+from babbage.exc import QueryException
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if '$datetime' in value:
+            text = value['$datetime']
+            fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in text else '%Y-%m-%dT%H:%M:%S'
+            return datetime.datetime.strptime(text, fmt)
+        if '$date' in value:
+            return datetime.datetime.strptime(value['$date'], '%Y-%m-%d').date()
+        if '$decimal' in value:
+            return Decimal(value['$decimal'])
+        raise ValueError(value)
+    return value
+
+
+class Keyset(Pagination):
+    """ Handle keyset (seek) pagination of results: instead of skipping a
+    number of rows, each page continues after the sort key of the last row of
+    the previous page, which is handed to the client as an opaque cursor.
+    Not actually using a parser. """
+
+    KEY = '__key_%s'
+
+    def __init__(self, cube):
+        super(Keyset, self).__init__(cube)
+        # The sort keys as (column, direction), in the order of the cursor.
+        self.keys = []
+
+    def encode(self, values):
+        data = json.dumps([_encode_value(v) for v in values])
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(six.b(str(cursor)))
+            values = [_decode_value(v) for v in json.loads(data.decode('utf-8'))]
+        except (TypeError, ValueError):
+            raise QueryException('Invalid cursor: %r' % cursor)
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise QueryException('Invalid cursor: %r' % cursor)
+        return values
+
+    def _beyond(self, column, direction, value):
+        """ Rows which sort after ``value`` on a single key. NULLs sort last,
+        unless the database puts them first in ascending order. """
+        nulls_last = self.cube.is_postgresql or direction == 'desc'
+        if value is None:
+            return None if nulls_last else column.isnot(None)
+        beyond = column > value if direction == 'asc' else column < value
+        if nulls_last:
+            beyond = or_(beyond, column.is_(None))
+        return beyond
+
+    def _after(self, values):
+        """ Rows which sort after the given sort key values. """
+        clauses, equal = [], []
+        for (column, direction), value in zip(self.keys, values):
+            beyond = self._beyond(column, direction, value)
+            if beyond is not None:
+                clauses.append(and_(*(equal + [beyond])))
+            equal.append(column.is_(None) if value is None else column == value)
+        if not len(clauses):
+            return false()
+        return or_(*clauses)
+
+    def apply(self, q, keys, unique, cursor, page_size, page_max=None,
+              page_default=100, having=False):
+        """ Both the sort keys of the query and the columns of a unique key
+        are given as lists of ``(column, direction)``; the query is sorted by
+        the latter last, to make the sort order total. Pass ``having`` for
+        aggregated queries. """
+        self.keys = list(keys)
+        for column, direction in unique:
+            if any(column.compare(c) for c, _ in self.keys):
+                continue
+            self.keys.append((column, direction))
+            column = column.asc() if direction == 'asc' else column.desc()
+            if self.cube.is_postgresql:
+                column = column.nullslast()
+            q = q.order_by(column)
+        for i, (column, _) in enumerate(self.keys):
+            column = column.label(self.KEY % i)
+            column.quote = True
+            q = q.column(column)
+        if cursor:
+            clause = self._after(self.decode(cursor))
+            q = q.having(clause) if having else q.where(clause)
+        limit = self.limit(page_size, page_max, page_default)
+        q = q.limit(limit)
+        return {'page': None, 'page_size': limit}, q
+
+    def extract(self, rows, page_size):
+        """ Remove the sort keys from the returned rows, and return the cursor
+        of the next page, if there may be one. """
+        values = None
+        for row in rows:
+            values = [row.pop(self.KEY % i) for i in range(len(self.keys))]
+        if values is None or len(rows) < page_size:
+            return None
+        return self.encode(values)
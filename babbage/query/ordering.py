@@ -4,6 +4,7 @@ from babbage.query.parser import Parser
 from babbage.model.binding import Binding
 from babbage.exc import QueryException
 
+from sqlalchemy import func
 from sqlalchemy.sql.expression import asc, desc
 
 
@@ -12,6 +13,11 @@ class Ordering(Parser):
     and a direction (which is 'asc' if unspecified). """
     start = "ordering"
 
+    def __init__(self, cube):
+        super(Ordering, self).__init__(cube)
+        # The sort keys as (expression, direction), for keyset pagination.
+        self.keys = []
+
     def order(self, ast):
         if isinstance(ast, six.string_types):
             ref, direction = ast, 'asc'
@@ -29,8 +35,10 @@ class Ordering(Parser):
             info.append((ref, direction))
             table, column = self.cube.model[ref].bind(self.cube)
             if distinct is not None and distinct != ref:
+                self.keys.append((func.max(column.element), direction))
                 column = asc(ref) if direction == 'asc' else desc(ref)
             else:
+                self.keys.append((column.element, direction))
                 column = column.label(column.name)
                 column = column.asc() if direction == 'asc' else column.desc()
                 bindings.append(Binding(table, ref))
@@ -39,7 +47,8 @@ class Ordering(Parser):
             q = q.order_by(column)
 
         if not len(self.results):
-            for column in q.columns:
+            for column, inner in zip(q.columns, q.inner_columns):
+                self.keys.append((getattr(inner, 'element', inner), 'asc'))
                 column = column.asc()
                 if self.cube.is_postgresql:
                     column = column.nullslast()
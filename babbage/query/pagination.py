@@ -1,3 +1,6 @@
+from sqlalchemy import bindparam
+from sqlalchemy.types import Integer
+
 from babbage.query.parser import Parser
 from babbage.util import parse_int
 
@@ -5,16 +8,39 @@ from babbage.util import parse_int
 class Pagination(Parser):
     """ Handle pagination of results. Not actually using a parser. """
 
-    def apply(self, q, page, page_size, page_max=None, page_default=100):
+    # The names of the bound parameters for the page window.
+    LIMIT = 'page_limit'
+    OFFSET = 'page_offset'
+
+    def limit(self, page_size, page_max=None, page_default=100):
+        """ Determine the number of rows to return on one page. """
         page_size = parse_int(page_size)
         if page_size is None:
             page_size = page_default
         if page_max is None:
             page_max = 10000
+        return max(0, min(page_max, page_size))
+
+    def window(self, page, page_size, page_max=None, page_default=100):
+        """ Determine the page info, offset and limit of the given page. """
         page = max(1, parse_int(page, 0))
-        limit = max(0, min(page_max, page_size))
-        q = q.limit(limit)
+        limit = self.limit(page_size, page_max, page_default)
         offset = (page - 1) * limit
+        return {'page': page, 'page_size': limit}, offset, limit
+
+    def apply(self, q, page, page_size, page_max=None, page_default=100,
+              params=None):
+        """ Restrict the query to the given page. If a dict of ``params`` is
+        given, the window is left to bound parameters, which are added to
+        it, so that the statement is the same for every page. """
+        info, offset, limit = self.window(page, page_size, page_max,
+                                          page_default)
+        if params is not None:
+            params[self.LIMIT] = limit
+            params[self.OFFSET] = offset
+            q = q.limit(bindparam(self.LIMIT, type_=Integer))
+            return info, q.offset(bindparam(self.OFFSET, type_=Integer))
+        q = q.limit(limit)
         if offset > 0:
             q = q.offset(offset)
-        return {'page': page, 'page_size': limit}, q
+        return info, q
@@ -1,66 +1,50 @@
-import os
-import json
-
-import grako
 import six
-import dateutil.parser
-from grako.exceptions import GrakoException
 
-from babbage.exc import QueryException
-from babbage.util import SCHEMA_PATH
+from babbage.model.model import allrefs
+from babbage.query import grammar
+from babbage.timing import phase
+from babbage.util import LRUCache
+
+
+# Raw parse results, keyed by (start rule, query text). These are recorded
+# before any validation against a model, so they can be shared by all cubes.
+parse_cache = LRUCache(maxsize=2048)
 
 
-with open(os.path.join(SCHEMA_PATH, 'parser.ebnf'), 'rb') as fh:
-    grammar = fh.read().decode('utf8')
-    model = grako.genmodel("all", grammar)
+def _thaw(ast):
+    if isinstance(ast, tuple):
+        return [_thaw(a) for a in ast]
+    return ast
+
+
+def parse(start, text):
+    """ Parse the query ``text`` starting at the given grammar rule, and
+    return a tuple of ``(rule, ast)`` records. Results are cached. """
+    key = (start, text)
+    records = parse_cache.get(key)
+    if records is None:
+        records = grammar.parse(start, text)
+        parse_cache.set(key, records)
+    return records
 
 
 class Parser(object):
-    """ Type casting for the basic primitives of the parser, e.g. strings,
-    ints and dates. """
+    """ Validate the output of the query parser against the model of the
+    given cube. Subclasses implement a handler for each rule they expect. """
 
     def __init__(self, cube):
         self.results = []
         self.cube = cube
         self.bindings = []
 
-    def string_value(self, ast):
-        text = ast[0]
-        if text.startswith('"') and text.endswith('"'):
-            return json.loads(text)
-        return text
-
-    def string_set(self, ast):
-        return map(self.string_value, ast)
-
-    def int_value(self, ast):
-        return int(ast)
-
-    def int_set(self, ast):
-        return map(self.int_value, ast)
-
-    def date_value(self, ast):
-        return dateutil.parser.parse(ast).date()
-
-    def date_set(self, ast):
-        return map(self.date_value, ast)
-
     def parse(self, text):
         if isinstance(text, six.string_types):
-            try:
-                model.parse(text, start=self.start, semantics=self)
-                return self.results
-            except GrakoException as ge:
-                raise QueryException(ge.message)
+            with phase('parse'):
+                for rule, ast in parse(self.start, text):
+                    getattr(self, rule)(_thaw(ast))
+            return self.results
         elif text is None:
             text = []
         return text
 
-    @staticmethod
-    def allrefs(*args):
-        return [
-            ref
-            for concept_list in args
-            for concept in concept_list
-            for ref in concept.refs
-        ]
+    allrefs = staticmethod(allrefs)
@@ -0,0 +1,67 @@
+from sqlalchemy import func, cast
+from sqlalchemy.sql.expression import Cast
+from sqlalchemy.types import Integer, BigInteger
+
+from babbage.query.parser import Parser
+
+
+class Totals(Parser):
+    """ Compute the total cell count and the summary of an aggregation as
+    window functions over the grouped query, so that they are returned along
+    with each cell instead of requiring separate queries. Not actually using
+    a parser. """
+
+    COUNT = '__total_cell_count'
+    SUMMARY = '__summary:%s'
+
+    # How the summary of each aggregate function is derived from the
+    # aggregated cells. Averages cannot be combined this way.
+    FUNCTIONS = {
+        'sum': func.sum,
+        'count': func.sum,
+        'min': func.min,
+        'max': func.max
+    }
+
+    def supports(self, aggregates):
+        """ Check if the summary of all the given aggregates can be computed
+        from the aggregated cells. """
+        for ref in aggregates:
+            if self.cube.model[ref].function not in self.FUNCTIONS:
+                return False
+        return True
+
+    def apply(self, q, aggregates, count=True):
+        if count:
+            column = func.count().over().label(self.COUNT)
+            column.quote = True
+            q = q.column(column)
+        for ref in aggregates:
+            aggregate = self.cube.model[ref]
+            _, cell_column = aggregate.bind(self.cube)
+            cell_column = cell_column.element
+            function = self.FUNCTIONS[aggregate.function]
+            column = function(cell_column).over()
+            # Summing up integers widens their type on some backends; keep
+            # the type the aggregate would have had on its own. The cells
+            # of a rollup are cast to that type already.
+            if aggregate.function in ('sum', 'count') and \
+                    isinstance(cell_column.type, Integer) and \
+                    (isinstance(cell_column, Cast) or
+                     not isinstance(cell_column.type, BigInteger)):
+                column = cast(column, BigInteger)
+            column = column.label(self.SUMMARY % ref)
+            column.quote = True
+            q = q.column(column)
+        return q
+
+    def extract(self, cells, aggregates):
+        """ Remove the totals from the returned cells, and return the total
+        cell count and summary. """
+        count, summary = None, None
+        for cell in cells:
+            count = cell.pop(self.COUNT, None)
+            summary = {}
+            for ref in aggregates:
+                summary[ref] = cell.pop(self.SUMMARY % ref)
+        return count, summary
@@ -0,0 +1,153 @@
+""" A cache of reflected database tables which can be shared by all cubes,
+and saved to disk so that new processes do not need to reflect them again.
+"""
+import os
+import logging
+import threading
+
+from six.moves import cPickle as pickle
+from sqlalchemy import MetaData, Table
+
+from babbage.exc import BindingException
+
+log = logging.getLogger(__name__)
+
+
+def engine_key(engine):
+    """ Identify the database of an engine. In-memory databases are only
+    shared by the same engine. """
+    url = engine.url
+    if url.drivername.startswith('sqlite') and \
+            url.database in (None, '', ':memory:'):
+        return 'memory:%s' % id(engine)
+    # The representation of the URL hides the password.
+    return repr(url)
+
+
+def model_tables(model):
+    """ Get the names of all tables referenced by a model. """
+    tables = set([model.fact_table_name])
+    for concept in model.concepts:
+        column_name = concept.column_name
+        if column_name is not None and '.' in column_name:
+            tables.add(column_name.split('.', 1)[0])
+    for rollup in model.rollups:
+        tables.add(rollup.table_name)
+    tables.discard(None)
+    return tables
+
+
+class ReflectionCache(object):
+    """ Reflected tables by database and name. If a ``path`` is given, the
+    cache is loaded from that file unless it was saved for another
+    ``schema_version``, and saved back to it by ``save``, e.g. once the
+    cubes have been loaded. """
+
+    def __init__(self, path=None, schema_version=None):
+        self.path = path
+        self.schema_version = schema_version
+        self._metas = {}
+        self._dirty = False
+        self._lock = threading.RLock()
+        if path is not None:
+            self.load()
+
+    def _meta(self, engine):
+        key = engine_key(engine)
+        if key not in self._metas:
+            self._metas[key] = MetaData()
+        return self._metas[key]
+
+    def reflect(self, engine, names):
+        """ Reflect those of the given tables which exist and are not cached
+        yet, in one go. """
+        with self._lock:
+            meta = self._meta(engine)
+            names = set(names).difference(meta.tables.keys())
+            if not len(names):
+                return
+            meta.reflect(bind=engine, only=lambda n, m: n in names)
+            if names.intersection(meta.tables.keys()):
+                self._dirty = True
+
+    def get_table(self, engine, name):
+        """ Get a reflected table, reflecting it if needed. """
+        # A table is added to the metadata before its columns are reflected.
+        with self._lock:
+            meta = self._meta(engine)
+            if name not in meta.tables:
+                if not engine.has_table(name):
+                    raise BindingException('Table does not exist: %r' % name,
+                                           table=name)
+                Table(name, meta, autoload=True, autoload_with=engine)
+                self._dirty = True
+            return meta.tables[name]
+
+    def cached_tables(self, engine, names):
+        """ Get those of the given tables which are cached for the engine,
+        by name, without reflecting any. """
+        with self._lock:
+            tables = self._meta(engine).tables
+            return dict((n, tables[n]) for n in names if n in tables)
+
+    def invalidate(self, engine=None, name=None):
+        """ Forget the given table, all tables of the given engine or all
+        tables. """
+        with self._lock:
+            if engine is None:
+                self._metas.clear()
+            elif name is None:
+                self._metas.pop(engine_key(engine), None)
+            else:
+                meta = self._meta(engine)
+                if name in meta.tables:
+                    meta.remove(meta.tables[name])
+            self._dirty = True
+
+    def load(self):
+        """ Load the cache from ``path``, if it was saved for the current
+        schema version. A file which cannot be loaded, e.g. as it was saved
+        by another version of SQLAlchemy, is discarded. """
+        try:
+            with open(self.path, 'rb') as fh:
+                data = pickle.load(fh)
+            schema_version = data.get('schema_version')
+            metas = dict(data.get('metas', {}))
+        except (IOError, OSError) as exc:
+            if os.path.exists(self.path):
+                log.warning('Cannot read reflection cache %r: %s',
+                            self.path, exc)
+            return
+        except Exception as exc:
+            log.warning('Discarding reflection cache %r: %r', self.path, exc)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return
+        if schema_version != self.schema_version:
+            return
+        with self._lock:
+            self._metas.update(metas)
+
+    def save(self):
+        """ Save the cache to ``path``, without the tables of in-memory
+        databases, if it has changed since it was loaded or saved. """
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            metas = dict((k, m) for (k, m) in self._metas.items()
+                         if not k.startswith('memory:'))
+            data = pickle.dumps({'schema_version': self.schema_version,
+                                 'metas': metas}, pickle.HIGHEST_PROTOCOL)
+        tmp_path = '%s.%s.tmp' % (self.path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as fh:
+                fh.write(data)
+            os.rename(tmp_path, self.path)
+        except Exception:
+            self._dirty = True
+            raise
@@ -0,0 +1,77 @@
+""" Building the tables of the rollups declared in a model. Each row of a
+rollup table holds the fact table columns of one group of facts, the sum of
+each measure in that group and the number of facts in it. """
+from collections import OrderedDict
+
+from sqlalchemy import MetaData, Table, Column, func
+from sqlalchemy.sql.expression import select
+from sqlalchemy.types import Integer, BigInteger, Numeric, Float
+
+from babbage.exc import BindingException
+
+COUNT_COLUMN = '_fact_count'
+
+
+def rollup_columns(cube, rollup):
+    """ Get the columns of the fact table by which a rollup is grouped: those
+    of the attributes stored on the fact table, and the join columns of the
+    other dimensions. """
+    columns = OrderedDict()
+    for dimension in rollup.dimensions:
+        for attribute in dimension.attributes:
+            table, column = attribute.bind(cube)
+            if table is not cube.fact_table:
+                name = dimension.join_column_name
+                if isinstance(name, list):
+                    name = name[0]
+                column = cube.fact_table.columns[name]
+            else:
+                column = column.element
+            columns[column.name] = column
+    return list(columns.values())
+
+
+def measure_columns(cube, rollup):
+    """ Get the fact table columns of the measures of a rollup. Only exact
+    numeric types can be summed up in stages without changing the result. """
+    columns = OrderedDict()
+    for measure in rollup.measures:
+        table, column = measure.bind(cube)
+        column = column.element
+        if table is not cube.fact_table or \
+                isinstance(column.type, Float) or \
+                not isinstance(column.type, (Integer, Numeric)):
+            raise BindingException('Measure %r cannot be rolled up' %
+                                   measure.ref, table=table.name,
+                                   column=column.name)
+        columns[column.name] = column
+    return list(columns.values())
+
+
+def build_rollup(cube, rollup):
+    """ (Re-)create the table of a rollup from the fact table of the cube,
+    and return it. """
+    group = rollup_columns(cube, rollup)
+    columns = [Column(c.name, c.type) for c in group]
+    values = list(group)
+    for column in measure_columns(cube, rollup):
+        # Use the type a sum of the column has on PostgreSQL.
+        type_ = column.type
+        if isinstance(type_, BigInteger):
+            type_ = Numeric()
+        elif isinstance(type_, Integer):
+            type_ = BigInteger()
+        columns.append(Column(column.name, type_))
+        values.append(func.sum(column))
+    columns.append(Column(COUNT_COLUMN, BigInteger, nullable=False))
+    values.append(func.count())
+
+    table = Table(rollup.table_name, MetaData(), *columns)
+    table.drop(cube.engine, checkfirst=True)
+    table.create(cube.engine)
+    q = select(values).select_from(cube.fact_table)
+    if len(group):
+        q = q.group_by(*group)
+    names = [c.name for c in columns]
+    cube.engine.execute(table.insert().from_select(names, q))
+    return table
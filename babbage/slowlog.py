@@ -0,0 +1,143 @@
+""" Logging of slow queries. A ``Cube`` given a ``SlowQueryLog`` records each
+statement which takes longer than its threshold, with the compiled SQL and
+its parameters, the number of rows and, optionally, the plan of the
+database. The latest entries are kept in memory, and written to any
+number of sinks, e.g. a log or a file. """
+import json
+import time
+import hashlib
+import logging
+import threading
+from abc import ABCMeta, abstractmethod
+from collections import deque
+
+import six
+
+from babbage.query import prepare
+from babbage.timing import current_fingerprint
+
+log = logging.getLogger(__name__)
+
+
+@six.add_metaclass(ABCMeta)
+class SlowQuerySink(object):
+    """ The interface of a destination for the entries of a slow query log,
+    besides its in-memory buffer. """
+
+    @abstractmethod
+    def write(self, entry):  # pragma: no cover
+        """ Store an entry, a dict which can be encoded as JSON. """
+        pass
+
+
+class LoggingSink(SlowQuerySink):
+    """ Log each entry to a ``logging`` logger. """
+
+    def __init__(self, logger=None, level=logging.WARNING):
+        self.logger = logger or log
+        self.level = level
+
+    def write(self, entry):
+        self.logger.log(self.level, 'Slow query on %r (%.3fs, %d rows): %s',
+                        entry['cube'], entry['duration'], entry['rows'],
+                        entry['sql'], extra={'slow_query': entry})
+
+
+class FileSink(SlowQuerySink):
+    """ Append each entry to a file, as a line of JSON. """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, entry):
+        line = json.dumps(entry, default=str, sort_keys=True) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as fh:
+                fh.write(line)
+
+
+def _digest(fingerprint):
+    if fingerprint is None:
+        return None
+    return hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest()
+
+
+class SlowQueryLog(object):
+    """ Record the statements which take at least ``threshold`` seconds to
+    run and fetch, keeping the latest ``size`` entries. With ``explain``,
+    each is run again with ``EXPLAIN`` and its plan is added to the entry;
+    this runs more queries on a database which is already slow, so it is
+    best reserved for debugging. """
+
+    def __init__(self, threshold=1.0, size=100, explain=False, sinks=None):
+        self.threshold = threshold
+        self.explain = explain
+        self.sinks = list(sinks or [])
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, cube, statement, params, duration, rows):
+        """ Add an entry for a statement run on the cube, if it was slow.
+        Returns the entry, or ``None``. """
+        if duration < self.threshold:
+            return None
+        compiled = prepare(cube, statement)
+        values = compiled.params
+        values.update(params or {})
+        fingerprint = current_fingerprint()
+        entry = {
+            'time': time.time(),
+            'cube': cube.name,
+            'query': fingerprint[2] if fingerprint is not None else None,
+            'fingerprint': _digest(fingerprint),
+            'sql': str(compiled),
+            'params': values,
+            'rows': rows,
+            'duration': duration
+        }
+        if self.explain:
+            entry['plan'] = self._explain(cube, compiled, values)
+        with self._lock:
+            self._entries.append(entry)
+        for sink in self.sinks:
+            try:
+                sink.write(entry)
+            except Exception:
+                log.exception('Cannot write slow query to %r', sink)
+        return entry
+
+    def _explain(self, cube, compiled, values):
+        """ Get the plan of a statement: a JSON document on PostgreSQL, and
+        the rows of ``EXPLAIN`` on other databases. """
+        if cube.is_postgresql:
+            sql = 'EXPLAIN (FORMAT JSON) %s'
+        elif cube.engine.dialect.name == 'sqlite':
+            sql = 'EXPLAIN QUERY PLAN %s'
+        else:
+            sql = 'EXPLAIN %s'
+        sql = sql % compiled
+        if compiled.positional:
+            values = tuple(values[k] for k in compiled.positiontup)
+        try:
+            rp = cube.engine.execute(sql, values)
+            if cube.is_postgresql:
+                return rp.scalar()
+            return [list(row) for row in rp]
+        except Exception:
+            log.exception('Cannot explain slow query on %r', cube.name)
+            return None
+
+    def entries(self, cube_name=None):
+        """ Get the entries in the buffer, optionally of one cube, starting
+        with the latest. """
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if cube_name is not None:
+            entries = [e for e in entries if e['cube'] == cube_name]
+        return entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
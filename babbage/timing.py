@@ -0,0 +1,172 @@
+""" Measuring where the time of a query goes. The phases of a query (parsing,
+binding, compiling, executing, fetching and encoding) are timed while a
+``Timings`` is active on the current thread, which is the case during a
+call to a query method of a ``Cube`` if hooks are registered, or during a
+request to the API if ``BABBAGE_SERVER_TIMING`` is set. Otherwise, timing
+a phase only costs a lookup of the thread-local ``Timings``. """
+import threading
+from collections import OrderedDict
+from functools import wraps
+from timeit import default_timer
+
+PHASES = ('parse', 'bind', 'compile', 'execute', 'fetch', 'encode')
+
+_local = threading.local()
+_hooks = []
+
+
+class Timings(object):
+    """ The time spent in each phase, in seconds. Phases can be nested; the
+    time of a phase does not include that of the phases within it. """
+
+    def __init__(self):
+        self.durations = OrderedDict((p, 0.0) for p in PHASES)
+        self.counts = OrderedDict((p, 0) for p in PHASES)
+        self.started = default_timer()
+        self.ended = None
+        self._stack = []
+
+    def enter(self, phase):
+        self._stack.append([phase, default_timer(), 0.0])
+
+    def exit(self):
+        phase, start, inner = self._stack.pop()
+        elapsed = default_timer() - start
+        self.durations[phase] = self.durations.get(phase, 0.0) + \
+            elapsed - inner
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        if len(self._stack):
+            self._stack[-1][2] += elapsed
+
+    def end(self):
+        self.ended = default_timer()
+
+    @property
+    def total(self):
+        """ The time from the start until the end, or until now. """
+        ended = self.ended if self.ended is not None else default_timer()
+        return ended - self.started
+
+    def server_timing(self):
+        """ Format the phases which took place as a ``Server-Timing`` header,
+        in milliseconds, followed by the total. """
+        metrics = ['%s;dur=%.3f' % (phase, duration * 1000)
+                   for (phase, duration) in self.durations.items()
+                   if self.counts[phase]]
+        metrics.append('total;dur=%.3f' % (self.total * 1000))
+        return ', '.join(metrics)
+
+    def __repr__(self):
+        return '<Timings(%s)>' % self.server_timing()
+
+
+class _Phase(object):
+    __slots__ = ('timings', 'phase')
+
+    def __init__(self, timings, phase):
+        self.timings = timings
+        self.phase = phase
+
+    def __enter__(self):
+        self.timings.enter(self.phase)
+
+    def __exit__(self, *exc):
+        self.timings.exit()
+
+
+class _NoPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name):
+    """ Time a phase of the current query, as a context manager. """
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        return _NO_PHASE
+    return _Phase(timings, name)
+
+
+def current():
+    """ Get the ``Timings`` active on the current thread, if any. """
+    return getattr(_local, 'timings', None)
+
+
+def current_fingerprint():
+    """ Get the fingerprint of the query method of a cube being called on
+    the current thread, if it is reported to hooks or a slow query log. """
+    return getattr(_local, 'fingerprint', None)
+
+
+def start():
+    """ Start timing on the current thread, and return the ``Timings``. """
+    timings = Timings()
+    _local.timings = timings
+    return timings
+
+
+def stop():
+    """ Stop timing on the current thread, and return the ``Timings``. """
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    if timings is not None:
+        timings.end()
+    return timings
+
+
+def add_hook(hook):
+    """ Register a function to be called as ``hook(event, cube_name,
+    fingerprint, timings)`` at the ``'start'`` and ``'end'`` of each call
+    to a query method of a cube. The ``fingerprint`` identifies the query,
+    like the keys of the result cache. The end of a call is reported even
+    if it fails, but not a call with arguments that cannot be fingerprinted.
+    Calls made by other calls, such as those answered from a rollup, are not
+    reported separately. """
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def timed(method):
+    """ Decorate a query method of ``Cube`` to report its calls to the
+    hooks, timing them unless the caller does already. The fingerprint of
+    the call is kept for the slow query log of the cube, if it has one. """
+    @wraps(method)
+    def wrapper(cube, *args, **kwargs):
+        hooks = list(_hooks)
+        if getattr(_local, 'depth', 0) or \
+                not (len(hooks) or cube.slow_log is not None):
+            return method(cube, *args, **kwargs)
+        fingerprint = None
+        if hasattr(method, 'fingerprint'):
+            fingerprint = method.fingerprint(cube, *args, **kwargs)
+        timings = current()
+        own = timings is None and len(hooks)
+        if own:
+            timings = start()
+        _local.depth = 1
+        _local.fingerprint = fingerprint
+        try:
+            for hook in hooks:
+                hook('start', cube.name, fingerprint, timings)
+            return method(cube, *args, **kwargs)
+        finally:
+            _local.depth = 0
+            _local.fingerprint = None
+            if own:
+                stop()
+            for hook in hooks:
+                hook('end', cube.name, fingerprint, timings)
+    return wrapper
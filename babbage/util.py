@@ -1,4 +1,9 @@
 import os
+import time
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
 import six
 
 SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema')
@@ -16,3 +21,117 @@ def parse_int(text, fallback=None):
             return fallback
     except ValueError:
         return fallback
+
+
+def pool_size(engine):
+    """ Get the number of connections the engine keeps open. """
+    return max(1, getattr(engine.pool, 'size', lambda: 5)())
+
+
+def query_executor(engine, size=None):
+    """ Make a pool of threads for a ``Cube`` to run independent queries on
+    at the same time. By default, it has as many threads as the engine keeps
+    connections open. """
+    return ThreadPool(size or pool_size(engine))
+
+
+class LRUCache(object):
+    """ A bounded, thread-safe mapping which discards the least recently used
+    entries once more than ``maxsize`` items are stored. Optionally, entries
+    also expire ``ttl`` seconds after they were set, and the total of their
+    ``sizeof`` is kept within ``max_bytes``. ``on_evict`` is called with the
+    key and value of each entry discarded this way. Keeps a tally of cache
+    hits, misses and evictions. """
+
+    def __init__(self, maxsize=1024, max_bytes=None, ttl=None, sizeof=None,
+                 on_evict=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _pop(self, key):
+        value, size, expires = self._data.pop(key)
+        self.bytes -= size
+        return value
+
+    def _evict(self, key):
+        value = self._pop(key)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[2] is not None and \
+                    entry[2] < time.time():
+                self._evict(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data[key] = self._data.pop(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = 0 if self.sizeof is None else self.sizeof(value)
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, size, expires)
+            self.bytes += size
+            while len(self._data) > max(0, self.maxsize) or \
+                    (self.max_bytes is not None and
+                     self.bytes > self.max_bytes and len(self._data)):
+                self._evict(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        """ Remove an entry without counting it as evicted. """
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._pop(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def values(self):
+        with self._lock:
+            return [entry[0] for entry in self._data.values()]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
@@ -1,11 +1,30 @@
 import os
 import json
+import argparse
+import threading
+from multiprocessing import Pool, cpu_count
+
 from jsonschema import Draft4Validator, FormatChecker
+from sqlalchemy import create_engine
+from sqlalchemy.sql.expression import select
 
+from babbage.cube import Cube
+from babbage.model import Model
+from babbage.model.binding import Binding
+from babbage.reflection import ReflectionCache, model_tables
 from babbage.util import SCHEMA_PATH
+from babbage.exc import BindingException
 
 checker = FormatChecker()
 
+# The validators loaded by ``get_validator``, by schema name.
+_validators = {}
+_validators_lock = threading.Lock()
+
+# The engine and reflected tables used by a worker process of
+# ``validate_directory``, by database URL.
+_databases = {}
+
 
 @checker.checks('attribute_exists')
 def check_attribute_exists(instance):
@@ -39,6 +58,20 @@ def check_valid_hierarchies(instance):
     return True
 
 
+@checker.checks('valid_rollups')
+def check_valid_rollups(instance):
+    """ Additional check for the rollups model, to ensure that they group by
+    actual dimensions and sum up actual measures. """
+    dimensions = set(instance.get('dimensions', {}).keys())
+    measures = set(instance.get('measures', {}).keys())
+    for rollup in instance.get('rollups', {}).values():
+        if not dimensions.issuperset(rollup.get('dimensions', [])):
+            return False
+        if not measures.issuperset(rollup.get('measures', [])):
+            return False
+    return True
+
+
 def load_validator(name):
     """ Load the JSON Schema Draft 4 validator with the given name from the
     local schema directory. """
@@ -48,6 +81,137 @@ def load_validator(name):
     return Draft4Validator(schema, format_checker=checker)
 
 
+def get_validator(name):
+    """ Get the validator with the given name, which is loaded once. """
+    with _validators_lock:
+        if name not in _validators:
+            _validators[name] = load_validator(name)
+        return _validators[name]
+
+
 def validate_model(model):
-    validator = load_validator('model.json')
+    validator = get_validator('model.json')
     validator.validate(model)
+
+
+def binding_errors(model, engine, reflection=None):
+    """ Check that the tables and columns a ``Model`` refers to exist in the
+    database, and that its dimensions can be joined to the fact table.
+    Returns a list of messages, as ``BindingException`` would raise them
+    when querying the cube. Rollup tables are not checked, as they may not
+    have been built yet. """
+    if reflection is None:
+        reflection = ReflectionCache()
+    reflection.reflect(engine, model_tables(model))
+    cube = Cube(engine, None, model, reflection=reflection)
+    try:
+        cube.fact_table
+    except BindingException as exc:
+        return [exc.message]
+    errors = []
+    if not len([c for c in cube.fact_table.columns if c.primary_key]):
+        errors.append('Fact table %r has no primary key' %
+                      model.fact_table_name)
+    for concept in list(model.measures) + list(model.attributes):
+        try:
+            concept.bind(cube)
+        except BindingException as exc:
+            errors.append('%s: %s' % (concept.ref, exc.message))
+    for dimension in model.dimensions:
+        try:
+            table, column = dimension.bind(cube)
+            q = select([column]).select_from(cube.fact_table)
+            cube.restrict_joins(q, [Binding(table, dimension.ref)])
+        except BindingException as exc:
+            message = '%s: %s' % (dimension.ref, exc.message)
+            if message not in errors:
+                errors.append(message)
+    return errors
+
+
+def model_errors(spec, engine=None, reflection=None):
+    """ List all the problems of a model spec: where it does not conform to
+    the schema and, given an ``engine``, the ``binding_errors`` of a valid
+    one. Returns an empty list for a valid model. """
+    errors = []
+    for error in sorted(get_validator('model.json').iter_errors(spec),
+                        key=lambda e: list(e.absolute_path)):
+        path = '.'.join(str(p) for p in error.absolute_path)
+        errors.append('%s: %s' % (path, error.message) if path
+                      else error.message)
+    if engine is not None and not len(errors):
+        errors.extend(binding_errors(Model(spec), engine, reflection))
+    return errors
+
+
+def _database(url):
+    if url not in _databases:
+        _databases[url] = (create_engine(url), ReflectionCache())
+    return _databases[url]
+
+
+def validate_file(path, database_url=None):
+    """ Get the ``model_errors`` of the model in a JSON file, cross-checked
+    against the database at ``database_url``, if given. """
+    try:
+        with open(path, 'r') as fh:
+            spec = json.load(fh)
+    except (IOError, ValueError) as exc:
+        return ['Cannot load model: %s' % exc]
+    engine, reflection = None, None
+    if database_url is not None:
+        engine, reflection = _database(database_url)
+    return model_errors(spec, engine=engine, reflection=reflection)
+
+
+def _validate_file(args):
+    name, path, database_url = args
+    return name, validate_file(path, database_url)
+
+
+def validate_directory(directory, database_url=None, processes=None):
+    """ Validate all JSON models in a directory, like ``JSONCubeManager``
+    finds them, on a pool of ``processes`` (by default, one per CPU).
+    Returns a dict of the errors of each model, by cube name. """
+    jobs = []
+    for file_name in sorted(os.listdir(directory)):
+        if '.' in file_name:
+            name, ext = file_name.rsplit('.', 1)
+            if ext.lower() == 'json':
+                path = os.path.join(directory, file_name)
+                jobs.append((name, path, database_url))
+    if processes == 1 or len(jobs) < 2:
+        return dict(_validate_file(job) for job in jobs)
+    processes = min(processes or cpu_count(), len(jobs))
+    pool = Pool(processes)
+    try:
+        chunksize = max(1, len(jobs) // (processes * 4))
+        return dict(pool.imap_unordered(_validate_file, jobs, chunksize))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    """ Validate a directory of JSON models from the command line. """
+    parser = argparse.ArgumentParser(
+        prog='babbage-validate',
+        description='Validate a directory of JSON cube models.')
+    parser.add_argument('directory')
+    parser.add_argument('--database', metavar='URL',
+                        help='check the models against the tables of this '
+                             'database')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: one per '
+                             'CPU)')
+    args = parser.parse_args(argv)
+    results = validate_directory(args.directory, database_url=args.database,
+                                 processes=args.processes)
+    invalid = 0
+    for name, errors in sorted(results.items()):
+        if len(errors):
+            invalid += 1
+        for error in errors:
+            print('%s: %s' % (name, error))
+    print('%d of %d models invalid' % (invalid, len(results)))
+    return 1 if invalid else 0
@@ -0,0 +1,44 @@
+""" Measure the cost of resolving refs against models of growing size.
+
+Run with ``PYTHONPATH=. python benchmarks/bench_model.py``; the time per
+lookup should stay flat as the number of dimensions grows. """
+import timeit
+
+from babbage.model import Model
+
+
+def make_spec(num_dimensions, num_attributes=4):
+    dimensions = {}
+    for i in range(num_dimensions):
+        attributes = {}
+        for j in range(num_attributes):
+            attributes['attr%d' % j] = {'label': 'Attr %d' % j,
+                                        'column': 'dim%d_attr%d' % (i, j),
+                                        'type': 'string'}
+        dimensions['dim%d' % i] = {'label': 'Dim %d' % i,
+                                   'key_attribute': 'attr0',
+                                   'label_attribute': 'attr1',
+                                   'attributes': attributes}
+    return {
+        'fact_table': 'facts',
+        'dimensions': dimensions,
+        'measures': {
+            'amount': {'label': 'Amount', 'column': 'amount'}
+        }
+    }
+
+
+def main(number=2000):
+    print('%12s %16s %16s' % ('dimensions', 'getitem (us)', 'drilldown (us)'))
+    for size in (5, 20, 60, 200):
+        model = Model(make_spec(size))
+        last = 'dim%d.attr%d' % (size - 1, 3)
+        getitem = timeit.timeit(lambda: model[last], number=number)
+        valid = timeit.timeit(lambda: last in model.drilldown_refs,
+                              number=number)
+        print('%12d %16.3f %16.3f' % (size, getitem / number * 1e6,
+                                      valid / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+""" Compare the hand-written query parser with the grako-interpreted grammar
+it replaced. Requires ``grako`` to be installed for the comparison.
+
+Run with ``PYTHONPATH=. python benchmarks/bench_parser.py``. """
+import os
+import sys
+import timeit
+
+from babbage.query import grammar
+from babbage.util import SCHEMA_PATH
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+QUERIES = [
+    ('cuts', 'cofog1:"4";"10"|cap_or_cur.label:"Current Expenditure"'),
+    ('cuts', 'year:2015|date:2015-01-04;2015-01-05|code:3;22'),
+    ('drilldowns', 'cofog1|cap_or_cur.label|cofog2.name'),
+    ('fields', 'cofog1,cofog2,amount,cap_or_cur.label'),
+    ('aggregates', 'amount.sum|_count'),
+    ('ordering', 'amount:desc,cofog1.name:asc'),
+]
+
+
+def main(number=500):
+    total = timeit.timeit(lambda: [grammar.parse(s, t) for s, t in QUERIES],
+                          number=number)
+    per_query = total / (number * len(QUERIES)) * 1e6
+    print('hand-written: %10.2f us/query' % per_query)
+    try:
+        import grako
+        from test_grammar import grako_parse
+    except ImportError:
+        print('grako is not installed, skipping comparison.')
+        return
+    with open(os.path.join(SCHEMA_PATH, 'parser.ebnf'), 'rb') as fh:
+        model = grako.genmodel('all', fh.read().decode('utf8'))
+    total = timeit.timeit(lambda: [grako_parse(model, s, t)
+                                   for s, t in QUERIES], number=number)
+    grako_per_query = total / (number * len(QUERIES)) * 1e6
+    print('grako:        %10.2f us/query' % grako_per_query)
+    print('speedup:      %10.1fx' % (grako_per_query / per_query))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+""" Compare fetching query results row by row into ``dict(row.items())``
+with the batched fetching of ``generate_results``, and its tuple mode.
+
+Run with ``PYTHONPATH=. python benchmarks/bench_results.py``. """
+import timeit
+
+from sqlalchemy import create_engine, MetaData, Table, Column
+from sqlalchemy import Integer, Unicode, Float
+
+from babbage.cube import Cube
+from babbage.query import generate_results
+
+COLUMNS = 12
+
+
+def make_cube(rows):
+    engine = create_engine('sqlite://')
+    meta = MetaData(bind=engine)
+    columns = [Column('id', Integer, primary_key=True)]
+    for i in range(COLUMNS):
+        type_ = (Unicode, Integer, Float)[i % 3]
+        columns.append(Column('col%d' % i, type_))
+    table = Table('facts', meta, *columns)
+    table.create()
+    values = []
+    for r in range(rows):
+        row = {'id': r}
+        for i in range(COLUMNS):
+            row['col%d' % i] = (u'value %d' % r, r, r * 0.5)[i % 3]
+        values.append(row)
+    engine.execute(table.insert(), values)
+    model = {'fact_table': 'facts', 'measures': {}, 'dimensions': {}}
+    return Cube(engine, 'facts', model, fact_table=table), table
+
+
+def fetchone_dicts(cube, q):
+    rp = cube.engine.execute(q)
+    while True:
+        row = rp.fetchone()
+        if row is None:
+            return
+        yield dict(row.items())
+
+
+def main(number=5):
+    for rows in (1000, 10000, 50000):
+        cube, table = make_cube(rows)
+        q = table.select()
+        print('%d rows x %d columns:' % (rows, COLUMNS + 1))
+        for name, func in [
+            ('fetchone, dict(row.items())',
+             lambda: list(fetchone_dicts(cube, q))),
+            ('fetchmany, dict(zip(keys))',
+             lambda: list(generate_results(cube, q))),
+            ('fetchmany, tuples',
+             lambda: list(generate_results(cube, q, tuples=True))),
+        ]:
+            total = timeit.timeit(func, number=number)
+            print('  %-28s %10.2f ms' % (name, total / number * 1e3))
+
+
+if __name__ == '__main__':
+    main()
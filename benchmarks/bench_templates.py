@@ -0,0 +1,102 @@
+""" Measure the time an aggregation spends before its first statement reaches
+the database: building and compiling the statements for every call, against
+looking up the compiled statement template of its shape and binding the cut
+values.
+
+Run with ``PYTHONPATH=. python benchmarks/bench_templates.py``. """
+import time
+
+from sqlalchemy import create_engine, event, MetaData, Table, Column
+from sqlalchemy import Integer, Unicode
+
+from babbage.cube import Cube
+
+DIMENSIONS = 6
+ROWS = 100
+
+
+def make_cube():
+    engine = create_engine('sqlite://')
+    meta = MetaData(bind=engine)
+    columns = [Column('id', Integer, primary_key=True),
+               Column('amount', Integer)]
+    dimensions = {}
+    for i in range(DIMENSIONS):
+        columns.append(Column('dim%d_code' % i, Unicode))
+        columns.append(Column('dim%d_label' % i, Unicode))
+        dimensions['dim%d' % i] = {
+            'label': 'Dim %d' % i,
+            'key_attribute': 'code',
+            'label_attribute': 'label',
+            'attributes': {
+                'code': {'column': 'dim%d_code' % i, 'type': 'string'},
+                'label': {'column': 'dim%d_label' % i, 'type': 'string'}
+            }
+        }
+    table = Table('facts', meta, *columns)
+    table.create()
+    values = []
+    for r in range(ROWS):
+        row = {'id': r, 'amount': r}
+        for i in range(DIMENSIONS):
+            row['dim%d_code' % i] = u'%d' % (r % (i + 2))
+            row['dim%d_label' % i] = u'Member %d' % (r % (i + 2))
+        values.append(row)
+    engine.execute(table.insert(), values)
+    model = {
+        'fact_table': 'facts',
+        'dimensions': dimensions,
+        'measures': {'amount': {'label': 'Amount', 'column': 'amount'}}
+    }
+    return Cube(engine, 'facts', model, fact_table=table)
+
+
+def time_to_database(cube, cold, **kwargs):
+    """ Time from the call of ``aggregate`` to its first statement. """
+    first = []
+
+    def record(*args):
+        if not len(first):
+            first.append(time.perf_counter())
+
+    if cold:
+        cube._templates.clear()
+    event.listen(cube.engine, 'before_cursor_execute', record)
+    try:
+        start = time.perf_counter()
+        cube.aggregate(**kwargs)
+    finally:
+        event.remove(cube.engine, 'before_cursor_execute', record)
+    return first[0] - start
+
+
+def main(number=500):
+    cube = make_cube()
+    queries = [
+        ('1 drilldown', {'drilldowns': 'dim0'}),
+        ('3 drilldowns, 2 cuts',
+         {'drilldowns': 'dim0|dim1|dim2',
+          'cuts': 'dim3:"%d"|dim4:"%d";"1"'}),
+        ('6 drilldowns, order',
+         {'drilldowns': '|'.join('dim%d' % i for i in range(DIMENSIONS)),
+          'order': 'amount.sum:desc', 'cuts': 'dim5:"%d"'}),
+    ]
+    print('%-24s %14s %14s' % ('query', 'cold (us)', 'warm (us)'))
+    for name, kwargs in queries:
+        times = {}
+        for cold in (True, False):
+            total = 0.0
+            for n in range(number):
+                args = dict(kwargs)
+                if 'cuts' in args:
+                    # A new cut value for each call, as the result cache of
+                    # a cube would answer a repeated one.
+                    count = args['cuts'].count('%d')
+                    args['cuts'] = args['cuts'] % ((n % 5,) * count)
+                total += time_to_database(cube, cold, **args)
+            times[cold] = total / number * 1e6
+        print('%-24s %14.1f %14.1f' % (name, times[True], times[False]))
+
+
+if __name__ == '__main__':
+    main()
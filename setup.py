@@ -40,12 +40,15 @@ setup(
         'flask >= 0.10.1',
         'jsonschema >= 2.5.1',
         'sqlalchemy >= 1.0',
-        'psycopg2 >= 2.6',
-        'grako == 3.10.1'  # Versions > 3.10.1 break our tests
+        'psycopg2 >= 2.6'
     ],
     tests_require=[
         'tox'
     ],
     test_suite='tests',
-    entry_points={}
+    entry_points={
+        'console_scripts': [
+            'babbage-validate = babbage.validation:main'
+        ]
+    }
 )
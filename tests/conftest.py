@@ -81,6 +81,18 @@ def sqla_engine():
         meta.drop_all()
 
 
+@pytest.fixture()
+def threaded_engine(sqla_engine, tmpdir):
+    """ An engine with the fixtures loaded whose connections can be used
+    from several threads, unlike those of an in-memory SQLite database. """
+    engine = sqla_engine
+    if isinstance(engine.pool, sqlalchemy.pool.SingletonThreadPool):
+        engine = sqlalchemy.create_engine('sqlite:///%s' % tmpdir.join('db'))
+    for name in ('cra.csv', 'cap_or_cur.csv', 'cofog1.csv'):
+        load_csv(engine, name)
+    return engine
+
+
 def load_json_fixture(name):
     path = os.path.join(FIXTURE_PATH, name)
     with open(path, 'r') as fh:
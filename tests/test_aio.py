@@ -0,0 +1,119 @@
+import time
+import asyncio
+
+import pytest
+
+from babbage.cube import Cube
+from babbage.aio import AsyncCube
+from babbage.exc import QueryException
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+class SlowCube(Cube):
+    """ A cube whose aggregation runs a query which never ends. """
+
+    def aggregate(self, **kwargs):
+        return self.engine.execute(
+            'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) '
+            'SELECT count(*) FROM c').scalar()
+
+
+@pytest.fixture()
+def cube(threaded_engine, cra_model):
+    return Cube(threaded_engine, 'cra', cra_model)
+
+
+@pytest.fixture()
+def async_cube(cube):
+    async_cube = AsyncCube(cube)
+    yield async_cube
+    async_cube.close()
+
+
+class TestAsyncCube(object):
+    def test_aggregate(self, cube, async_cube):
+        result = run(async_cube.aggregate(drilldowns='cofog1'))
+        assert result == cube.aggregate(drilldowns='cofog1')
+
+    def test_facts(self, cube, async_cube):
+        result = run(async_cube.facts(cuts='cofog1:"4"', page_size=5))
+        assert result == cube.facts(cuts='cofog1:"4"', page_size=5)
+
+    def test_members(self, cube, async_cube):
+        result = run(async_cube.members('cofog1', order='cofog1.name'))
+        assert result == cube.members('cofog1', order='cofog1.name')
+
+    def test_gather(self, cube, async_cube):
+        async def gather():
+            return await asyncio.gather(
+                async_cube.aggregate(drilldowns='cofog1'),
+                async_cube.aggregate(drilldowns='cap_or_cur'),
+                async_cube.members('cofog1'))
+        results = run(gather())
+        assert results[0] == cube.aggregate(drilldowns='cofog1')
+        assert results[1] == cube.aggregate(drilldowns='cap_or_cur')
+        assert results[2] == cube.members('cofog1')
+
+    def test_export(self, cube, async_cube, monkeypatch):
+        monkeypatch.setattr('babbage.aio.EXPORT_BATCH_SIZE', 7)
+
+        async def export():
+            return [row async for row in async_cube.export()]
+        rows = run(export())
+        assert rows == list(cube.export())
+
+    def test_export_invalid(self, async_cube):
+        async def export():
+            return [row async for row in async_cube.export(order='foo')]
+        with pytest.raises(QueryException):
+            run(export())
+
+    def test_export_stop_early(self, async_cube, monkeypatch):
+        monkeypatch.setattr('babbage.aio.EXPORT_BATCH_SIZE', 1)
+
+        async def export():
+            rows = []
+            async for row in async_cube.export():
+                rows.append(row)
+                if len(rows) == 3:
+                    break
+            return rows
+        assert len(run(export())) == 3
+        # The rows are no longer read once the export is closed.
+        async_cube.executor.shutdown(wait=True)
+
+    def test_timeout(self, threaded_engine, cra_model):
+        cube = AsyncCube(SlowCube(threaded_engine, 'cra', cra_model),
+                         timeout=0.2)
+        try:
+            begin = time.time()
+            with pytest.raises(asyncio.TimeoutError):
+                run(cube.aggregate())
+            # The query was interrupted, so the thread is free again.
+            cube.executor.shutdown(wait=True)
+            assert time.time() - begin < 5
+        finally:
+            cube.close()
+
+    def test_cancel(self, threaded_engine, cra_model):
+        cube = AsyncCube(SlowCube(threaded_engine, 'cra', cra_model))
+
+        async def cancel():
+            task = asyncio.ensure_future(cube.aggregate())
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await task
+        try:
+            with pytest.raises(asyncio.CancelledError):
+                run(cancel())
+            cube.executor.shutdown(wait=True)
+        finally:
+            cube.close()
@@ -1,11 +1,30 @@
 import os
 import io
 import csv
+import json
+import datetime
+from decimal import Decimal
+
 import pytest
 from flask import url_for
+from sqlalchemy import event
 
 from babbage.manager import JSONCubeManager
-from babbage.api import configure_api
+from babbage.api import configure_api, JSONEncoder, RowEncoder
+
+
+def test_row_encoder():
+    rows = [
+        {'a': None, 'b': 1, 'c': 'x'},
+        {'a': Decimal('1.5'), 'b': 2, 'c': datetime.date(2015, 1, 2)},
+        {'a': Decimal('2'), 'b': None, 'c': 'y'},
+    ]
+    encoder = RowEncoder(JSONEncoder())
+    for row in rows:
+        assert json.loads(encoder.encode(row)) == \
+            json.loads(JSONEncoder().encode(row))
+    assert encoder.converters['a'] is float, encoder.converters
+    assert not len(encoder.pending), encoder.pending
 
 
 @pytest.mark.usefixtures('load_api_fixtures')
@@ -20,6 +39,20 @@ class TestCubeManager(object):
         assert res.status_code == 200, res
         assert res.data.startswith(b'foo && foo('), res.data
 
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_jsonp_streamed(self, client, monkeypatch):
+        monkeypatch.setattr('babbage.api.STREAM_BATCH_SIZE', 7)
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                 callback='foo'))
+        assert res.status_code == 200, res
+        data = res.get_data(as_text=True)
+        assert data.startswith('foo && foo({'), data[:20]
+        assert data.endswith(']})'), data[-20:]
+        result = json.loads(data[len('foo && foo('):-1])
+        expected = client.get(url_for('babbage_api.facts', name='cra')).json
+        assert result == expected
+        assert 36 == len(result['data']), result
+
     def test_list_cubes(self, client):
         res = client.get(url_for('babbage_api.cubes'))
         assert len(res.json['data']) == 3, res.json
@@ -101,6 +134,194 @@ class TestCubeManager(object):
                                       drilldown='cofoxxxg1'))
         assert res.status_code == 400, res
 
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_aggregate_batch(self, client):
+        queries = [{'drilldown': 'cofog1', 'cut': 'cap_or_cur:"CUR"'},
+                   {'drilldown': 'cap_or_cur', 'pagesize': 1},
+                   {'drilldown': 'cofog1', 'cut': 'cap_or_cur:"CUR"'}]
+        res = client.post(url_for('babbage_api.aggregate_batch', name='cra'),
+                          data=json.dumps({'queries': queries}),
+                          content_type='application/json')
+        assert res.status_code == 200, (res, res.get_data())
+        results = res.json['results']
+        assert len(results) == 3, results
+        single = client.get(url_for('babbage_api.aggregate', name='cra',
+                                    drilldown='cofog1',
+                                    cut='cap_or_cur:"CUR"')).json
+        single.pop('status')
+        assert results[0] == single, results[0]
+        assert results[2] == single, results[2]
+        assert len(results[1]['cells']) == 1, results[1]
+
+    def test_aggregate_batch_invalid(self, client):
+        batch_url = url_for('babbage_api.aggregate_batch', name='cra')
+        for data in ('xx', {'queries': 'cofog1'}, {'queries': ['cofog1']},
+                     {'queries': [{'drilldowns': 'cofog1'}]},
+                     {'queries': [{'drilldown': 'cofog1'}] * 101}):
+            res = client.post(batch_url, data=json.dumps(data),
+                              content_type='application/json')
+            assert res.status_code == 400, (data, res.get_data())
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_aggregate_batch_invalid_values(self, client):
+        batch_url = url_for('babbage_api.aggregate_batch', name='cra')
+        for query in ({'cut': 5}, {'cut': [['foo', ':', 'x']]},
+                      {'count': 5}, {'drilldown': ['nope']},
+                      {'drilldown': 'nope'}, {'aggregates': ['amount.sum']},
+                      {'order': {'amount.sum': 'desc'}}, {'page': '1'},
+                      {'pagesize': 1.5}, {'pagesize': True}):
+            res = client.post(batch_url, data=json.dumps({'queries': [query]}),
+                              content_type='application/json')
+            assert res.status_code == 400, (query, res.get_data())
+        query = {'drilldown': 'cofog1', 'cut': None, 'page': None}
+        res = client.post(batch_url, data=json.dumps({'queries': [query]}),
+                          content_type='application/json')
+        assert res.status_code == 200, res.get_data()
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_columnar_format(self, client):
+        res = client.get(url_for('babbage_api.aggregate', name='cra',
+                                 drilldown='cofog1', format='columnar'))
+        assert res.status_code == 200, (res, res.get_data())
+        cells = res.json['cells']
+        assert cells['length'] == 4, cells
+        assert 'cofog1.name' in cells['refs'], cells
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                 fields='cap_or_cur', format='columnar'))
+        assert res.status_code == 200, (res, res.get_data())
+        column = res.json['data']['columns']['cap_or_cur.code']
+        assert len(column['codes']) == 36, column
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_facts_csv_quoting(self, client):
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                 fields='cofog2.label,amount', format='csv'))
+        assert res.status_code == 200, (res, res.get_data())
+        rows = list(csv.reader(io.StringIO(res.get_data(as_text=True))))
+        assert rows[0] == ['cofog2.label', 'amount'], rows[0]
+        assert 37 == len(rows), rows
+        labels = [r[0] for r in rows[1:]]
+        assert 'General economic, commercial and labour affairs' in labels
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_csv_paged(self, client):
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                 fields='amount', format='csv', pagesize=5))
+        assert 6 == len(res.get_data(as_text=True).splitlines())
+        res = client.get(url_for('babbage_api.aggregate', name='cra',
+                                 drilldown='cofog1', format='csv', page=2,
+                                 pagesize=3))
+        lines = res.get_data(as_text=True).splitlines()
+        assert 2 == len(lines), lines
+        assert lines[0].startswith('cofog1.'), lines[0]
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_csv_alias(self, client, fixtures_cube_manager, monkeypatch):
+        get_cube_model = fixtures_cube_manager.get_cube_model
+
+        def with_hierarchy(name):
+            model = get_cube_model(name)
+            model['hierarchies'] = {'func': {'levels': ['cofog1']}}
+            return model
+
+        monkeypatch.setattr(fixtures_cube_manager, 'get_cube_model',
+                            with_hierarchy)
+        for pagesize in (None, 5):
+            res = client.get(url_for('babbage_api.facts', name='cra',
+                                     fields='func.name,amount',
+                                     format='csv', pagesize=pagesize))
+            rows = list(csv.reader(io.StringIO(res.get_data(as_text=True))))
+            assert rows[0] == ['func.name', 'amount'], rows[0]
+            assert all(len(r[0]) for r in rows[1:]), rows
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_members_csv(self, client):
+        res = client.get(url_for('babbage_api.members', name='cra',
+                                 ref='cofog1.name', format='csv'))
+        assert res.status_code == 200, (res, res.get_data())
+        lines = res.get_data(as_text=True).splitlines()
+        assert lines == ['cofog1.name', '10', '3', '4', '6'], lines
+
+    def test_model_etag(self, client):
+        res = client.get(url_for('babbage_api.model', name='cra'))
+        etag = res.headers['ETag']
+        assert res.headers['Cache-Control'] == 'public, no-cache', res.headers
+        res = client.get(url_for('babbage_api.model', name='cra'),
+                         headers={'If-None-Match': etag})
+        assert res.status_code == 304, res
+        assert res.get_data() == b'', res.get_data()
+        res = client.get(url_for('babbage_api.model', name='cra'),
+                         headers={'If-None-Match': '"other"'})
+        assert res.status_code == 200, res
+
+    @pytest.mark.usefixtures('load_fixtures')
+    @pytest.mark.parametrize('endpoint,args', [
+        ('babbage_api.aggregate', {'drilldown': 'cofog1'}),
+        ('babbage_api.facts', {'format': 'csv'}),
+        ('babbage_api.members', {'ref': 'cofog1'}),
+    ])
+    def test_query_etag(self, app, client, sqla_engine, monkeypatch,
+                        endpoint, args):
+        res = client.get(url_for(endpoint, name='cra', **args))
+        assert res.status_code == 200, res
+        assert 'ETag' not in res.headers, res.headers
+        assert 'Cache-Control' not in res.headers, res.headers
+
+        manager = app.extensions['babbage']
+        versions = {'cra': 1460000000.0}
+        monkeypatch.setattr(manager, 'data_version', versions.get)
+        res = client.get(url_for(endpoint, name='cra', **args))
+        assert res.status_code == 200, res
+        etag, modified = res.headers['ETag'], res.headers['Last-Modified']
+        other = client.get(url_for(endpoint, name='cra', page=2, **args))
+        assert other.headers['ETag'] != etag
+
+        statements = []
+        event.listen(sqla_engine, 'before_cursor_execute',
+                     lambda *a: statements.append(a[2]))
+        res = client.get(url_for(endpoint, name='cra', **args),
+                         headers={'If-None-Match': etag})
+        assert res.status_code == 304, res
+        res = client.get(url_for(endpoint, name='cra', **args),
+                         headers={'If-Modified-Since': modified})
+        assert res.status_code == 304, res
+        assert not len(statements), statements
+
+        versions['cra'] += 60
+        res = client.get(url_for(endpoint, name='cra', **args),
+                         headers={'If-None-Match': etag})
+        assert res.status_code == 200, res
+        assert res.headers['ETag'] != etag
+        res = client.get(url_for(endpoint, name='cra', **args),
+                         headers={'If-Modified-Since': modified})
+        assert res.status_code == 200, res
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_query_etag_opt_in(self, app, client):
+        app.config['BABBAGE_QUERY_VALIDATORS'] = True
+        res = client.get(url_for('babbage_api.facts', name='cra'))
+        etag = res.headers['ETag']
+        assert 'Last-Modified' not in res.headers, res.headers
+        res = client.get(url_for('babbage_api.facts', name='cra'),
+                         headers={'If-None-Match': etag})
+        assert res.status_code == 304, res
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_etag_after_cardinalities(self, app, client, monkeypatch,
+                                      fixtures_cube_manager):
+        app.config['BABBAGE_QUERY_VALIDATORS'] = True
+        cube = fixtures_cube_manager.get_cube('cra')
+        monkeypatch.setattr(fixtures_cube_manager, 'get_cube',
+                            lambda name: cube)
+        urls = [url_for('babbage_api.model', name='cra'),
+                url_for('babbage_api.facts', name='cra')]
+        etags = [client.get(u).headers['ETag'] for u in urls]
+        cube.compute_cardinalities()
+        for u, etag in zip(urls, etags):
+            res = client.get(u, headers={'If-None-Match': etag})
+            assert res.status_code == 200, (u, res)
+            assert res.headers['ETag'] != etag, u
+
     def test_facts_missing(self, client):
         res = client.get(url_for('babbage_api.facts', name='crack'))
         assert res.status_code == 404, res
@@ -119,6 +340,60 @@ class TestCubeManager(object):
         assert res.status_code == 200, (res, res.get_data())
         assert 11 == len(res.json['data']), len(res.json['data'])
 
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_facts_cursor(self, client):
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                      cursor='', pagesize=30))
+        assert res.status_code == 200, (res, res.get_data())
+        assert 30 == len(res.json['data']), res.json
+        cursor = res.json['next_cursor']
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                      cursor=cursor, pagesize=30))
+        assert res.status_code == 200, (res, res.get_data())
+        assert 6 == len(res.json['data']), res.json
+        assert res.json['next_cursor'] is None, res.json
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_facts_count_none(self, client):
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                      count='none'))
+        assert res.status_code == 200, (res, res.get_data())
+        assert res.json['total_fact_count'] is None, res.json
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                      count='guess'))
+        assert res.status_code == 400, res
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_facts_invalid_cursor(self, client):
+        res = client.get(url_for('babbage_api.facts', name='cra',
+                                      cursor='xx'))
+        assert res.status_code == 400, res
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_export_ndjson(self, client):
+        res = client.get(url_for('babbage_api.export', name='cra',
+                                      cut='cofog1:"10"'))
+        assert res.status_code == 200, (res, res.get_data())
+        assert res.mimetype == 'application/x-ndjson', res.mimetype
+        lines = res.get_data(as_text=True).splitlines()
+        assert 11 == len(lines), lines
+        assert json.loads(lines[0])['cofog1.name'] == '10', lines[0]
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_export_csv(self, client):
+        res = client.get(url_for('babbage_api.export', name='cra',
+                                      fields='amount', format='csv'))
+        assert res.status_code == 200, (res, res.get_data())
+        lines = res.get_data(as_text=True).splitlines()
+        assert 37 == len(lines), lines
+        assert lines[0] == 'amount', lines[0]
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_export_invalid(self, client):
+        res = client.get(url_for('babbage_api.export', name='cra',
+                                      fields='schnasel'))
+        assert res.status_code == 400, res
+
     def test_members_missing(self, client):
         res = client.get(url_for('babbage_api.members', name='cra',
                                       ref='codfss'))
@@ -0,0 +1,153 @@
+import os
+
+import pytest
+from sqlalchemy import event
+
+from babbage.cube import Cube
+from babbage.cache import ResultCache, MemoryResultCache, fingerprint
+from babbage.manager import JSONCubeManager
+from babbage.query import Cuts
+from babbage.exc import QueryException
+
+from .conftest import FIXTURE_PATH
+
+
+class TestMemoryResultCache(object):
+    def test_interface(self):
+        with pytest.raises(TypeError):
+            ResultCache()
+
+    def test_returns_copies(self):
+        cache = MemoryResultCache()
+        value = {'cells': [1, 2]}
+        cache.set(('cra', 1), value)
+        value['cells'].append(3)
+        cached = cache.get(('cra', 1))
+        assert cached == {'cells': [1, 2]}, cached
+        cached['cells'].append(4)
+        assert cache.get(('cra', 1)) == {'cells': [1, 2]}
+        assert cache.get(('cra', 2)) is None
+        stats = cache.stats()
+        assert stats['hits'] == 2, stats
+        assert stats['misses'] == 1, stats
+
+    def test_expires(self):
+        cache = MemoryResultCache(ttl=-1)
+        cache.set(('cra', 1), 'x')
+        assert cache.get(('cra', 1)) is None
+        assert cache.stats()['expirations'] == 1
+        assert cache.stats()['size'] == 0
+
+    def test_byte_limit(self):
+        cache = MemoryResultCache(max_bytes=250)
+        for i in range(5):
+            cache.set(('cra', i), 'x' * 100)
+        stats = cache.stats()
+        assert stats['size'] == 2, stats
+        assert stats['evictions'] == 3, stats
+        assert stats['bytes'] <= 250, stats
+        assert cache.get(('cra', 0)) is None
+        assert cache.get(('cra', 4)) is not None
+        cache.set(('cra', 5), 'x' * 1000)
+        assert cache.get(('cra', 5)) is None
+
+    def test_invalidate(self):
+        cache = MemoryResultCache()
+        cache.set(('cra', 1), 'x')
+        cache.set(('other', 1), 'y')
+        cache.invalidate('cra')
+        assert cache.get(('cra', 1)) is None
+        assert cache.get(('other', 1)) == 'y'
+        assert cache.stats()['bytes'] > 0
+
+
+class TestCubeCache(object):
+    def count_statements(self, engine, func):
+        statements = []
+
+        def count(*args, **kwargs):
+            statements.append(args[2])
+
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            result = func()
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        return len(statements), result
+
+    def test_fingerprint_normalises_cuts(self, cube):
+        a = fingerprint(cube, 'aggregate', {'cuts': 'cofog1:"4"|cap_or_cur:CUR'})
+        b = fingerprint(cube, 'aggregate', {'cuts': 'cap_or_cur:CUR|cofog1:"4"'})
+        c = fingerprint(cube, 'aggregate', {'cuts': 'cap_or_cur:CAP|cofog1:"4"'})
+        assert a == b
+        assert a != c
+        a = fingerprint(cube, 'facts', {'cuts': 'cofog1:"4";"10"', 'page': None})
+        b = fingerprint(cube, 'facts', {'cuts': 'cofog1:"10";"4"', 'page': '1'})
+        assert a == b
+
+    def test_aggregate_cached(self, cube, sqla_engine):
+        first = cube.aggregate(drilldowns='cofog1', cuts='cap_or_cur:CUR')
+        count, second = self.count_statements(sqla_engine, lambda: cube.aggregate(
+            drilldowns='cofog1', cuts='cap_or_cur:CUR'))
+        assert count == 0, count
+        assert first == second, (first, second)
+        assert cube.cache.stats()['hits'] == 1, cube.cache.stats()
+        count, _ = self.count_statements(sqla_engine, lambda: cube.aggregate(
+            drilldowns='cofog1', cuts='cap_or_cur:CUR', page_size=2))
+        assert count > 0, count
+
+    def test_reordered_cuts_share_entry(self, cube):
+        cuts = 'cofog1:"4";"10"|cap_or_cur:CUR'
+        first = cube.aggregate(drilldowns='cofog1', cuts=cuts)
+        second = cube.aggregate(drilldowns='cofog1',
+                                cuts='cap_or_cur:CUR|cofog1:"10";"4"')
+        assert cube.cache.stats()['hits'] == 1, cube.cache.stats()
+        assert first['cells'] == second['cells']
+        assert first['cell'][0]['ref'] == 'cofog1', first['cell']
+        assert second['cell'][0]['ref'] == 'cap_or_cur', second['cell']
+        facts = cube.facts(cuts='cap_or_cur:CUR|cofog1:"4"')
+        facts = cube.facts(cuts='cofog1:"4"|cap_or_cur:CUR')
+        assert facts['cell'] == 'cofog1:"4"|cap_or_cur:CUR', facts['cell']
+
+    def test_hit_does_not_bind(self, cube, monkeypatch):
+        first = cube.members('cofog1', cuts='cofog1:"4"')
+
+        def bind(*args, **kwargs):
+            raise AssertionError('bound on a cache hit')
+
+        monkeypatch.setattr(Cuts, 'apply', bind)
+        monkeypatch.setattr(type(cube.model['cofog1']), 'bind', bind)
+        second = cube.members('cofog1', cuts='cofog1:"4"')
+        assert first == second, (first, second)
+        assert second['cell'][0]['ref'] == 'cofog1', second['cell']
+
+    def test_members_cached(self, cube):
+        first = cube.members('cofog1', order='cofog1.label:desc')
+        second = cube.members('cofog1', order='cofog1.label:desc')
+        assert first == second
+        assert cube.cache.stats()['hits'] == 1, cube.cache.stats()
+
+    def test_invalid_query(self, cube):
+        with pytest.raises(QueryException):
+            cube.aggregate(drilldowns='cofoxxxg1')
+        with pytest.raises(QueryException):
+            cube.facts(cuts='cofog1:4')
+        with pytest.raises(QueryException):
+            cube.facts(cuts='cofog1:4')
+
+    def test_manager_invalidate(self, sqla_engine, load_fixtures):
+        cache = MemoryResultCache()
+        manager = JSONCubeManager(sqla_engine,
+                                  os.path.join(FIXTURE_PATH, 'models'),
+                                  cache=cache)
+        cube = manager.get_cube('cra')
+        assert cube.cache is cache
+        cube.facts()
+        assert cache.stats()['size'] == 1
+        manager.invalidate('cra')
+        assert cache.stats()['size'] == 0
+
+
+@pytest.fixture()
+def cube(sqla_engine, cra_model, load_fixtures):
+    return Cube(sqla_engine, 'cra', cra_model, cache=MemoryResultCache())
@@ -0,0 +1,42 @@
+import pytest
+
+from babbage.columnar import encode_column, decode_column, check_format
+from babbage.columnar import to_columns, to_rows
+from babbage.exc import QueryException
+
+
+def test_encode_column_dictionary():
+    values = ['a', 'b', 'a', None, 'a', 'b']
+    column = encode_column(values)
+    assert column['dictionary'] == ['a', 'b', None], column
+    assert column['codes'] == [0, 1, 0, 2, 0, 1], column
+    assert decode_column(column) == values
+
+
+@pytest.mark.parametrize('values', [
+    [],
+    [None],
+    [1, 1, 1, 1],
+    ['a', 'b', 'c', 'a'],
+    ['a', 'a', 1, 'a'],
+])
+def test_encode_column_plain(values):
+    assert encode_column(values) is values
+
+
+def test_to_columns():
+    rows = [{'x': 'a', 'y': 1, 'z': True}, {'x': 'a', 'y': 2, 'z': False},
+            {'x': 'a', 'y': 3, 'z': None}]
+    data = to_columns(rows, ['y', 'x'])
+    assert data['length'] == 3, data
+    assert data['refs'] == ['y', 'x', 'z'], data
+    assert data['columns']['y'] == [1, 2, 3], data
+    assert data['columns']['x']['dictionary'] == ['a'], data
+    assert to_rows(data) == rows
+
+
+def test_check_format():
+    assert check_format(None) == 'rows'
+    assert check_format('columnar') == 'columnar'
+    with pytest.raises(QueryException):
+        check_format('csv')
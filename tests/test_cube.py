@@ -1,6 +1,14 @@
+import threading
+
 import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
 
 from babbage.cube import Cube
+from babbage.cardinality import cardinality_batches
+from babbage.columnar import to_rows
+from babbage.query import generate_results, GroupingSets
+from babbage.util import query_executor
 from babbage.exc import BindingException, QueryException
 
 
@@ -155,6 +163,69 @@ class TestCube(object):
         assert max(facts, key=lambda f: f['amount']) == facts[0]
         assert min(facts, key=lambda f: f['amount']) == facts[-1]
 
+    def test_facts_export(self, cube, sqla_engine):
+        statements = []
+
+        def count(*args, **kwargs):
+            statements.append(args[2])
+
+        cube.facts(page_size=1)  # reflect the tables
+        event.listen(sqla_engine, 'before_cursor_execute', count)
+        try:
+            rows = cube.export()
+            assert not len(statements), statements
+            rows = list(rows)
+        finally:
+            event.remove(sqla_engine, 'before_cursor_execute', count)
+        assert len(statements) == 1, statements
+        assert len(rows) == 36, len(rows)
+        assert 'cofog1.name' in rows[0], rows[0]
+
+    def test_facts_export_fields_order(self, cube):
+        rows = list(cube.export(fields='cofog1,amount', order='amount:desc',
+                                cuts='cofog1:"10"'))
+        assert len(rows) == 11, len(rows)
+        assert 'amount' in rows[0], rows[0]
+        assert 'cofog2.name' not in rows[0], rows[0]
+        amounts = [r['amount'] for r in rows]
+        assert amounts == sorted(amounts, reverse=True), amounts
+
+    def test_facts_export_invalid(self, cube):
+        with pytest.raises(QueryException):
+            cube.export(fields='cofog1,schnasel')
+
+    @pytest.mark.parametrize('batch_size', [1, 7, 36, 1000])
+    def test_generate_results_batches(self, cube, batch_size):
+        q = cube.fact_table.select().order_by(cube.fact_pk)
+        expected = [dict(row.items()) for row in cube.engine.execute(q)]
+        rows = list(generate_results(cube, q, batch_size=batch_size))
+        assert rows == expected, rows
+        cube.fetch_batch_size = batch_size
+        assert cube.facts()['data'] == cube.facts(page_size=1000)['data']
+
+    def test_generate_results_tuples(self, cube):
+        q = cube.fact_table.select().order_by(cube.fact_pk)
+        rows = list(generate_results(cube, q))
+        tuples = list(generate_results(cube, q, tuples=True))
+        assert len(tuples) == 36, tuples
+        keys = q.columns.keys()
+        assert [dict(zip(keys, t)) for t in tuples] == rows
+
+    def test_generate_results_closed_early(self, cube, monkeypatch):
+        proxies = []
+        execute = cube.engine.execute
+
+        def record(*args, **kwargs):
+            proxies.append(execute(*args, **kwargs))
+            return proxies[-1]
+
+        monkeypatch.setattr(cube.engine, 'execute', record)
+        rows = generate_results(cube, cube.fact_table.select(), batch_size=1)
+        next(rows)
+        assert not proxies[0].closed
+        rows.close()
+        assert proxies[0].closed
+
     def test_members_basic(self, cube):
         members = cube.members('cofog1')
         assert members['total_member_count'] == 4, members['total_member_count']
@@ -241,6 +312,376 @@ class TestCube(object):
         assert aggs['total_cell_count'] == 4, aggs['total_cell_count']
         assert len(aggs['cells']) == 0, len(aggs['data'])
 
+    def test_aggregate_single_statement(self, cube, sqla_engine):
+        statements = []
+
+        def count(*args, **kwargs):
+            statements.append(args[2])
+
+        cube.aggregate(drilldowns='cofog2')  # reflect the tables
+        event.listen(sqla_engine, 'before_cursor_execute', count)
+        try:
+            aggs = cube.aggregate(drilldowns='cofog2', page_size=2)
+        finally:
+            event.remove(sqla_engine, 'before_cursor_execute', count)
+        assert len(statements) == 1, statements
+        expected = cube.aggregate(drilldowns='cofog2')['total_cell_count']
+        assert aggs['total_cell_count'] == expected, aggs['total_cell_count']
+        assert '_count' in aggs['summary'], aggs['summary']
+        for cell in aggs['cells']:
+            assert not any(k.startswith('__') for k in cell), cell
+
+    def test_aggregate_missing_dimension_row(self, cube, sqla_engine):
+        sqla_engine.execute('DELETE FROM cofog1 WHERE id = \'4\'')
+        cube.combine_aggregate_queries = True
+        combined = cube.aggregate(drilldowns='cofog1')
+        cube._templates.clear()
+        cube.combine_aggregate_queries = False
+        separate = cube.aggregate(drilldowns='cofog1')
+        assert combined == separate, (combined, separate)
+        assert combined['summary'] == cube.aggregate()['summary']
+        assert combined['total_cell_count'] == 3, combined
+
+    @pytest.mark.parametrize('kwargs', [
+        {},
+        {'drilldowns': 'cofog1'},
+        {'drilldowns': 'cap_or_cur|cofog1', 'order': 'amount.sum:desc'},
+        {'drilldowns': 'cofog1', 'cuts': 'cofog1:"4"'},
+        {'drilldowns': 'cofog1', 'cuts': 'cofog1:"XX"'},
+        {'drilldowns': 'cofog1', 'page_size': 2, 'page': 2},
+        {'drilldowns': 'cofog1', 'page_size': 2, 'page': 5},
+        {'drilldowns': 'cofog1', 'page_size': 0},
+        {'drilldowns': 'cofog1', 'aggregates': '_count'},
+    ])
+    def test_aggregate_combined_matches_separate(self, cube, kwargs):
+        combined = cube.aggregate(**kwargs)
+        cube.combine_aggregate_queries = False
+        separate = cube.aggregate(**kwargs)
+        assert combined == separate, (combined, separate)
+
+    def _walk(self, method, key, **kwargs):
+        cursor, rows = '', []
+        while cursor is not None:
+            result = method(cursor=cursor, **kwargs)
+            assert result['page'] is None, result
+            rows.extend(result[key])
+            assert len(rows) < 100, rows
+            cursor = result['next_cursor']
+        return rows
+
+    @pytest.mark.parametrize('kwargs', [
+        {},
+        {'order': 'amount:desc'},
+        {'order': 'cofog1.name,amount:desc', 'fields': 'cofog1,amount'},
+        {'order': 'cofog2.change_date', 'cuts': 'cap_or_cur:CUR'},
+        {'order': 'amount', 'fields': 'cofog1'},
+    ])
+    @pytest.mark.parametrize('page_size', [1, 5, 36])
+    def test_facts_keyset(self, cube, kwargs, page_size):
+        expected = cube.facts(page_size=100, **kwargs)['data']
+        rows = self._walk(cube.facts, 'data', page_size=page_size, **kwargs)
+        assert len(rows) == len(expected), rows
+        for row in expected:
+            assert row in rows, row
+        if 'order' in kwargs:
+            ref = kwargs['order'].split(',')[0].split(':')[0]
+            if ref in rows[0]:
+                assert [r[ref] for r in rows] == [r[ref] for r in expected]
+
+    def test_facts_keyset_response(self, cube):
+        facts = cube.facts(cursor='', page_size=5)
+        assert facts['total_fact_count'] == 36, facts
+        assert len(facts['data']) == 5, facts
+        assert facts['next_cursor'], facts
+        for row in facts['data']:
+            assert not any(k.startswith('__') for k in row), row
+        facts = cube.facts(cursor=facts['next_cursor'], page_size=100)
+        assert len(facts['data']) == 31, facts
+        assert facts['next_cursor'] is None, facts
+
+    def test_facts_keyset_invalid_cursor(self, cube):
+        with pytest.raises(QueryException):
+            cube.facts(cursor='lalala')
+        cursor = cube.facts(cursor='', page_size=1)['next_cursor']
+        with pytest.raises(QueryException):
+            cube.facts(cursor=cursor, order='amount')
+
+    @pytest.mark.parametrize('kwargs', [
+        {},
+        {'order': 'cofog1.label:desc'},
+        {'cuts': 'cap_or_cur:CUR'},
+    ])
+    def test_members_keyset(self, cube, kwargs):
+        expected = cube.members('cofog1', **kwargs)['data']
+        rows = self._walk(cube.members, 'data', ref='cofog1', page_size=1,
+                          **kwargs)
+        assert rows == expected, (rows, expected)
+
+    @pytest.mark.parametrize('kwargs', [
+        {'drilldowns': 'cofog1'},
+        {'drilldowns': 'cap_or_cur|cofog1', 'order': 'amount.sum:desc'},
+        {'drilldowns': 'cofog1', 'order': '_count', 'cuts': 'cap_or_cur:CUR'},
+        {},
+    ])
+    def test_aggregate_keyset(self, cube, kwargs):
+        expected = cube.aggregate(**kwargs)
+        cells = self._walk(cube.aggregate, 'cells', page_size=1, **kwargs)
+        assert cells == expected['cells'], (cells, expected['cells'])
+        aggs = cube.aggregate(cursor='', page_size=1, **kwargs)
+        assert aggs['total_cell_count'] == expected['total_cell_count']
+        assert aggs['summary'] == expected['summary']
+
+    @pytest.mark.parametrize('strategy', ['exact', 'planned', 'estimated'])
+    @pytest.mark.parametrize('kwargs', [
+        {},
+        {'cuts': 'cap_or_cur:CUR'},
+        {'drilldowns': 'cofog1'},
+        {'drilldowns': 'cofog2.change_date'},
+        {'drilldowns': 'cofog1.name', 'cuts': 'cap_or_cur:CUR'},
+        {'drilldowns': 'cofog1.name', 'cuts': 'cofog1:"XX"', 'page': 3},
+    ])
+    def test_aggregate_count_strategies(self, cube, kwargs, strategy):
+        cube.combine_aggregate_queries = False
+        expected = cube.aggregate(**kwargs)
+        aggs = cube.aggregate(count_strategy=strategy, **kwargs)
+        assert aggs == expected, (aggs, expected)
+
+    @pytest.mark.parametrize('strategy', ['exact', 'planned', 'estimated'])
+    @pytest.mark.parametrize('kwargs', [
+        {},
+        {'cuts': 'cap_or_cur:CUR'},
+        {'cuts': 'cofog1:"XX"'},
+    ])
+    def test_facts_count_strategies(self, cube, kwargs, strategy):
+        expected = cube.facts(page_size=1, **kwargs)
+        facts = cube.facts(page_size=1, count_strategy=strategy, **kwargs)
+        assert facts == expected, (facts, expected)
+
+    @pytest.mark.parametrize('strategy', ['exact', 'planned', 'estimated'])
+    @pytest.mark.parametrize('ref,kwargs', [
+        ('cofog1', {}),
+        ('cofog2.change_date', {}),
+        ('cofog1.label', {'cuts': 'cap_or_cur:CUR', 'order': 'cofog1.label'}),
+    ])
+    def test_members_count_strategies(self, cube, ref, kwargs, strategy):
+        expected = cube.members(ref, **kwargs)
+        members = cube.members(ref, count_strategy=strategy, **kwargs)
+        assert members == expected, (members, expected)
+
+    def test_count_strategy_planned_sql(self, cube, sqla_engine):
+        statements = []
+
+        def record(*args, **kwargs):
+            statements.append(args[2])
+
+        cube.members('cofog2.name')  # reflect the tables
+        event.listen(sqla_engine, 'before_cursor_execute', record)
+        try:
+            cube.members('cofog2.name', count_strategy='planned')
+            cube.facts(count_strategy='planned')
+        finally:
+            event.remove(sqla_engine, 'before_cursor_execute', record)
+        assert 'count(DISTINCT' in statements[0], statements[0]
+        assert 'FROM (' not in statements[2], statements[2]
+
+    def test_count_strategy_none(self, cube, sqla_engine):
+        assert cube.facts(count_strategy='none')['total_fact_count'] is None
+        members = cube.members('cofog1', count_strategy='none')
+        assert members['total_member_count'] is None
+        assert len(members['data']) == 4, members
+        for combined in (True, False):
+            cube.combine_aggregate_queries = combined
+            aggs = cube.aggregate(drilldowns='cofog1', count_strategy='none')
+            assert aggs['total_cell_count'] is None, aggs
+            assert aggs['summary']['_count'] == 36, aggs
+        cube.count_strategy = 'none'
+        assert cube.facts()['total_fact_count'] is None
+
+    def test_aggregate_many(self, cube):
+        queries = [
+            {'drilldowns': 'cofog1', 'cuts': 'cap_or_cur:"CUR"'},
+            {'drilldowns': 'cap_or_cur', 'page_size': 1},
+            {'aggregates': 'amount.sum', 'drilldowns': 'cofog1|cap_or_cur'},
+            {'cuts': 'cap_or_cur:"CUR"', 'drilldowns': 'cofog1'},
+            {}
+        ]
+        # Reflect the tables first.
+        cube.aggregate(drilldowns='cofog1|cap_or_cur')
+        checkouts = []
+        event.listen(cube.engine, 'checkout',
+                     lambda *a: checkouts.append(a))
+        results = cube.aggregate_many(queries)
+        assert len(checkouts) == 1, checkouts
+        assert len(results) == len(queries)
+        for query, result in zip(queries, results):
+            assert result == cube.aggregate(**query), query
+        assert results[0] is results[3]
+
+    def test_aggregate_many_invalid(self, cube):
+        with pytest.raises(QueryException):
+            cube.aggregate_many([{'drilldown': 'cofog1'}])
+        with pytest.raises(QueryException):
+            cube.aggregate_many([{'drilldowns': 'cofog99'}])
+
+    def test_aggregate_many_grouping_sets(self, cube, monkeypatch):
+        if not cube.is_postgresql:
+            # Check the statement, without running it.
+            statements = []
+            monkeypatch.setattr(Cube, 'is_postgresql', True)
+            monkeypatch.setattr('babbage.cube.generate_results',
+                                lambda c, q: statements.append(q) or [])
+            cube.aggregate_many([{'drilldowns': 'cofog1.name'},
+                                 {'drilldowns': 'cofog1.label'}])
+            assert len(statements) == 1, statements
+            sql = str(statements[0].compile(dialect=postgresql.dialect()))
+            assert 'GROUPING SETS' in sql, sql
+            return
+        cuts = 'cap_or_cur:"CUR"'
+        queries = [
+            {'drilldowns': 'cofog1', 'cuts': cuts},
+            {'drilldowns': 'cofog1.label|cap_or_cur', 'cuts': cuts},
+            {'drilldowns': 'cap_or_cur', 'cuts': cuts, 'page': 2,
+             'page_size': 1},
+            {'drilldowns': 'cofog1', 'cuts': cuts, 'page': 9},
+        ]
+        statements = []
+        event.listen(cube.engine, 'before_cursor_execute',
+                     lambda *a: statements.append(a[2]))
+        results = cube.aggregate_many(queries)
+        assert len([s for s in statements if 'GROUPING SETS' in s]) == 1
+        for query, result in zip(queries, results):
+            assert result == cube.aggregate(**query), query
+
+    def test_aggregate_many_grouping_sets_format(self, cube, monkeypatch):
+        cells = [[{'cofog1.name': '4', 'amount.sum': 1}],
+                 [{'cofog1.label': 'Health', 'amount.sum': 1}]]
+        monkeypatch.setattr(Cube, 'is_postgresql', True)
+        monkeypatch.setattr('babbage.cube.generate_results',
+                            lambda c, q: [])
+        monkeypatch.setattr(GroupingSets, 'extract',
+                            lambda s, r, a: (cells, [1, 1], {}))
+        queries = [{'drilldowns': 'cofog1.name', 'format': 'columnar'},
+                   {'drilldowns': 'cofog1.label'}]
+        for batch in (queries, list(reversed(queries))):
+            results = cube.aggregate_many(batch)
+            for query, result in zip(batch, results):
+                columnar = query.get('format') == 'columnar'
+                assert isinstance(result['cells'], dict) == columnar, \
+                    (query, result)
+
+    def test_aggregate_many_grouping_sets_summary(self, cube, monkeypatch):
+        grouped = {'_count': -1, 'amount.sum': -1, 'total.sum': -1}
+        summary = cube.aggregate()['summary']
+        monkeypatch.setattr(Cube, 'is_postgresql', True)
+        monkeypatch.setattr('babbage.cube.generate_results',
+                            lambda c, q: [])
+        monkeypatch.setattr(GroupingSets, 'extract',
+                            lambda s, r, a: ([[], []], [0, 0], grouped))
+        # The drilldowns of the first batch are on the fact table, those of
+        # the second join the table of cofog1.
+        for drilldowns, expected in ((('cofog2', 'cofog3'), grouped),
+                                     (('cofog1.name', 'cofog1.label'),
+                                      summary)):
+            results = cube.aggregate_many([{'drilldowns': d}
+                                           for d in drilldowns])
+            for result in results:
+                assert result['summary'] == expected, result
+
+    @pytest.mark.parametrize('method,kwargs', [
+        ('aggregate', {'drilldowns': 'cofog1', 'page_size': 2}),
+        ('aggregate', {'drilldowns': 'cap_or_cur', 'aggregates': '_count'}),
+        ('members', {'ref': 'cofog1', 'page_size': 3}),
+        ('facts', {'fields': 'cofog1,amount', 'page_size': 4}),
+    ])
+    def test_templates_reused(self, cube, cra_model, method, kwargs):
+        values = [('4', 1), ('6', 1), ('XX', 1), ('4', 2), ('10', 3)]
+        for value, page in values:
+            args = dict(kwargs, cuts='cofog1:"%s"' % value, page=page)
+            result = getattr(cube, method)(**args)
+            assert len(cube._templates) == 1, cube._templates.keys()
+            fresh = Cube(cube.engine, 'cra', cra_model)
+            assert result == getattr(fresh, method)(**args), args
+
+    def test_templates_shape(self, cube):
+        cube.aggregate(drilldowns='cofog1', cuts='cofog1:"4"')
+        cube.aggregate(drilldowns='cofog1', cuts='cofog1:"6"', page=2)
+        assert len(cube._templates) == 1
+        result = cube.aggregate(drilldowns='cofog1', cuts='cofog1:"4";"6"')
+        assert len(cube._templates) == 2
+        assert result['total_cell_count'] == 2, result
+        cube.aggregate(drilldowns='cofog1', order='amount.sum:desc')
+        assert len(cube._templates) == 3
+        cube.aggregate(drilldowns='cofog1', cursor='')
+        assert len(cube._templates) == 3
+
+    @pytest.mark.parametrize('method,kwargs,key', [
+        ('aggregate', {'drilldowns': 'cofog1|cap_or_cur'}, 'cells'),
+        ('aggregate', {'drilldowns': 'cofog1', 'cuts': 'cofog1:"XX"'},
+         'cells'),
+        ('facts', {'fields': 'cofog1,cap_or_cur.label,amount'}, 'data'),
+        ('facts', {'page_size': 7, 'page': 2}, 'data'),
+    ])
+    def test_columnar_format(self, cube, method, kwargs, key):
+        rows = getattr(cube, method)(**kwargs)
+        columnar = getattr(cube, method)(format='columnar', **kwargs)
+        assert to_rows(columnar.pop(key)) == rows.pop(key)
+        assert columnar == rows
+
+    def test_columnar_format_alias(self, sqla_engine, cra_model,
+                                   load_fixtures):
+        cra_model['hierarchies'] = {'func': {'levels': ['cofog1']}}
+        cube = Cube(sqla_engine, 'cra', cra_model)
+        result = cube.facts(fields='func.name,amount', format='columnar')
+        assert result['data']['refs'] == ['func.name', 'amount'], result
+        result = cube.aggregate(drilldowns='func.name', format='columnar')
+        data = result['cells']
+        assert data['refs'][0] == 'func.name', data
+        assert to_rows(data) == cube.aggregate(drilldowns='func.name')['cells']
+
+    def test_columnar_format_dictionary(self, cube):
+        result = cube.facts(fields='cap_or_cur.label', format='columnar')
+        column = result['data']['columns']['cap_or_cur.label']
+        assert len(column['dictionary']) == 2, column
+        assert len(column['codes']) == 36, column
+        with pytest.raises(QueryException):
+            cube.facts(format='xml')
+
+    @pytest.mark.parametrize('kwargs', [
+        {'drilldowns': 'cofog1|cap_or_cur'},
+        {'drilldowns': 'cofog1.label', 'aggregates': '_count',
+         'order': '_count:desc', 'cuts': 'cap_or_cur:"CUR"'},
+    ])
+    def test_export_cells(self, cube, kwargs):
+        rows = cube.export_cells(**kwargs)
+        result = cube.aggregate(**kwargs)
+        assert rows.refs == result['attributes'] + result['aggregates']
+        assert list(rows) == result['cells']
+
+    def test_export_members(self, cube):
+        rows = cube.export_members('cofog1', order='cofog1.label:desc')
+        result = cube.members('cofog1', order='cofog1.label:desc')
+        assert rows.refs == result['fields']
+        assert list(rows) == result['data']
+
+    def test_export_alias(self, sqla_engine, cra_model, load_fixtures):
+        cra_model['hierarchies'] = {'func': {'levels': ['cofog1']}}
+        cube = Cube(sqla_engine, 'cra', cra_model)
+        rows = cube.export(fields='func.name,amount')
+        assert rows.refs == ['func.name', 'amount'], rows.refs
+        row = next(rows)
+        rows.close()
+        assert sorted(row.keys()) == ['amount', 'func.name'], row
+        rows = cube.export_cells(drilldowns='func.name', aggregates='_count')
+        assert rows.refs == ['func.name', '_count'], rows.refs
+        assert all(r['func.name'] is not None for r in rows)
+        rows = cube.export_members('func.name')
+        assert rows.refs == ['func.name'], rows.refs
+        assert [r['func.name'] for r in rows] == ['10', '3', '4', '6']
+
+    def test_count_strategy_invalid(self, cube):
+        with pytest.raises(QueryException):
+            cube.facts(count_strategy='guess')
+
     def test_compute_cardinalities(self, cube):
         cofog = cube.model['cofog1']
         assert cofog.cardinality is None
@@ -250,7 +691,68 @@ class TestCube(object):
         assert cofog.cardinality_class == 'tiny', \
             (cofog.cardinality, cofog.cardinality_class)
 
+    @pytest.mark.parametrize('kwargs', [
+        {}, {'threads': 4}, {'approximate': True}
+    ])
+    def test_compute_cardinalities_members(self, cube, kwargs):
+        cardinalities = cube.compute_cardinalities(**kwargs)
+        for dimension in cube.model.dimensions:
+            members = cube.members(dimension.ref, page_size=0)
+            assert cardinalities[dimension.name] == \
+                members['total_member_count'], dimension
+            assert dimension.cardinality == cardinalities[dimension.name]
+
+    def test_compute_cardinalities_unused_member(self, cube, sqla_engine):
+        sqla_engine.execute('INSERT INTO cofog1 (id, cofog1_label) '
+                            'VALUES (\'99\', \'Unused\')')
+        members = cube.members('cofog1', page_size=0)
+        assert members['total_member_count'] == 5, members
+        cardinalities = cube.compute_cardinalities()
+        assert cardinalities['cofog1'] == 5, cardinalities
+
+    def test_compute_cardinalities_batched(self, cube):
+        batches = cardinality_batches(cube)
+        assert len(batches) == 3, batches
+        assert sum(len(b) for b in batches) == len(cube.model.dimensions)
+        cube.fact_table
+        statements = []
+        event.listen(cube.engine, 'before_cursor_execute',
+                     lambda *a: statements.append(a[2]))
+        cube.compute_cardinalities()
+        assert len(statements) == 3, statements
+
 
 @pytest.fixture()
 def cube(sqla_engine, cra_model, load_fixtures):
     return Cube(sqla_engine, 'cra', cra_model)
+
+
+@pytest.mark.parametrize('method,kwargs', [
+    ('aggregate', {}),
+    ('aggregate', {'drilldowns': 'cofog1|cap_or_cur', 'order': 'cofog1'}),
+    ('aggregate', {'drilldowns': 'cofog1', 'cuts': 'cofog1:"99"'}),
+    ('aggregate', {'drilldowns': 'cofog1', 'cursor': '', 'page_size': 2}),
+    ('facts', {'cuts': 'cofog1:"4"', 'page_size': 5}),
+    ('facts', {'fields': 'cofog1,amount', 'cursor': '', 'page_size': 5}),
+    ('members', {'ref': 'cofog1', 'page_size': 2}),
+    ('members', {'ref': 'cap_or_cur', 'cursor': ''}),
+])
+@pytest.mark.parametrize('combined', [True, False])
+def test_executor_results_identical(threaded_engine, cra_model, method,
+                                    kwargs, combined):
+    sequential = Cube(threaded_engine, 'cra', cra_model)
+    executor = query_executor(threaded_engine, 3)
+    concurrent = Cube(threaded_engine, 'cra', cra_model, executor=executor)
+    sequential.combine_aggregate_queries = combined
+    concurrent.combine_aggregate_queries = combined
+    threads = set()
+    event.listen(threaded_engine, 'before_cursor_execute',
+                 lambda *a: threads.add(threading.current_thread()))
+    try:
+        expected = getattr(sequential, method)(**kwargs)
+        threads.clear()
+        assert getattr(concurrent, method)(**kwargs) == expected
+        if method != 'aggregate' or not combined:
+            assert len(threads) > 1, threads
+    finally:
+        executor.close()
@@ -0,0 +1,134 @@
+import os
+import json
+
+import pytest
+import dateutil.parser
+
+from babbage.exc import QueryException
+from babbage.query import grammar
+from babbage.util import SCHEMA_PATH
+
+grako = pytest.importorskip('grako')
+from grako.exceptions import GrakoException  # noqa
+
+
+CORPUS = {
+    'cuts': [
+        'foo:bar', 'foo:', 'foo', ':bar', 'foo:bar|', 'foo:bar||x:1',
+        ' foo:bar', 'foo :bar', 'foo: bar', 'foo:bar baz', 'foo:1',
+        'foo:1;2', 'foo:1;', 'foo:;1', 'foo:1a', 'foo:1;a', 'foo:a;1',
+        'foo:2015-01-01', 'foo:2015-01-01;1', 'foo:1;2015-01-01',
+        'foo:2015-01-01x', 'foo:2015-1-1', 'foo:2015-01-01;2015-01-02',
+        'foo:2015-01-01 ;2015-01-02', 'foo:2015-01-01;', 'foo:2015-02-30',
+        'foo:2015-02-30;x', 'foo:"a;b"', 'foo:"a|b"|x:1', 'foo:"a\\"b"',
+        'foo:"a\\nb"', 'foo:"a\\u0041"', 'foo:"abc', 'foo:"a"b',
+        'foo:a"b"', 'foo:"a";b', 'foo:a;"b"', 'foo:a;;b', 'foo:a b',
+        'foo: 1', 'foo:1 ', 'foo:1 |x:2', 'foo:1; 2', 'foo:1 ;2',
+        'f.o_o:1', 'foo.:1', '.foo:1', 'foo..bar:1', 'foo:x:y', 'foo:1:2',
+        'foo:""', 'foo:"\\x"', 'foo:"', 'foo:12|bar:2015-01-01|baz:"q"',
+        'a:b|c', 'foo:1|', 'foo:0001', 'foo:-1', 'foo:1.5', 'foo:\t1',
+        'foo:\n', 'foo:|', '', ' ', 'foo:"a" ', 'foo:"a"|', 'foo:"a" |b:1',
+        'foo:"a" ;"b"', 'foo:"a"; "b"', 'foo:"a";', 'foo:"a";b;"c"',
+        'foo:"bar lala"', 'foo:"bar";"lala"', 'foo:3;22', 'bar:5|foo:bar',
+        'foo:2015M01', 'f oo:2015-01-04', 'cofog1:"4";"10"',
+        'cap_or_cur.label:"Current Expenditure"', 'a:1|b:1;',
+        'a:1|b:2015-02-30', 'foo:(* comment *)bar', 'foo:#x', 'foo:(*x',
+        'foo:"a\\\\"', 'foo:"\\u00e9"', 'foo:\xe9t\xe9', 'foo:1\n|b:2',
+        'foo:"a"\n;"b"', 'foo:"a"(*c*);"b"', 'x:1|(*c*)y:2', 'x:1|#c\ny:2',
+    ],
+    'drilldowns': [
+        'foo', 'foo|bar', 'foo|', '|foo', 'foo bar', 'foo.bar', 'foo.',
+        '', 'foo|foo', 'foo||bar', ' foo | bar ', 'foo,bar', 'fo-o', '._',
+        'cofog1|cap_or_cur.label',
+    ],
+    'fields': [
+        'foo', 'foo,bar', 'foo,', 'foo|bar', 'foo , bar', '',
+        'foo.bar,baz', ',foo',
+    ],
+    'aggregates': [
+        'amount.sum', 'amount.sum|_count', '_count', 'foo|', '|foo', '',
+        'amount.sum,_count',
+    ],
+    'ordering': [
+        'foo', 'foo:desc', 'foo:asc,bar', 'foo:up', 'foo:', 'foo:desc,',
+        'foo : desc', 'foo:descending', 'foo:DESC', 'foo,bar:desc',
+        'foo:asc:desc', 'foo:ascx', 'foo:asc_', 'foo:desc.', '',
+        'foo:\xe9', 'foo:desc\xe9', 'amount:desc,cofog1.name:asc',
+    ]
+}
+
+
+class Recorder(object):
+    """ The semantics originally used with the grako parser, recording each
+    rule-level result like ``babbage.query.grammar`` does. """
+
+    def __init__(self):
+        self.records = []
+
+    def string_value(self, ast):
+        text = ast[0]
+        if text.startswith('"') and text.endswith('"'):
+            return json.loads(text)
+        return text
+
+    def string_set(self, ast):
+        return tuple(self.string_value(a) for a in ast)
+
+    def int_set(self, ast):
+        return tuple(int(a) for a in ast)
+
+    def date_set(self, ast):
+        return tuple(dateutil.parser.parse(a).date() for a in ast)
+
+    def _record(self, rule, ast):
+        if isinstance(ast, list):
+            ast = tuple(ast)
+        self.records.append((rule, ast))
+        return ast
+
+    def cut(self, ast):
+        return self._record('cut', ast)
+
+    def dimension(self, ast):
+        return self._record('dimension', ast)
+
+    def field(self, ast):
+        return self._record('field', ast)
+
+    def aggregate(self, ast):
+        return self._record('aggregate', ast)
+
+    def order(self, ast):
+        return self._record('order', ast)
+
+
+@pytest.fixture(scope='module')
+def grako_model():
+    with open(os.path.join(SCHEMA_PATH, 'parser.ebnf'), 'rb') as fh:
+        return grako.genmodel('all', fh.read().decode('utf8'))
+
+
+def grako_parse(model, start, text):
+    semantics = Recorder()
+    model.parse(text, start=start, semantics=semantics)
+    return tuple(semantics.records)
+
+
+@pytest.mark.parametrize('start,text', [
+    (start, text) for start, texts in CORPUS.items() for text in texts
+])
+def test_matches_grako(grako_model, start, text):
+    try:
+        expected = grako_parse(grako_model, start, text)
+    except GrakoException as ge:
+        with pytest.raises(QueryException) as exc:
+            grammar.parse(start, text)
+        assert exc.value.message == ge.message, (exc.value.message, ge.message)
+        return
+    except Exception:
+        # grako leaks IndexError, ValueError etc. from the semantics on
+        # some malformed values; these are proper query errors now.
+        with pytest.raises(QueryException):
+            grammar.parse(start, text)
+        return
+    assert grammar.parse(start, text) == expected
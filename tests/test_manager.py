@@ -1,8 +1,16 @@
+import os
+import json
+
 import pytest
 
 from babbage.cube import Cube
+from babbage.cache import MemoryResultCache
+from babbage.manager import CachingJSONCubeManager
+from babbage.manager import ReloadingJSONCubeManager
 from babbage.exc import BabbageException
 
+from .conftest import FIXTURE_PATH
+
 
 @pytest.mark.usefixtures('load_api_fixtures')
 class TestCubeManager(object):
@@ -29,3 +37,137 @@ class TestCubeManager(object):
     def test_get_cube_doesnt_exist(self, fixtures_cube_manager):
         with pytest.raises(BabbageException):
             fixtures_cube_manager.get_cube('cro')
+
+
+class CopyModelMixin(object):
+    def copy_model(self, tmpdir, name, target=None, **changes):
+        with open(os.path.join(FIXTURE_PATH, 'models', name + '.json')) as fh:
+            model = json.load(fh)
+        model.update(changes)
+        tmpdir.join((target or name) + '.json').write(json.dumps(model))
+
+
+class TestReloadingCubeManager(CopyModelMixin):
+    def test_list_cubes(self, sqla_engine, tmpdir):
+        self.copy_model(tmpdir, 'cra')
+        manager = ReloadingJSONCubeManager(sqla_engine, str(tmpdir),
+                                           interval=0)
+        assert manager.list_cubes() == ['cra']
+        self.copy_model(tmpdir, 'cra', 'cra2')
+        assert manager.has_cube('cra2')
+        tmpdir.join('cra.json').remove()
+        assert not manager.has_cube('cra')
+        with pytest.raises(BabbageException):
+            manager.get_cube('cra')
+
+    def test_reload_changed(self, sqla_engine, tmpdir):
+        self.copy_model(tmpdir, 'cra')
+        self.copy_model(tmpdir, 'cra', 'cra2')
+        cache = MemoryResultCache()
+        manager = ReloadingJSONCubeManager(sqla_engine, str(tmpdir),
+                                           cache=cache, interval=0)
+        cube = manager.get_cube('cra')
+        other = manager.get_cube('cra2')
+        assert manager.get_cube('cra') is cube
+        cache.set(('cra', 1), 'x')
+        cache.set(('cra2', 1), 'x')
+        self.copy_model(tmpdir, 'cra', fact_table='cra_changed')
+        changed = manager.get_cube('cra')
+        assert changed is not cube
+        assert changed.model.fact_table_name == 'cra_changed'
+        assert manager.get_cube('cra2') is other
+        assert cache.get(('cra', 1)) is None
+        assert cache.get(('cra2', 1)) == 'x'
+
+    def test_invalidate_schema(self, sqla_engine, tmpdir, load_fixtures):
+        self.copy_model(tmpdir, 'cra')
+        manager = ReloadingJSONCubeManager(sqla_engine, str(tmpdir),
+                                           interval=3600)
+        cube = manager.get_cube('cra')
+        table = cube.fact_table
+        manager.invalidate_schema()
+        changed = manager.get_cube('cra')
+        assert changed is not cube
+        assert changed.fact_table is not table
+
+    def test_rate_limited(self, sqla_engine, tmpdir):
+        self.copy_model(tmpdir, 'cra')
+        manager = ReloadingJSONCubeManager(sqla_engine, str(tmpdir),
+                                           interval=3600)
+        assert manager.list_cubes() == ['cra']
+        self.copy_model(tmpdir, 'cra', 'cra2')
+        assert not manager.has_cube('cra2')
+        manager.refresh(force=True)
+        assert manager.has_cube('cra2')
+
+
+class TestBoundedCubeManager(CopyModelMixin):
+    def manager(self, sqla_engine, tmpdir, names, **kwargs):
+        for name in names:
+            self.copy_model(tmpdir, 'cra', name)
+        return CachingJSONCubeManager(sqla_engine, str(tmpdir), **kwargs)
+
+    def test_evicts_least_recently_used(self, sqla_engine, tmpdir):
+        manager = self.manager(sqla_engine, tmpdir, ['a', 'b', 'c'],
+                               maxsize=2)
+        cube = manager.get_cube('a')
+        manager.get_cube('b')
+        assert manager.get_cube('a') is cube
+        manager.get_cube('c')
+        assert manager.get_cube('a') is cube
+        stats = manager.cube_stats()
+        assert stats['resident'] == 2, stats
+        assert stats['evictions'] == 1, stats
+        assert stats['hits'] == 2, stats
+        assert stats['misses'] == 3, stats
+
+    def test_max_bytes(self, sqla_engine, tmpdir):
+        manager = self.manager(sqla_engine, tmpdir, ['a', 'b'])
+        size = manager.cube_size(manager.get_cube('a'))
+        assert size > 0
+        manager = self.manager(sqla_engine, tmpdir, ['a', 'b'],
+                               max_bytes=size * 1.5)
+        cube = manager.get_cube('a')
+        manager.get_cube('b')
+        assert manager.get_cube('a') is not cube
+        stats = manager.cube_stats()
+        assert stats['resident'] == 1, stats
+        assert stats['bytes'] == size, stats
+
+    def test_ttl(self, sqla_engine, tmpdir):
+        manager = self.manager(sqla_engine, tmpdir, ['a'], ttl=-1)
+        cube = manager.get_cube('a')
+        assert manager.get_cube('a') is not cube
+        assert manager.cube_stats()['evictions'] == 1
+
+    @pytest.mark.usefixtures('load_fixtures')
+    def test_releases_tables(self, sqla_engine, tmpdir):
+        self.copy_model(tmpdir, 'cra', 'c', fact_table='cra_other')
+        manager = self.manager(sqla_engine, tmpdir, ['a', 'b'], maxsize=2)
+        tables = manager.reflection._meta(sqla_engine).tables
+        manager.get_cube('a')
+        manager.get_cube('b')
+        manager.get_cube('c')
+        # 'b' still uses the table of the evicted 'a'
+        assert 'cra' in tables
+        manager = self.manager(sqla_engine, tmpdir, ['a'], maxsize=1)
+        tables = manager.reflection._meta(sqla_engine).tables
+        manager.get_cube('a')
+        assert 'cra' in tables
+        manager.get_cube('c')
+        assert 'cra' not in tables
+
+
+@pytest.mark.usefixtures('load_fixtures')
+class TestCardinalities(CopyModelMixin):
+    def test_save_cardinalities(self, sqla_engine, tmpdir):
+        self.copy_model(tmpdir, 'cra')
+        manager = ReloadingJSONCubeManager(sqla_engine, str(tmpdir),
+                                           interval=0)
+        cardinalities = manager.compute_cardinalities('cra')
+        assert cardinalities['cofog1'] == 4, cardinalities
+        with open(str(tmpdir.join('cra.json'))) as fh:
+            model = json.load(fh)
+        assert model['dimensions']['cofog1']['cardinality'] == 4
+        cube = manager.get_cube('cra')
+        assert cube.model['cofog1'].cardinality == 4
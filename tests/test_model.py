@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 
@@ -59,3 +61,41 @@ class TestModel(object):
         assert 'dimensions' in data
         assert 'hierarchies' in data
         assert 'foo' in data['dimensions']
+
+    def test_to_dict_memoised(self, simple_model):
+        data = simple_model.to_dict()
+        data['measures'].clear()
+        assert simple_model.to_dict()['measures'], simple_model.to_dict()
+        etag = simple_model.etag
+        assert json.loads(simple_model.to_json()) == simple_model.to_dict()
+        simple_model['foo'].spec['cardinality'] = 3
+        assert simple_model.etag == etag
+        simple_model.changed()
+        assert simple_model.etag != etag
+        assert simple_model.to_dict()['dimensions']['foo']['cardinality'] == 3
+
+    def test_deref_is_indexed(self, simple_model):
+        assert simple_model['foo'] is simple_model['foo']
+        assert simple_model['foo.key'] is simple_model['foo.key']
+        assert simple_model['amount.sum'] is simple_model['amount.sum']
+
+    def test_deref_alias(self, simple_model):
+        concept = simple_model['bazwaz.key']
+        assert concept.ref == 'baz.key', concept.ref
+        assert concept.matched_ref == 'bazwaz.key', concept.matched_ref
+        assert simple_model['baz.key'].matched_ref == 'baz.key'
+
+    def test_valid_refs(self, simple_model):
+        assert 'foo' in simple_model.drilldown_refs
+        assert 'foo.key' in simple_model.drilldown_refs
+        assert 'amount' not in simple_model.drilldown_refs
+        assert 'amount' in simple_model.field_refs
+        assert 'amount.sum' not in simple_model.field_refs
+        assert simple_model.aggregate_refs == {'_count', 'amount.sum'}
+        assert 'bazwaz.key' in simple_model.refs
+
+    def test_dimension_attributes_cached(self, simple_model):
+        foo = simple_model['foo']
+        assert foo.key_attribute is foo.key_attribute
+        assert foo.label_attribute is foo.key_attribute
+        assert foo.attributes[0] is foo.key_attribute
@@ -4,6 +4,7 @@ import pytest
 from babbage.exc import QueryException
 from babbage.cube import Cube
 from babbage.query import Cuts, Ordering, Aggregates, Drilldowns
+from babbage.query.parser import parse_cache
 
 
 class TestParser(object):
@@ -69,6 +70,20 @@ class TestParser(object):
         with pytest.raises(QueryException):
             Cuts(cube).parse('f oo:2015-01-04')
 
+    def test_cuts_empty_value(self, cube):
+        with pytest.raises(QueryException):
+            Cuts(cube).parse('foo:')
+        with pytest.raises(QueryException):
+            Cuts(cube).parse('foo:""')
+
+    def test_cuts_invalid_date(self, cube):
+        with pytest.raises(QueryException):
+            Cuts(cube).parse('foo:2015-02-30')
+
+    def test_cuts_unfinished_set(self, cube):
+        with pytest.raises(QueryException):
+            Cuts(cube).parse('foo:1;bar')
+
     def test_null_filter(self, cube):
         cuts = Cuts(cube).parse(None)
         assert isinstance(cuts, list)
@@ -105,6 +120,32 @@ class TestParser(object):
         agg = Aggregates(cube).parse('amount.sum|_count')
         assert len(agg) == 2
 
+    def test_parse_cache(self, cube):
+        parse_cache.clear()
+        first = Cuts(cube).parse('foo:bar|bar:5')
+        second = Cuts(cube).parse('foo:bar|bar:5')
+        assert first == second, (first, second)
+        stats = parse_cache.stats()
+        assert stats['hits'] == 1, stats
+        assert stats['misses'] == 1, stats
+
+    def test_parse_cache_keyed_by_rule(self, cube):
+        parse_cache.clear()
+        Drilldowns(cube).parse('foo')
+        Ordering(cube).parse('foo')
+        assert parse_cache.stats()['size'] == 2, parse_cache.stats()
+
+    def test_parse_cache_still_validates(self, cube):
+        for i in range(2):
+            with pytest.raises(QueryException):
+                Ordering(cube).parse('fooxx:desc')
+
+    def test_parse_cache_values_not_shared(self, cube):
+        cuts = Cuts(cube).parse('foo:"bar";"lala"')
+        cuts[0][2].append('mutated')
+        cuts = Cuts(cube).parse('foo:"bar";"lala"')
+        assert list(cuts[0][2]) == ['bar', 'lala'], cuts
+
 
 @pytest.fixture
 def cube(sqla_engine, simple_model):
@@ -0,0 +1,129 @@
+import pytest
+from sqlalchemy import event
+
+from babbage.cube import Cube, RollupCube
+from babbage.model import Model
+from babbage.exc import BabbageException, QueryException
+
+
+ROLLUPS = {
+    'by_cofog1': {
+        'table': 'cra_by_cofog1',
+        'dimensions': ['cofog1', 'cap_or_cur', 'cofog2'],
+        'measures': ['amount', 'total']
+    },
+    'by_cap_or_cur': {
+        'table': 'cra_by_cap_or_cur',
+        'dimensions': ['cap_or_cur'],
+        'measures': ['amount']
+    }
+}
+
+
+class TestRollup(object):
+    def test_model(self, cube):
+        rollups = cube.model.rollups
+        assert [r.name for r in rollups] == ['by_cap_or_cur', 'by_cofog1']
+        assert rollups[0].dimensions == (cube.model['cap_or_cur'],)
+        assert 'rollups' in cube.model.to_dict()
+
+    def test_model_invalid(self, cra_model):
+        cra_model['rollups'] = {'x': {'table': 'x', 'dimensions': ['amount'],
+                                      'measures': []}}
+        with pytest.raises(BabbageException):
+            Model(cra_model)
+
+    def test_covers(self, cube):
+        rollup = cube.model.rollups[0]
+        assert rollup.covers(['cap_or_cur.label'], ['amount.sum', '_count'])
+        assert not rollup.covers(['cofog1'], ['amount.sum'])
+        assert not rollup.covers([], ['total.sum'])
+        assert not rollup.covers(['amount'], [])
+
+    def test_build(self, cube, sqla_engine):
+        assert sqla_engine.has_table('cra_by_cofog1')
+        rows = list(sqla_engine.execute('SELECT * FROM cra_by_cap_or_cur'))
+        assert len(rows) == 2, rows
+        assert sum(r['_fact_count'] for r in rows) == 36, rows
+
+    def test_navigate(self, cube):
+        rollup = cube.navigate(drilldowns='cap_or_cur',
+                               aggregates='amount.sum')
+        assert isinstance(rollup, RollupCube), rollup
+        assert rollup.rollup.name == 'by_cap_or_cur'
+        rollup = cube.navigate(drilldowns='cofog1', cuts='cap_or_cur:CUR',
+                               order='_count:desc')
+        assert rollup.rollup.name == 'by_cofog1'
+        assert cube.navigate(drilldowns='cofog3') is None
+        assert cube.navigate(drilldowns='cap_or_cur',
+                             aggregates='amount.sum',
+                             order='cofog3.name') is None
+        rollup = cube.navigate(drilldowns='cap_or_cur',
+                               aggregates='amount.sum',
+                               order='total.sum')
+        assert rollup.rollup.name == 'by_cofog1'
+        cube.use_rollups = False
+        assert cube.navigate(drilldowns='cap_or_cur') is None
+
+    def test_navigate_missing_table(self, cube, sqla_engine):
+        sqla_engine.execute('DROP TABLE cra_by_cap_or_cur')
+        cube = Cube(sqla_engine, 'cra', cube.model)
+        rollup = cube.navigate(drilldowns='cap_or_cur',
+                               aggregates='amount.sum')
+        assert rollup.rollup.name == 'by_cofog1'
+
+    def test_aggregate_uses_rollup(self, cube, sqla_engine):
+        statements = []
+
+        def record(*args, **kwargs):
+            statements.append(args[2])
+
+        # reflect the tables
+        cube.aggregate(drilldowns='cap_or_cur', aggregates='amount.sum')
+        event.listen(sqla_engine, 'before_cursor_execute', record)
+        try:
+            cube.aggregate(drilldowns='cap_or_cur', aggregates='amount.sum')
+        finally:
+            event.remove(sqla_engine, 'before_cursor_execute', record)
+        statements = [s for s in statements if s.startswith('SELECT')]
+        assert len(statements), statements
+        for statement in statements:
+            assert 'cra_by_cap_or_cur' in statement, statement
+
+    @pytest.mark.parametrize('kwargs', [
+        {'drilldowns': 'cap_or_cur', 'aggregates': 'amount.sum|_count'},
+        {'drilldowns': 'cofog1', 'aggregates': 'amount.sum|total.sum'},
+        {'drilldowns': 'cofog1|cofog2', 'aggregates': '_count',
+         'order': '_count:desc'},
+        {'drilldowns': 'cofog1.label', 'aggregates': 'amount.sum',
+         'cuts': 'cap_or_cur.label:"Current Expenditure"'},
+        {'drilldowns': 'cofog2', 'aggregates': 'amount.sum',
+         'cuts': 'cofog1:"10";"4"', 'order': 'amount.sum:desc',
+         'page_size': 2, 'page': 2},
+        {'drilldowns': 'cofog1', 'aggregates': 'amount.sum',
+         'page_size': 2, 'cursor': ''},
+        {'aggregates': 'amount.sum|_count'},
+        {'aggregates': 'amount.sum', 'cuts': 'cofog1:"XX"'},
+        {'drilldowns': 'cofog1', 'aggregates': 'amount.sum',
+         'page_size': 0},
+    ])
+    def test_aggregate_matches_fact_table(self, cube, kwargs):
+        assert cube.navigate(**dict((k, v) for k, v in kwargs.items()
+                                    if k in ('aggregates', 'drilldowns',
+                                             'cuts', 'order')))
+        rolled_up = cube.aggregate(**kwargs)
+        cube.use_rollups = False
+        expected = cube.aggregate(**kwargs)
+        assert rolled_up == expected, (rolled_up, expected)
+
+    def test_aggregate_invalid(self, cube):
+        with pytest.raises(QueryException):
+            cube.aggregate(drilldowns='cofoxxxg1')
+
+
+@pytest.fixture()
+def cube(sqla_engine, cra_model, load_fixtures):
+    cra_model['rollups'] = ROLLUPS
+    cube = Cube(sqla_engine, 'cra', cra_model)
+    cube.build_rollups()
+    return cube
@@ -0,0 +1,115 @@
+import json
+import hashlib
+import logging
+
+import pytest
+from flask import url_for
+
+from babbage.cube import Cube
+from babbage.slowlog import SlowQueryLog, SlowQuerySink, FileSink
+from babbage.slowlog import LoggingSink
+
+
+class FailingSink(SlowQuerySink):
+    def write(self, entry):
+        raise ValueError(entry)
+
+
+@pytest.fixture()
+def make_cube(sqla_engine, cra_model, load_fixtures):
+    def make_cube(slow_log):
+        return Cube(sqla_engine, 'cra', cra_model, slow_log=slow_log)
+    return make_cube
+
+
+class TestSlowQueryLog(object):
+    def test_records(self, make_cube):
+        slow_log = SlowQueryLog(threshold=0)
+        cube = make_cube(slow_log)
+        cube.facts(cuts='cofog1:"4"', page_size=5)
+        entries = slow_log.entries()
+        assert len(entries) == 2, entries
+        fingerprint = Cube.facts.fingerprint(cube, cuts='cofog1:"4"',
+                                             page_size=5)
+        digest = hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest()
+        for entry in entries:
+            assert entry['cube'] == 'cra', entry
+            assert entry['query'] == 'facts', entry
+            assert entry['fingerprint'] == digest, entry
+            assert entry['duration'] >= 0, entry
+            assert entry['sql'].startswith('SELECT'), entry
+            assert '4' in entry['params'].values(), entry
+            assert 'plan' not in entry
+        assert sorted(e['rows'] for e in entries) == [1, 5], entries
+        json.dumps(entries, default=str)
+
+    def test_sink_interface(self):
+        with pytest.raises(TypeError):
+            SlowQuerySink()
+
+    def test_threshold(self, make_cube):
+        slow_log = SlowQueryLog(threshold=60)
+        cube = make_cube(slow_log)
+        cube.aggregate(drilldowns='cofog1')
+        assert slow_log.entries() == []
+
+    def test_ring_buffer(self, make_cube):
+        slow_log = SlowQueryLog(threshold=0, size=3)
+        cube = make_cube(slow_log)
+        for cofog1 in ('4', '6', '10'):
+            cube.members('cofog1', cuts='cofog1:"%s"' % cofog1)
+        entries = slow_log.entries()
+        assert len(entries) == 3, entries
+        assert '10' in entries[0]['params'].values(), entries[0]
+        assert slow_log.entries('other') == []
+        slow_log.clear()
+        assert slow_log.entries('cra') == []
+
+    def test_explain(self, make_cube):
+        slow_log = SlowQueryLog(threshold=0, explain=True)
+        cube = make_cube(slow_log)
+        cube.aggregate(drilldowns='cofog1', cuts='cap_or_cur:CAP')
+        for entry in slow_log.entries():
+            assert isinstance(entry['plan'], list), entry
+            assert len(entry['plan']), entry
+
+    def test_sinks(self, make_cube, tmpdir, caplog):
+        path = str(tmpdir.join('slow.log'))
+        logger = logging.getLogger('test_slowlog')
+        slow_log = SlowQueryLog(threshold=0, sinks=[
+            FailingSink(), FileSink(path), LoggingSink(logger)])
+        cube = make_cube(slow_log)
+        with caplog.at_level(logging.WARNING, logger='test_slowlog'):
+            cube.aggregate(drilldowns='cofog1', page_size=2)
+        entries = slow_log.entries()
+        with open(path) as fh:
+            lines = [json.loads(line) for line in fh]
+        assert [e['sql'] for e in lines] == \
+            [e['sql'] for e in reversed(entries)], lines
+        records = [r for r in caplog.records if r.name == 'test_slowlog']
+        assert len(records) == len(entries), records
+        assert records[0].slow_query['cube'] == 'cra'
+
+
+@pytest.mark.usefixtures('load_api_fixtures', 'load_fixtures')
+class TestSlowQueryEndpoint(object):
+    def test_disabled(self, app, client, fixtures_cube_manager):
+        fixtures_cube_manager.slow_log = SlowQueryLog(threshold=0)
+        res = client.get(url_for('babbage_api.slow_queries'))
+        assert res.status_code == 404, res
+
+    def test_entries(self, app, client, fixtures_cube_manager):
+        app.config['BABBAGE_ADMIN_ENDPOINTS'] = True
+        res = client.get(url_for('babbage_api.slow_queries'))
+        assert res.status_code == 404, res
+        fixtures_cube_manager.slow_log = SlowQueryLog(threshold=0)
+        res = client.get(url_for('babbage_api.aggregate', name='cra',
+                                 drilldown='cofog1'))
+        assert res.status_code == 200, res
+        res = client.get(url_for('babbage_api.slow_queries', cube='cra'))
+        assert res.status_code == 200, res
+        assert res.json['total'] > 0, res.json
+        assert res.json['data'][0]['query'] == 'aggregate', res.json
+        assert res.headers['Cache-Control'] == 'no-store'
+        res = client.get(url_for('babbage_api.slow_queries', cube='xx'))
+        assert res.json['total'] == 0, res.json
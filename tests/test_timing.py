@@ -0,0 +1,97 @@
+import pytest
+from flask import url_for
+
+from babbage import timing
+from babbage.cube import Cube
+from babbage.exc import QueryException
+
+from .test_rollup import ROLLUPS
+
+
+class TestTimings(object):
+    def test_nested_phases(self):
+        timings = timing.start()
+        try:
+            with timing.phase('execute'):
+                with timing.phase('fetch'):
+                    pass
+                with timing.phase('fetch'):
+                    pass
+        finally:
+            assert timing.stop() is timings
+        assert timings.counts['execute'] == 1, timings.counts
+        assert timings.counts['fetch'] == 2, timings.counts
+        assert timings.durations['execute'] >= 0
+        assert timings.total >= sum(timings.durations.values())
+        header = timings.server_timing()
+        assert header.startswith('execute;dur='), header
+        assert 'parse' not in header, header
+        assert 'total;dur=' in header, header
+
+    def test_inactive(self):
+        assert timing.current() is None
+        assert timing.phase('parse') is timing._NO_PHASE
+        assert timing.stop() is None
+
+
+@pytest.fixture()
+def events():
+    events = []
+
+    def hook(event, name, fingerprint, timings):
+        events.append((event, name, fingerprint, dict(timings.counts)))
+
+    timing.add_hook(hook)
+    yield events
+    timing.remove_hook(hook)
+
+
+class TestHooks(object):
+    def test_aggregate(self, sqla_engine, cra_model, load_fixtures, events):
+        cube = Cube(sqla_engine, 'cra', cra_model)
+        cube.aggregate(drilldowns='cofog1', cuts='cap_or_cur:CAP')
+        assert [e[0] for e in events] == ['start', 'end'], events
+        fingerprint = Cube.aggregate.fingerprint(
+            cube, drilldowns='cofog1', cuts='cap_or_cur:CAP')
+        assert events[0][1:3] == ('cra', fingerprint), events
+        counts = events[1][3]
+        for phase in ('parse', 'bind', 'compile', 'execute', 'fetch'):
+            assert counts[phase] > 0, (phase, counts)
+        assert timing.current() is None
+
+    def test_rollup_reported_once(self, sqla_engine, cra_model,
+                                  load_fixtures, events):
+        cra_model['rollups'] = ROLLUPS
+        cube = Cube(sqla_engine, 'cra', cra_model)
+        cube.build_rollups()
+        cube.aggregate(drilldowns='cap_or_cur')
+        assert [(e[0], e[1]) for e in events] == \
+            [('start', 'cra'), ('end', 'cra')], events
+
+    def test_failure(self, sqla_engine, cra_model, load_fixtures, events):
+        cube = Cube(sqla_engine, 'cra', cra_model)
+        with pytest.raises(QueryException):
+            cube.facts(cursor='garbage')
+        assert [e[0] for e in events] == ['start', 'end'], events
+        assert timing.current() is None
+
+
+class TestServerTiming(object):
+    @pytest.fixture()
+    def api(self, app, load_api_fixtures, load_fixtures):
+        return app
+
+    def test_header(self, api, client):
+        api.config['BABBAGE_SERVER_TIMING'] = True
+        res = client.get(url_for('babbage_api.aggregate', name='cra',
+                                 drilldown='cofog1'))
+        assert res.status_code == 200, res
+        header = res.headers['Server-Timing']
+        for phase in ('parse', 'execute', 'encode', 'total'):
+            assert phase + ';dur=' in header, header
+        assert timing.current() is None
+
+    def test_disabled(self, api, client):
+        res = client.get(url_for('babbage_api.model', name='cra'))
+        assert res.status_code == 200, res
+        assert 'Server-Timing' not in res.headers
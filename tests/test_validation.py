@@ -1,7 +1,10 @@
+import json
+
 import pytest
 from jsonschema import ValidationError
 
-from babbage.validation import validate_model
+from babbage.validation import validate_model, get_validator, model_errors
+from babbage.validation import validate_directory, main
 
 
 class TestValidation(object):
@@ -85,3 +88,86 @@ class TestValidation(object):
             model = simple_model_data
             model['dimensions']['foo']['label_attribute'] = 'lala'
             validate_model(model)
+
+    def test_rollup(self, simple_model_data):
+        model = simple_model_data
+        model['rollups'] = {'by_foo': {'table': 'simple_by_foo',
+                                       'dimensions': ['foo'],
+                                       'measures': ['amount']}}
+        validate_model(model)
+
+    def test_rollup_invalid_dimension(self, simple_model_data):
+        with pytest.raises(ValidationError):
+            model = simple_model_data
+            model['rollups'] = {'by_foo': {'table': 'simple_by_foo',
+                                           'dimensions': ['lala'],
+                                           'measures': ['amount']}}
+            validate_model(model)
+
+    def test_rollup_invalid_measure(self, simple_model_data):
+        with pytest.raises(ValidationError):
+            model = simple_model_data
+            model['rollups'] = {'by_foo': {'table': 'simple_by_foo',
+                                           'dimensions': ['foo'],
+                                           'measures': ['foo']}}
+            validate_model(model)
+
+    def test_validator_cached(self):
+        assert get_validator('model.json') is get_validator('model.json')
+
+    def test_model_errors(self, simple_model_data):
+        assert model_errors(simple_model_data) == []
+        model = simple_model_data
+        model['fact_table'] = 'b....'
+        model['measures']['amount'] = {}
+        errors = model_errors(model)
+        assert len(errors) == 3, errors
+        assert errors[0].startswith('fact_table: '), errors
+        assert errors[1].startswith('measures.amount: '), errors
+        assert errors[2].startswith('measures.amount: '), errors
+
+
+class TestBulkValidation(object):
+
+    def _write(self, directory, name, model):
+        with open(str(directory.join(name)), 'w') as fh:
+            fh.write(model if isinstance(model, str) else json.dumps(model))
+
+    def test_validate_directory(self, tmpdir, cra_model):
+        self._write(tmpdir, 'cra.json', cra_model)
+        self._write(tmpdir, 'broken.json', '{"fact_table":')
+        del cra_model['measures']
+        self._write(tmpdir, 'no_measures.json', cra_model)
+        self._write(tmpdir, 'notes.txt', 'not a model')
+        results = validate_directory(str(tmpdir), processes=2)
+        assert sorted(results) == ['broken', 'cra', 'no_measures'], results
+        assert results['cra'] == [], results
+        assert results['broken'][0].startswith('Cannot load'), results
+        assert len(results['no_measures']) == 1, results
+        assert validate_directory(str(tmpdir), processes=1) == results
+
+    def test_binding_errors(self, tmpdir, threaded_engine, cra_model):
+        url = str(threaded_engine.url)
+        self._write(tmpdir, 'cra.json', cra_model)
+        cra_model['measures']['amount']['column'] = 'lala'
+        cra_model['dimensions']['cofog1']['join_column'] = 'lala'
+        self._write(tmpdir, 'bad_columns.json', cra_model)
+        cra_model['fact_table'] = 'lala'
+        self._write(tmpdir, 'bad_table.json', cra_model)
+        results = validate_directory(str(tmpdir), database_url=url,
+                                     processes=2)
+        assert results['cra'] == [], results
+        errors = results['bad_columns']
+        assert len(errors) == 2, errors
+        assert errors[0].startswith('amount: '), errors
+        assert errors[1].startswith('cofog1: '), errors
+        assert results['bad_table'] == ["Table does not exist: 'lala'"]
+
+    def test_main(self, tmpdir, cra_model, capsys):
+        self._write(tmpdir, 'cra.json', cra_model)
+        assert main([str(tmpdir), '--processes', '1']) == 0
+        self._write(tmpdir, 'broken.json', '[')
+        assert main([str(tmpdir), '--processes', '1']) == 1
+        out = capsys.readouterr()[0]
+        assert 'broken: Cannot load model' in out, out
+        assert '1 of 2 models invalid' in out, out